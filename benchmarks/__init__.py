@@ -0,0 +1,7 @@
+# Load the appropriate libraries on the Python path
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'])
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'] + '/lib/yaml/lib')
+sys.path.insert(1, os.path.abspath('lib'))
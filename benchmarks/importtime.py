@@ -0,0 +1,89 @@
+"""
+Report the time spent importing the modules of an application entry point.
+
+Python 2.7 has no "-X importtime" option so the builtin __import__ function is wrapped instead. The report follows the
+same format: self and cumulative times in microseconds, nested imports being indented under their parent.
+
+Usage:
+    python -m benchmarks.importtime worker
+    python -m benchmarks.importtime sync_app --total
+"""
+import __builtin__
+import argparse
+import importlib
+import sys
+import time
+
+
+class ImportTimer:
+    """
+    Record the self and cumulative import time of every module loaded while started.
+    """
+
+    def __init__(self):
+        self.records = []  # (depth, self time, cumulative time, module name) in completion order
+        self._children_times = []  # Cumulative time of the nested imports for each import in progress
+        self._original_import = None
+        self._seen = set()  # Modules already accounted for
+
+    def start(self):
+        self._seen.update(sys.modules)
+        self._original_import = __builtin__.__import__
+        __builtin__.__import__ = self._import
+
+    def stop(self):
+        __builtin__.__import__ = self._original_import
+
+    def _import(self, name, globals=None, locals=None, fromlist=None, level=-1):
+        modules_before = len(sys.modules)
+        self._children_times.append(0)
+        start = time.time()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative_time = time.time() - start
+            children_time = self._children_times.pop()
+            if len(sys.modules) > modules_before:  # Cached imports are accounted in their parent self time
+                new_modules = [module_name for module_name in sys.modules
+                               if sys.modules[module_name] is not None and module_name not in self._seen]
+                self._seen.update(new_modules)
+                # A single statement may load several packages: report the requested one (even if relative)
+                module_name = next((m for m in new_modules if m == name or m.endswith('.' + name)), name)
+                self.records.append((len(self._children_times), cumulative_time - children_time, cumulative_time,
+                                     module_name))
+                if self._children_times:
+                    self._children_times[-1] += cumulative_time
+
+    def report(self, out=sys.stdout):
+        """
+        Print the recorded import times.
+        :param out: The stream to print to
+        """
+        out.write('import time: self [us] | cumulative | imported package\n')
+        for depth, self_time, cumulative_time, module_name in self.records:
+            out.write('import time: %9d | %10d | %s%s\n' % (self_time * 1e6, cumulative_time * 1e6, '  ' * depth,
+                                                             module_name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the import time of an application entry point.')
+    parser.add_argument('entry_point', help='the module to import, e.g. "sync_app" or "worker"')
+    parser.add_argument('--total', action='store_true', help='only print the total import time in microseconds')
+    args = parser.parse_args()
+
+    timer = ImportTimer()
+    timer.start()
+    start = time.time()
+    try:
+        importlib.import_module(args.entry_point)
+    finally:
+        timer.stop()
+    total_time = time.time() - start
+
+    if not args.total:
+        timer.report()
+    print '%d' % (total_time * 1e6)
+
+
+if __name__ == '__main__':
+    main()
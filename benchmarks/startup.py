@@ -0,0 +1,69 @@
+"""
+Measure the cold-start time of each application entry point.
+
+Each run imports the entry point in a fresh interpreter, as a new App Engine instance would before serving its first
+request.
+
+Usage:
+    python -m benchmarks.startup [--runs 10] [--output startup.json]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from .util import percentile, write_results
+
+ENTRY_POINTS = ['sync_app', 'worker']
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def measure(entry_point):
+    """
+    Import an entry point in a new interpreter.
+    :param entry_point: The entry point module name
+    :return: The import time and the whole process time in milliseconds
+    """
+    start = time.time()
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.importtime', '--total', entry_point],
+                                     cwd=ROOT_DIR)
+    process_time = time.time() - start
+    import_time = int(output.strip().splitlines()[-1]) / 1e3
+    return import_time, process_time * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold-start time of each application entry point.')
+    parser.add_argument('--runs', type=int, default=10, help='number of runs per entry point')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    results = {}
+    print '%-10s %12s %12s %12s %12s' % ('entry', 'import p50', 'import p95', 'import min', 'process p50')
+    for entry_point in ENTRY_POINTS:
+        import_times = []
+        process_times = []
+        for _ in range(args.runs):
+            import_time, process_time = measure(entry_point)
+            import_times.append(import_time)
+            process_times.append(process_time)
+        results[entry_point] = {
+            'runs': args.runs,
+            'import_ms_p50': percentile(import_times, 50),
+            'import_ms_p95': percentile(import_times, 95),
+            'import_ms_min': min(import_times),
+            'process_ms_p50': percentile(process_times, 50)
+        }
+        print '%-10s %12.1f %12.1f %12.1f %12.1f' % (entry_point, results[entry_point]['import_ms_p50'],
+                                                     results[entry_point]['import_ms_p95'],
+                                                     results[entry_point]['import_ms_min'],
+                                                     results[entry_point]['process_ms_p50'])
+
+    if args.output:
+        write_results(args.output, 'startup', results)
+
+
+if __name__ == '__main__':
+    main()
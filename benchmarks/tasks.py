@@ -0,0 +1,197 @@
+"""
+Measure the cost of every synchronization task against the local stub servers.
+
+Each run executes one task in a fresh application context, as the worker does for each queued task, and records the
+calls made per endpoint, the bytes transferred, the wall time and the CPU time spent in the task thread.
+
+Usage:
+    python -m benchmarks.tasks [--runs 20] [--latency 0] [--task create_or_update_person_in_pipedrive]
+                               [--output tasks.json]
+"""
+import argparse
+import logging
+import resource
+import time
+from collections import defaultdict
+
+from google.appengine.ext import ndb, testbed
+
+from tests.stub_server import StubBackends
+from .util import percentile, write_results
+
+import sync
+from sync import slack, tasks
+from sync.metrics import task_status
+
+# Linux value, the constant is not exposed by Python 2
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', 1)
+
+
+def _new_lead(backends):
+    return backends.marketo.generate('lead', 1)[0]['id']
+
+
+def _new_person(backends):
+    return backends.pipedrive.generate('person', 1)[0]['id']
+
+
+def _new_organization(backends):
+    return backends.pipedrive.generate('organization', 1, marketoid=None)[0]['id']
+
+
+def _new_company(backends):
+    return backends.marketo.generate('company', 1)[0]['externalCompanyId']
+
+
+def _new_lead_with_emails(backends):
+    lead_id = _new_lead(backends)
+    backends.marketo.generate_activities([lead_id], 'Send Email', 3)
+    return lead_id
+
+
+def _deal_with_notes(backends):
+    backends.pipedrive.generate_notes(20, 1)
+    return 20
+
+
+def _queued_slack_message(backends):
+    return slack.send_message({'text': 'Benchmark message'})[0]
+
+
+# (task name, variant, function returning the task argument from the stub backends)
+SCENARIOS = [
+    ('create_or_update_person_in_pipedrive', 'new', _new_lead),
+    ('create_or_update_person_in_pipedrive', 'linked', lambda backends: 20),
+    ('delete_person_in_pipedrive', 'existing', _new_person),
+    ('create_or_update_organization_in_pipedrive', 'new', _new_company),
+    ('create_or_update_organization_in_pipedrive', 'linked', lambda backends: 'pd-organization-20'),
+    ('create_or_update_lead_in_marketo', 'new', _new_person),
+    ('create_or_update_lead_in_marketo', 'linked', lambda backends: 20),
+    ('create_or_update_company_in_marketo', 'new', _new_organization),
+    ('create_or_update_company_in_marketo', 'linked', lambda backends: 20),
+    ('delete_lead_in_marketo', 'existing', _new_lead),
+    ('create_or_update_opportunity_in_marketo', 'linked', lambda backends: 20),
+    ('create_activity_in_pipedrive', 'existing', lambda backends: 20),
+    ('create_activity_in_pipedrive_for_email_sent', 'three_emails', _new_lead_with_emails),
+    ('compute_organization_in_pipedrive', 'existing', lambda backends: 20),
+    ('notify_deal_in_slack_for_status', 'existing', _deal_with_notes),
+    ('notify_deal_in_slack_for_note', 'existing', _deal_with_notes),
+    ('send_slack_message', 'queued', _queued_slack_message),
+]
+
+
+def thread_cpu_time():
+    """
+    Return the CPU time in seconds used by the current thread, leaving out the stub servers threads.
+    """
+    try:
+        usage = resource.getrusage(RUSAGE_THREAD)
+    except (ValueError, resource.error):  # Not supported, fall back to the whole process
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_task(backends, task_name, argument):
+    """
+    Run a task once in a new application context.
+    :param backends: The stub backends
+    :param task_name: The task name
+    :param argument: The task argument
+    :return: The task response, the wall time and CPU time in milliseconds and the calls per endpoint
+    """
+    backends.reset_stats()
+    with sync.app.app_context():
+        start_cpu = thread_cpu_time()
+        start = time.time()
+        response = getattr(tasks, task_name)(argument)
+        wall_time = time.time() - start
+        cpu_time = thread_cpu_time() - start_cpu
+    ndb.get_context().clear_cache()
+    return response, wall_time * 1e3, cpu_time * 1e3, backends.calls()
+
+
+def benchmark(backends, task_name, get_argument, runs):
+    """
+    Run a task scenario several times and aggregate the measures.
+    :param backends: The stub backends
+    :param task_name: The task name
+    :param get_argument: The function returning a task argument for each run
+    :param runs: The number of runs
+    :return: The scenario results
+    """
+    wall_times = []
+    cpu_times = []
+    statuses = defaultdict(int)
+    calls = defaultdict(lambda: defaultdict(int))
+    for _ in range(runs):
+        argument = get_argument(backends)
+        response, wall_time, cpu_time, run_calls = run_task(backends, task_name, argument)
+        wall_times.append(wall_time)
+        cpu_times.append(cpu_time)
+        statuses[task_status(response)] += 1
+        for endpoint, stats in run_calls.items():
+            for key, value in stats.items():
+                calls[endpoint][key] += value
+
+    return {
+        'runs': runs,
+        'statuses': dict(statuses),
+        'latency_ms_p50': percentile(wall_times, 50),
+        'latency_ms_p95': percentile(wall_times, 95),
+        'cpu_ms_p50': percentile(cpu_times, 50),
+        'cpu_ms_p95': percentile(cpu_times, 95),
+        'calls_per_run': sum(stats['count'] for stats in calls.values()) / float(runs),
+        'bytes_in_per_run': sum(stats['bytes_in'] for stats in calls.values()) / float(runs),
+        'bytes_out_per_run': sum(stats['bytes_out'] for stats in calls.values()) / float(runs),
+        'calls': dict((endpoint, dict((key, value / float(runs)) for key, value in stats.items()))
+                      for endpoint, stats in calls.items())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cost of every synchronization task.')
+    parser.add_argument('--runs', type=int, default=20, help='number of runs per scenario')
+    parser.add_argument('--latency', type=float, default=0, help='stub servers latency in seconds')
+    parser.add_argument('--task', action='append', help='only run the scenarios of this task (repeatable)')
+    parser.add_argument('--calls', action='store_true', help='print the calls per endpoint of each scenario')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--verbose', action='store_true', help='print the application logs')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub()
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=sync.app.root_path + '/..')
+
+    results = {}
+    with StubBackends(latency=args.latency, seed=0) as backends:
+        sync.app.config.update(backends.app_config())
+        print '%-60s %8s %8s %8s %8s %8s %10s' % ('scenario', 'calls', 'p50 ms', 'p95 ms', 'cpu p50', 'cpu p95',
+                                                  'bytes')
+        for task_name, variant, get_argument in SCENARIOS:
+            if args.task and task_name not in args.task:
+                continue
+            scenario = '%s[%s]' % (task_name, variant)
+            result = benchmark(backends, task_name, get_argument, args.runs)
+            results[scenario] = result
+            print '%-60s %8.1f %8.1f %8.1f %8.1f %8.1f %10d' % (scenario, result['calls_per_run'],
+                                                               result['latency_ms_p50'], result['latency_ms_p95'],
+                                                               result['cpu_ms_p50'], result['cpu_ms_p95'],
+                                                               result['bytes_in_per_run'] +
+                                                               result['bytes_out_per_run'])
+            if args.calls:
+                for endpoint, stats in sorted(result['calls'].items()):
+                    print '    %-56s %8.1f' % (endpoint, stats['count'])
+
+    bed.deactivate()
+
+    if args.output:
+        write_results(args.output, 'tasks', results)
+
+
+if __name__ == '__main__':
+    main()
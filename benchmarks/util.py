@@ -0,0 +1,55 @@
+import json
+import math
+import platform
+import subprocess
+import time
+
+
+def percentile(values, percent):
+    """
+    Return the percentile of a list of values using the nearest-rank method.
+    >>> percentile([1, 2, 3, 4], 50)
+    2
+    >>> percentile([3, 1, 2], 95)
+    3
+    >>> percentile([], 50)
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def git_commit():
+    """
+    Return the current commit hash of the repository if any.
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, benchmark, results):
+    """
+    Dump benchmark results to a JSON file tagged with the commit they were measured at.
+    :param path: The file path
+    :param benchmark: The benchmark name
+    :param results: The benchmark results
+    """
+    data = {
+        'benchmark': benchmark,
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'results': results
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -1,3 +1,4 @@
 from sync import app
+import sync.views
 
 app.run(debug=True)
@@ -3,8 +3,6 @@ import os
 
 from flask import Flask, jsonify, g
 
-import marketo
-import pipedrive
 from .util import InvalidUsage
 
 app = Flask(__name__, instance_relative_config=True)
@@ -23,13 +21,52 @@ def handle_authentication_error(error):
 
 def create_marketo_client():
     """Create the Marketo client."""
+    import marketo  # Imported on first use to keep instance startup fast
+    from .common.ratelimit import get_rate_limiter
+    rate_limiter = None
+    if app.config.get('MKTO_RATE_LIMIT'):
+        rate_limiter = get_rate_limiter('marketo', lambda: marketo.MarketoRateLimiter(app.config['MKTO_RATE_LIMIT'],
+                                                                                      app.config['MKTO_RATE_WINDOW']))
+        rate_limiter = get_task_rate_limiter(rate_limiter)
     return marketo.MarketoClient(app.config['IDENTITY_ENDPOINT'], app.config['CLIENT_ID'],
-                                 app.config['CLIENT_SECRET'], app.config['API_ENDPOINT'])
+                                 app.config['CLIENT_SECRET'], app.config['API_ENDPOINT'], get_call_tracer(),
+                                 rate_limiter, get_backend_retry_policy('marketo', 'MKTO_MAX_RETRIES'))
 
 
 def create_pipedrive_client():
     """Create the Pipedrive client."""
-    return pipedrive.PipedriveClient(app.config['PD_API_TOKEN'])
+    import pipedrive
+    from .common.ratelimit import RateLimiter, get_rate_limiter
+    rate_limiter = None
+    if app.config.get('PD_RATE_LIMIT'):
+        rate_limiter = get_rate_limiter('pipedrive', lambda: RateLimiter(app.config['PD_RATE_LIMIT'],
+                                                                         app.config['PD_RATE_WINDOW']))
+        rate_limiter = get_task_rate_limiter(rate_limiter)
+    return pipedrive.PipedriveClient(app.config['PD_API_TOKEN'], app.config.get('PD_API_ENDPOINT'), get_call_tracer(),
+                                     rate_limiter, get_backend_retry_policy('pipedrive', 'PD_MAX_RETRIES'))
+
+
+def get_task_rate_limiter(rate_limiter):
+    """Return the rate limiter of the calls of the current task, low priority for the bulk tasks and jobs."""
+    from .common.ratelimit import LowPriorityRateLimiter
+    if not getattr(g, 'low_priority', False):
+        return rate_limiter
+    return LowPriorityRateLimiter(rate_limiter)
+
+
+def get_backend_retry_policy(backend, max_retries_key):
+    """Return the retry policy shared by the clients of a backend if its calls are retried."""
+    from .common.retry import RetryPolicy, get_retry_policy
+    if not app.config.get(max_retries_key):
+        return None
+    return get_retry_policy(backend, lambda: RetryPolicy(backend, app.config[max_retries_key],
+                                                         app.config.get('RETRY_BACKOFF', 0.5),
+                                                         retry_posts=app.config.get('RETRY_POSTS', False)))
+
+
+def get_call_tracer():
+    """Return the call tracer of the current application context if calls are traced."""
+    return getattr(g, 'call_tracer', None)
 
 
 def get_marketo_client():
@@ -56,5 +93,3 @@ if not app.debug:
         handler.setFormatter(formatter)
         handler.setLevel(logging.DEBUG)
         app.logger.addHandler(handler)
-
-import sync.views
@@ -1,7 +1,5 @@
 from datetime import datetime
 
-from pycountry import countries
-
 import marketo
 import pipedrive
 import sync
@@ -13,10 +11,9 @@ def company_name_to_org_id(lead):
     org_id = None
     if lead.company:
         import tasks
-        rv = tasks.create_or_update_organization_in_pipedrive(lead.externalCompanyId)
-        if rv and 'id' in rv:  # Case Company object
-            org_id = rv['id']
-        else:  # Case company form fields
+        if lead.externalCompanyId:  # Case Company object
+            org_id = tasks.resolve_organization_in_pipedrive(lead.externalCompanyId)
+        if org_id is None:  # Case company form fields
             company = marketo.Company(sync.get_marketo_client())
             company.externalCompanyId = marketo.compute_external_id('lead-company', lead.id, 'mkto')
             company.company = lead.company
@@ -32,14 +29,15 @@ def company_name_to_org_id(lead):
             company.save()
             lead.externalCompanyId = company.externalCompanyId
             lead.save()
-            rv = tasks.create_or_update_organization_in_pipedrive(company.externalCompanyId)
-            org_id = rv['id'] if rv and 'id' in rv else org_id
+            org_id = tasks.resolve_organization_in_pipedrive(company.externalCompanyId)
     return org_id
 
 
 def country_iso_to_name(country_iso_or_name):
     country_name = country_iso_or_name
     if country_iso_or_name:
+        from pycountry import countries  # Deferred: pycountry is slow to import and only needed for country fields
+
         try:
             country_name = countries.get(alpha2=country_iso_or_name).name
         except KeyError:
@@ -227,10 +225,13 @@ def datetime_to_date2(datetime_):
     return date
 
 
-def stage_to_name(stage):
+def stage_to_name(stage_id):
     stage_name = None
-    if stage is not None:
-        stage_name = stage.name
+    if stage_id is not None:
+        stages = sync.get_pipedrive_client().get_stages()
+        if stage_id not in stages:  # The stage may have been created since the stages were loaded
+            stages = sync.get_pipedrive_client().get_stages(refresh=True)
+        stage_name = stages[stage_id]['name'] if stage_id in stages else None
     return stage_name
 
 
@@ -1,7 +1,9 @@
 import logging
 
 from .errors import Error, InitializationError, SavingError
-from .util import memoize, simple_pluralize
+# The batch, ratelimit, retry, streaming and tracing submodules are imported where used: they would load requests on
+# every instance startup
+from .util import SharedCalls, TTLCache, count_cache_access, memoize, pop_cache_stats, simple_pluralize
 
 # Set default logging handler to avoid "No handler found" warnings.
 try:  # Python 2.7+
@@ -0,0 +1,68 @@
+import logging
+import threading
+from Queue import Empty, Queue
+
+from requests import RequestException
+
+from .errors import SavingError
+
+
+class ConcurrentSaver(object):
+    """
+    Buffer entities and save them concurrently for backends without bulk endpoint.
+    At most "max_in_flight" entities are saved at the same time so that the calls stay within the rate limits.
+    """
+
+    def __init__(self, max_in_flight=4):
+        """
+        :param max_in_flight: The maximum number of entities saved at the same time
+        """
+        self._logger = logging.getLogger(__name__)
+        self.max_in_flight = max_in_flight
+        self._entities = []
+
+    def add(self, entity):
+        """
+        Buffer an entity to save.
+        :param entity: The entity
+        """
+        self._entities.append(entity)
+
+    def flush(self):
+        """
+        Save the buffered entities.
+        :return: A list of custom response objects containing the status and id or error of each entity, in the order
+        the entities were added
+        """
+        entities, self._entities = self._entities, []
+        outcomes = [None] * len(entities)
+        queue = Queue()
+        for i, entity in enumerate(entities):
+            queue.put((i, entity))
+
+        def save_next():
+            while True:
+                try:
+                    i, entity = queue.get_nowait()
+                except Empty:
+                    return
+                outcomes[i] = self._save(entity)
+
+        workers = [threading.Thread(target=save_next) for _ in range(min(self.max_in_flight, len(entities)))]
+        if len(workers) > 1:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        else:
+            save_next()  # No need for a thread
+        return outcomes
+
+    def _save(self, entity):
+        status = 'updated' if entity.id else 'created'
+        try:
+            entity.save()
+        except (SavingError, RequestException) as e:
+            self._logger.error('entity=%s could not be saved: %s', entity.entity_name, e)
+            return {'status': 'error', 'error': str(e)}
+        return {'status': status, 'id': entity.id}
@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+
+_rate_limiters = {}  # Rate limiters shared by every client of the instance per backend name
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name, factory):
+    """
+    Return the rate limiter of a backend shared across threads, creating it on first use.
+    :param name: The backend name
+    :param factory: The function creating the rate limiter
+    :return: The rate limiter
+    """
+    with _rate_limiters_lock:
+        if name not in _rate_limiters:
+            _rate_limiters[name] = factory()
+        return _rate_limiters[name]
+
+
+class RateLimiter(object):
+    """
+    Thread-safe token bucket allowing "limit" calls per "window" seconds on average with bursts of "limit" calls.
+    Tokens are taken before each call and the bucket adapts to the X-RateLimit-Remaining and X-RateLimit-Reset headers
+    of the responses as other instances may share the same quota.
+    Low priority calls only take the tokens above a share of the bucket kept for the other calls.
+    """
+
+    def __init__(self, limit, window, reserve_ratio=0.1, priority_ratio=0.5):
+        """
+        :param limit: The number of calls allowed per window
+        :param window: The window duration in seconds
+        :param reserve_ratio: The part of the limit kept in reserve, calls are paused until the window reset under it
+        :param priority_ratio: The part of the bucket kept for the calls that are not low priority
+        """
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.limit = limit
+        self.window = window
+        self.rate = float(limit) / window  # Tokens per second
+        self.reserve_ratio = reserve_ratio
+        self.reserve = max(int(limit * reserve_ratio), 1)
+        self.priority_reserve = min(int(limit * priority_ratio), limit - 1)
+        self._tokens = float(limit)
+        self._updated = time.time()
+        self._paused_until = 0
+
+    def _refill(self, now):
+        if now > self._updated:
+            elapsed = now - max(self._updated, self._paused_until)
+            if elapsed > 0:
+                self._tokens = min(self.limit, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self, low_priority=False):
+        """
+        Take a token, waiting for it if the bucket is empty or paused.
+        :param low_priority: True to wait while the bucket holds no more tokens than the priority reserve
+        :return: The time waited in seconds
+        """
+        if low_priority:
+            return self._acquire_low_priority()
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            available_at = max(now, self._paused_until)
+            if self._tokens < 1:
+                available_at += (1 - self._tokens) / self.rate
+            self._tokens -= 1  # Reserve the token now so that concurrent callers queue up behind
+        wait = available_at - now
+        if wait > 0:
+            self._logger.debug('Throttling call for %.3fs', wait)
+            time.sleep(wait)
+        return max(wait, 0)
+
+    def _acquire_low_priority(self):
+        # Tokens are not reserved ahead so that the other calls never queue up behind low priority ones
+        waited = 0
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                available_at = max(now, self._paused_until)
+                if self._tokens < self.priority_reserve + 1:
+                    available_at += (self.priority_reserve + 1 - self._tokens) / self.rate
+                if available_at <= now:
+                    self._tokens -= 1
+                    return waited
+            wait = available_at - now
+            self._logger.debug('Throttling low priority call for %.3fs', wait)
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        """
+        Stop giving tokens for some time and empty the bucket.
+        :param seconds: The pause duration
+        """
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = min(self._tokens, 0)
+        self._logger.warning('Rate limit reached, pausing calls for %ss', seconds)
+
+    def update(self, remaining, reset=None, limit=None):
+        """
+        Align the bucket with the remaining calls reported by the backend.
+        :param remaining: The number of calls left in the current window
+        :param reset: The number of seconds before the window is reset
+        :param limit: The number of calls allowed per window by the backend, the configured limit if not specified
+        """
+        reserve = max(int(limit * self.reserve_ratio), 1) if limit else self.reserve
+        if remaining <= reserve:
+            self.pause(reset if reset is not None else self.window)
+        else:
+            with self._lock:
+                self._tokens = min(self._tokens, remaining - reserve)
+
+    def handle_response(self, response, stream=False):
+        """
+        Adapt the bucket to a response.
+        :param response: The requests response
+        :param stream: True if the response body is streamed and must not be read
+        """
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        if remaining is not None:
+            reset = response.headers.get('X-RateLimit-Reset')
+            limit = response.headers.get('X-RateLimit-Limit')
+            self.update(int(remaining), int(reset) if reset is not None else None, int(limit) if limit else None)
+        elif response.status_code == 429:
+            self.pause(self.window)
+
+
+class LowPriorityRateLimiter(object):
+    """
+    Rate limiter taking the tokens of another one as low priority calls, e.g. for the calls of the bulk tasks.
+    """
+
+    def __init__(self, rate_limiter):
+        """
+        :param rate_limiter: The rate limiter shared with the other calls
+        """
+        self.rate_limiter = rate_limiter
+
+    def acquire(self):
+        return self.rate_limiter.acquire(low_priority=True)
+
+    def handle_response(self, response, stream=False):
+        self.rate_limiter.handle_response(response, stream)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    Transport adapter taking a token from a rate limiter before sending each request.
+    """
+
+    def __init__(self, rate_limiter, **kwargs):
+        self.rate_limiter = rate_limiter
+        super(RateLimitedAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.rate_limiter.acquire()
+        response = super(RateLimitedAdapter, self).send(request, **kwargs)
+        self.rate_limiter.handle_response(response, kwargs.get('stream', False))
+        return response
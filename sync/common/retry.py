@@ -0,0 +1,166 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from requests import ConnectionError, Timeout
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+_retry_policies = {}  # Retry policies shared by every client of the instance per backend name
+_retry_policies_lock = threading.Lock()
+
+_retry_stats = defaultdict(lambda: defaultdict(int))  # Retry outcomes per backend name since last popped
+_retry_stats_lock = threading.Lock()
+
+
+def get_retry_policy(name, factory):
+    """
+    Return the retry policy of a backend shared across threads, creating it on first use.
+    :param name: The backend name
+    :param factory: The function creating the retry policy
+    :return: The retry policy
+    """
+    with _retry_policies_lock:
+        if name not in _retry_policies:
+            _retry_policies[name] = factory()
+        return _retry_policies[name]
+
+
+def count_retry(name, outcome):
+    """
+    Count a retry outcome.
+    :param name: The backend name
+    :param outcome: "retries" for a retried call, "exhausted" when the retry budget is spent, "failures" when a call
+    failed after its last attempt
+    """
+    with _retry_stats_lock:
+        _retry_stats[name][outcome] += 1
+
+
+def pop_retry_stats():
+    """
+    Return and reset the retry outcomes counted per backend.
+    >>> count_retry('pipedrive', 'retries')
+    >>> pop_retry_stats()
+    {'pipedrive': {'retries': 1}}
+    >>> pop_retry_stats()
+    {}
+    """
+    with _retry_stats_lock:
+        stats = dict((name, dict(outcomes)) for name, outcomes in _retry_stats.items())
+        _retry_stats.clear()
+    return stats
+
+
+class RetryPolicy(object):
+    """
+    Retry the calls failing with a transient error after a jittered exponential backoff.
+    Retries are limited by a budget shared by every caller: within a budget window, retries may not exceed a ratio of
+    the calls made (plus a minimum) so that a failing backend is not flooded by retries.
+    """
+
+    def __init__(self, name, max_retries=3, backoff=0.5, max_backoff=8, budget_ratio=0.2, min_budget=10,
+                 budget_window=60, retry_posts=False):
+        """
+        :param name: The backend name, used for logging and metrics
+        :param max_retries: The maximum number of retries of a call
+        :param backoff: The base backoff in seconds, doubled at each retry
+        :param max_backoff: The maximum backoff in seconds
+        :param budget_ratio: The ratio of calls that may be retried within a budget window
+        :param min_budget: The number of retries always allowed within a budget window
+        :param budget_window: The budget window duration in seconds
+        :param retry_posts: True to also retry non idempotent calls, i.e. POST calls that are not lookups
+        """
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget_ratio = budget_ratio
+        self.min_budget = min_budget
+        self.budget_window = budget_window
+        self.retry_posts = retry_posts
+        self._window_start = time.time()
+        self._calls = 0
+        self._retries = 0
+
+    def backoff_delay(self, retry):
+        """
+        Return the delay before a retry, drawn uniformly up to the exponential backoff ("full jitter") so that callers
+        failing together do not retry together.
+        :param retry: The retry number, starting at 0
+        :return: The delay in seconds
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+    def _count_call(self):
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= self.budget_window:
+                self._window_start = now
+                self._calls = 0
+                self._retries = 0
+            self._calls += 1
+
+    def _take_retry(self):
+        with self._lock:
+            if self._retries >= self.min_budget + self.budget_ratio * self._calls:
+                return False
+            self._retries += 1
+            return True
+
+    def call(self, send, method, get_error=None, replayable=False, on_retry=None):
+        """
+        Send a request, retrying it while it fails with a transient error.
+        :param send: The function sending the request and returning the response
+        :param method: The request HTTP method, only idempotent methods are retried unless POST calls are retried
+        :param get_error: The function returning the transient error of a response or None
+        :param replayable: True if the request can be replayed whatever its method, e.g. a POST lookup
+        :param on_retry: The function called before each retry
+        :return: The response of the last attempt, its connection error being raised if it did not get any
+        """
+        idempotent = replayable or method in IDEMPOTENT_METHODS
+        retry = 0
+        while True:
+            self._count_call()
+            try:
+                response = send()
+            except (ConnectionError, Timeout) as e:
+                exception = e
+                error = type(e).__name__
+            else:
+                exception = None
+                error = get_error(response) if get_error is not None else None
+            if error is None:
+                return response
+
+            if not idempotent and not self.retry_posts:
+                pass  # Replaying the request is not safe
+            elif retry >= self.max_retries:
+                self._logger.error('Giving up %s call after %d retries for error=%s', self.name, retry, error)
+                count_retry(self.name, 'failures')
+            elif not self._take_retry():
+                self._logger.error('Retry budget of %s calls exhausted, not retrying error=%s', self.name, error)
+                count_retry(self.name, 'exhausted')
+            else:
+                delay = self.backoff_delay(retry)
+                self._logger.warning('Retrying %s call in %.3fs for error=%s', self.name, delay, error)
+                count_retry(self.name, 'retries')
+                time.sleep(delay)
+                retry += 1
+                if on_retry is not None:
+                    on_retry()
+                continue
+
+            if exception is not None:
+                raise exception
+            return response
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,123 @@
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+class _JSONReader(object):
+    """
+    Buffer the text decoded from byte chunks, keeping only the text not parsed yet.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = u''
+        self.pos = 0
+        self.eof = False
+
+    def read_more(self):
+        """
+        Append the next chunk to the buffer, dropping the text already parsed.
+        :return: False if there is no more chunk
+        """
+        if self.eof:
+            return False
+        try:
+            text = self._text_decoder.decode(next(self._chunks))
+        except StopIteration:
+            self.eof = True
+            text = self._text_decoder.decode(b'', final=True)
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespaces.
+        :return: The next character, empty at the end of the data
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more():
+                return ''
+
+    def expect(self, chars):
+        """
+        Parse the next character.
+        :param chars: The characters allowed
+        :return: The character
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Expecting one of %r instead of %r' % (chars, char or 'end of data'))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """
+        Parse the next JSON value.
+        :return: The value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self.read_more():
+                    raise
+                continue
+            if end < len(self.buffer) or self.eof:  # Else a number may go on in the next chunk
+                self.pos = end
+                return value
+            self.read_more()
+
+
+def iter_json_array(chunks, key, envelope=None):
+    """
+    Parse a JSON object incrementally and yield the items of its array member one at a time, so that a list response
+    is never held in memory as a whole. The other members, usually small, are decoded entirely.
+    :param chunks: The chunks of the UTF-8 encoded JSON object, e.g. a streamed response "iter_content()"
+    :param key: The name of the array member
+    :param envelope: The dictionary to fill with the other members (success, errors, paging data...)
+    :return: A generator of array items
+    >>> envelope = {}
+    >>> list(iter_json_array(['{"success": true, "da', 'ta": [{"id": 1}, {"id"', ': 2}], "more": 1', '0}'], 'data', envelope))
+    [{u'id': 1}, {u'id': 2}]
+    >>> sorted(envelope.items())
+    [(u'more', 10), (u'success', True)]
+    >>> list(iter_json_array(['{"data": null}'], 'data', envelope)), envelope['data']
+    ([], None)
+    """
+    reader = _JSONReader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.decode()
+        reader.expect(':')
+        if name == key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield reader.decode()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            value = reader.decode()
+            if envelope is not None:
+                envelope[name] = value
+        if reader.expect(',}') == '}':
+            return
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
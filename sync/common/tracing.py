@@ -0,0 +1,107 @@
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+from urlparse import urlparse
+
+CallTrace = namedtuple('CallTrace', ['backend', 'endpoint', 'method', 'status', 'bytes_sent', 'bytes_received',
+                                     'duration', 'retries'])
+
+
+def endpoint_template(url):
+    """
+    Return the endpoint of a URL without its query string and with its ids replaced by a placeholder.
+    >>> endpoint_template('https://api.pipedrive.com/v1/persons/10?api_token=secret')
+    '/v1/persons/{id}'
+    >>> endpoint_template('https://123-ABC-456.mktorest.com/rest/asset/v1/email/1/content.json')
+    '/rest/asset/v1/email/{id}/content.json'
+    >>> endpoint_template('https://123-ABC-456.mktorest.com/rest/v1/leads.json?_method=GET')
+    '/rest/v1/leads.json'
+    """
+    return re.sub(r'/\d+(?=/|$)', '/{id}', urlparse(url).path)
+
+
+class CallTracer(object):
+    """
+    Record a trace for every HTTP call made by the clients it is attached to.
+    Attaching a tracer registers a response hook on the client session so that nothing is done when tracing is
+    disabled.
+    """
+
+    def __init__(self):
+        self._logger = logging.getLogger(__name__)
+        self._local = threading.local()
+        self.calls = []
+        self.rate_limits = {}  # Last rate limit headers values per backend
+
+    def attach(self, session, backend):
+        """
+        Trace the calls made with a session.
+        :param session: The requests session
+        :param backend: The backend name the session calls, e.g. "marketo"
+        """
+        session.hooks['response'].append(partial(self.hook, backend=backend))
+
+    def retrying(self):
+        """
+        Flag the next call made in the current thread as a retry of the previous one.
+        """
+        self._local.retries = getattr(self._local, 'retries', 0) + 1
+
+    def hook(self, response, backend=None, **kwargs):
+        """
+        The requests response hook, called once headers have been received.
+        """
+        start = time.time()
+        if kwargs.get('stream'):  # Do not consume a streamed body
+            bytes_received = int(response.headers.get('Content-Length', 0))
+        else:
+            bytes_received = len(response.content)
+        request = response.request
+        trace = CallTrace(backend, endpoint_template(request.url), request.method, response.status_code,
+                          len(request.body or ''), bytes_received,
+                          response.elapsed.total_seconds() + time.time() - start,
+                          getattr(self._local, 'retries', 0))
+        self._local.retries = 0
+        if 'X-RateLimit-Remaining' in response.headers:
+            self.rate_limits[backend] = {
+                'remaining': int(response.headers['X-RateLimit-Remaining']),
+                'limit': int(response.headers.get('X-RateLimit-Limit', 0))
+            }
+        self.calls.append(trace)
+        self._logger.debug('Traced call=%s', trace)
+        return response
+
+    def summary(self):
+        """
+        Aggregate the recorded calls per endpoint.
+        :return: A dictionary with the totals, the totals per backend and the totals per "METHOD endpoint"
+        """
+        summary = {'count': 0, 'errors': 0, 'retries': 0, 'bytes': 0, 'duration_ms': 0, 'backends': {},
+                   'endpoints': {}}
+        for trace in self.calls:
+            key = '%s %s' % (trace.method, trace.endpoint)
+            if key not in summary['endpoints']:
+                summary['endpoints'][key] = {'count': 0, 'errors': 0, 'retries': 0, 'bytes': 0, 'duration_ms': 0,
+                                             'max_duration_ms': 0}
+            if trace.backend not in summary['backends']:
+                summary['backends'][trace.backend] = {'count': 0, 'errors': 0, 'retries': 0, 'bytes': 0,
+                                                      'duration_ms': 0}
+            duration_ms = int(round(trace.duration * 1e3))
+            for totals in (summary, summary['backends'][trace.backend], summary['endpoints'][key]):
+                totals['count'] += 1
+                totals['errors'] += trace.status >= 400
+                totals['retries'] += trace.retries
+                totals['bytes'] += trace.bytes_sent + trace.bytes_received
+                totals['duration_ms'] += duration_ms
+            endpoint = summary['endpoints'][key]
+            endpoint['max_duration_ms'] = max(endpoint['max_duration_ms'], duration_ms)
+        return summary
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -1,6 +1,13 @@
 import logging
+import threading
+import time
+from collections import defaultdict
 from functools import wraps
 
+from .errors import Error
+
+_cache_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})  # Cache accesses per cache name
+
 
 def simple_pluralize(word):
     """
@@ -17,6 +24,181 @@ def simple_pluralize(word):
     return plural
 
 
+def count_cache_access(cache_name, hit):
+    """
+    Count a cache access for the cache hit rate metrics.
+    :param cache_name: The cache name
+    :param hit: True if the value was found in the cache
+    """
+    _cache_stats[cache_name]['hits' if hit else 'misses'] += 1
+
+
+def pop_cache_stats():
+    """
+    Return the cache accesses counted since the last call.
+    >>> count_cache_access('test', True)
+    >>> count_cache_access('test', False)
+    >>> pop_cache_stats()['test'] == {'hits': 1, 'misses': 1}
+    True
+    >>> pop_cache_stats()
+    {}
+    """
+    stats = dict(_cache_stats)
+    _cache_stats.clear()
+    return stats
+
+
+class TTLCache(object):
+    """
+    Thread-safe cache shared by the whole process whose values expire after some time.
+    Concurrent misses on a key wait for the value loaded by the first one instead of loading it again.
+    >>> cache = TTLCache('doctest', 60)
+    >>> cache.get('key', lambda: 'loaded')
+    'loaded'
+    >>> cache.get('key', lambda: 'loaded again')
+    'loaded'
+    >>> cache.discard('key')
+    >>> cache.get('key', lambda: 'loaded again')
+    'loaded again'
+    >>> cache.clear()
+    >>> cache.get('key', lambda: 'loaded once more')
+    'loaded once more'
+    >>> small_cache = TTLCache('doctest', 60, max_size=1)
+    >>> small_cache.get('key', lambda: 'loaded'), small_cache.get('other key', lambda: 'other')
+    ('loaded', 'other')
+    >>> small_cache.get('key', lambda: 'evicted')
+    'evicted'
+    """
+
+    def __init__(self, name, ttl, max_size=None):
+        """
+        :param name: The cache name for the cache hit rate metrics
+        :param ttl: The values time to live in seconds
+        :param max_size: The maximum number of values kept, the values expiring first being evicted, no limit if not
+        specified
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._values = {}  # Key mapped against its value and expiry time
+        self._loading = {}  # Key mapped against the event set once its value is loaded
+
+    def get(self, key, load):
+        """
+        Return the value of a key, loading it if it is missing or expired.
+        :param key: The key
+        :param load: The function loading the value
+        :return: The value
+        """
+        while True:
+            with self._lock:
+                value, expires_at = self._values.get(key, (None, 0))
+                if expires_at > time.time():
+                    loaded = None
+                elif key in self._loading:
+                    loaded = self._loading[key]
+                else:
+                    loaded = self._loading[key] = threading.Event()
+                    break  # This thread loads the value
+            if loaded is None:
+                count_cache_access(self.name, True)
+                return value
+            loaded.wait()  # Another thread is loading the value, then get it again
+
+        count_cache_access(self.name, False)
+        try:
+            value = load()
+            with self._lock:
+                self._values[key] = (value, time.time() + self.ttl)
+                if self.max_size is not None and len(self._values) > self.max_size:
+                    self._evict()
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loaded.set()
+        return value
+
+    def _evict(self):
+        now = time.time()
+        for key in [key for key, (_, expires_at) in self._values.items() if expires_at <= now]:
+            del self._values[key]
+        while len(self._values) > self.max_size:
+            del self._values[min(self._values, key=lambda key: self._values[key][1])]
+
+    def discard(self, key):
+        """
+        Remove the value of a key if any.
+        :param key: The key
+        """
+        with self._lock:
+            self._values.pop(key, None)
+
+    def clear(self):
+        """
+        Remove every value.
+        """
+        with self._lock:
+            self._values.clear()
+
+
+class SharedCalls(object):
+    """
+    Thread-safe deduplication of the calls running at the same time: a call made while another one with the same key
+    is running waits for it and returns its result, a call made afterwards runs again. Nothing is kept once a call ends.
+    >>> calls = SharedCalls('doctest')
+    >>> calls.call('key', lambda: 'called')
+    'called'
+    >>> calls.call('key', lambda: 'called again')
+    'called again'
+    """
+
+    def __init__(self, name, timeout=None):
+        """
+        :param name: The calls name for the cache hit rate metrics, a shared call counting as a hit
+        :param timeout: The number of seconds to wait for a running call before giving up, None to wait until it ends
+        """
+        self.name = name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._running = {}  # Key mapped against the event set once its call ends and the call outcome
+
+    def call(self, key, function):
+        """
+        Return the result of a function, sharing the result of the running call with the same key if any.
+        :param key: The key
+        :param function: The function to call
+        :return: The function result
+        :raise Error: If the running call does not end within the timeout
+        """
+        with self._lock:
+            running = self._running.get(key)
+            if running is None:
+                running = self._running[key] = (threading.Event(), {})
+                owner = True
+            else:
+                owner = False
+        done, outcome = running
+
+        if not owner:
+            count_cache_access(self.name, True)
+            if not done.wait(self.timeout):
+                raise Error('Shared call', 'Call {} with key={} still running after {} seconds', self.name, key,
+                            self.timeout)
+            if 'value' in outcome:
+                return outcome['value']
+            return self.call(key, function)  # The running call failed, try again
+
+        count_cache_access(self.name, False)
+        try:
+            outcome['value'] = function()
+        finally:
+            with self._lock:
+                del self._running[key]
+            done.set()
+        return outcome['value']
+
+
 def memoize(method_name):
     """
     Decorator function that store or retrieve the result of the method it is applied to
@@ -30,8 +212,10 @@ def memoize(method_name):
         def wrapper(self, *args):
             if method_name in self._memo and args in self._memo[method_name]:
                 logging.getLogger(__name__).debug('Retrieving function=%s return value from memo', method_name)
+                count_cache_access(method_name, True)
                 rv = self._memo[method_name][args]
             else:
+                count_cache_access(method_name, False)
                 if method_name not in self._memo:
                     self._memo[method_name] = {}
                 rv = function(self, *args)
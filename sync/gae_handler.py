@@ -1,11 +1,14 @@
 import logging
+import time
 
 from datetime import datetime
-from flask import Flask, jsonify, request
+from flask import Flask, g, jsonify, request
 from google.appengine.ext import ndb
 
+from . import app
 from .common import Error
-from .util import EnqueuedTask
+from .common.tracing import CallTracer
+from .util import BULK_QUEUE, EnqueuedTask
 
 gae_app = Flask(__name__)
 
@@ -45,11 +48,59 @@ def sync_handler(task_name):
 
     id_ = int(request.form.get('id'))
     logging.getLogger('sync').debug('id_: %s', id_)
-    
-    import tasks
-    rv = getattr(tasks, task_name)(id_)
+
+    rv = run_task(task_name, id_, low_priority=request.headers.get('X-AppEngine-QueueName') == BULK_QUEUE)
 
     # Release the task after completion (= succeeded): remove it from the datastore
     enqueued_task_key.delete()
 
     return jsonify(**rv)
+
+
+@gae_app.route('/job/<string:job_name>', methods=['GET'])
+def job_handler(job_name):
+    # Jobs are tasks without id run on schedule by App Engine cron (see cron.yaml), catching up in the background
+    rv = run_task(job_name, low_priority=True)
+    return jsonify(**rv)
+
+
+def run_task(task_name, id_=None, low_priority=False):
+    """
+    Run a task, tracing its calls and sending its metrics if enabled.
+    :param task_name: The task name
+    :param id_: The task id parameter, None for a job
+    :param low_priority: True to leave a share of the backend rate limits to the other tasks of the instance
+    :return: The task response
+    """
+    import tasks
+    g.low_priority = low_priority  # Read when the clients of the task are created
+    send_metrics = app.config.get('DATADOG_METRICS')
+    if app.config.get('TRACE_CALLS') or send_metrics:  # Metrics are computed from the traced calls
+        g.call_tracer = CallTracer()
+    start = time.time()
+    rv = None
+    try:
+        rv = getattr(tasks, task_name)(id_) if id_ is not None else getattr(tasks, task_name)()
+    finally:
+        if send_metrics:
+            from . import metrics
+            metrics.record_task(task_name, rv, time.time() - start, g.call_tracer)
+    if app.config.get('TRACE_CALLS'):
+        rv['calls'] = g.call_tracer.summary()
+        log_calls(task_name, id_, rv['calls'])
+    return rv
+
+
+def log_calls(task_name, id_, calls):
+    """
+    Log the calls made by a task.
+    :param task_name: The task name
+    :param id_: The task id parameter
+    :param calls: The calls summary
+    """
+    logger = logging.getLogger('sync')
+    logger.info('Task=%s with id=%s made %d calls in %dms (%d bytes, %d retries, %d errors)', task_name, id_,
+                calls['count'], calls['duration_ms'], calls['bytes'], calls['retries'], calls['errors'])
+    for endpoint, stats in sorted(calls['endpoints'].items(), key=lambda item: -item[1]['duration_ms']):
+        logger.info('  %s: %d calls in %dms (max=%dms)', endpoint, stats['count'], stats['duration_ms'],
+                    stats['max_duration_ms'])
@@ -9,8 +9,27 @@ and the final string value will be passed as the "post-adapter" parameter.
 "mode" ("join" or "choose") should be provided if several fields are.
 "join" mode will join field string values using space before post-adapting.
 "choose" mode will chose the first non empty field string value before post-adapting.
+"source_fields" may list the fields read by a "transformer" so that only the needed fields are loaded.
 """
 
+
+def get_source_fields(mapping):
+    """
+    Return the fields of the entity to send data from that are read by a mapping.
+    :param mapping: The mapping
+    :return: A set of field names or keys, None if a transformer may read any field
+    """
+    fields = set()
+    for field_mapping in mapping.values():
+        if 'fields' in field_mapping:
+            fields.update(field_mapping['fields'])
+        elif 'source_fields' in field_mapping:
+            fields.update(field_mapping['source_fields'])
+        else:
+            return None
+    return frozenset(fields)
+
+
 # To send from Marketo to Pipedrive
 
 PERSON_TO_LEAD = {
@@ -22,7 +41,9 @@ PERSON_TO_LEAD = {
         'fields': ['email']
     },
     'org_id': {
-        'transformer': adapters.company_name_to_org_id
+        'transformer': adapters.company_name_to_org_id,
+        'source_fields': ['id', 'company', 'externalCompanyId', 'street', 'city', 'state', 'postalCode', 'country',
+                          'mainPhone', 'industry', 'annualRevenue', 'numberOfEmployees']
     },
     'title': {
         'fields': ['title']
@@ -139,7 +160,8 @@ ACTIVITY_TO_LEAD = {
         'fields': ['pipedriveId']
     },
     'type': {
-        'transformer': adapters.activity_type
+        'transformer': adapters.activity_type,
+        'source_fields': ['contactReason', 'directFollowUp']
     },
     'subject': {
         'fields': ['firstName', 'lastName'],
@@ -157,23 +179,32 @@ ACTIVITY_TO_LEAD = {
 
 ACTIVITY_TO_EMAIL_SENT = {
     'user_id': {
-        'transformer': adapters.big_bot_id
+        'transformer': adapters.big_bot_id,
+        'source_fields': []
     },
     'person_id': {
         'fields': ['pipedriveId']
     },
     'type': {
-        'transformer': adapters.activity_type_email
+        'transformer': adapters.activity_type_email,
+        'source_fields': []
     },
     'due_date': {
         'fields': [],
         'post_adapter': adapters.today_date
     },
     'done': {
-        'transformer': adapters.activity_done
+        'transformer': adapters.activity_done,
+        'source_fields': []
     },
 }
 
+# Fields to load from Marketo
+PERSON_TO_LEAD_SOURCE_FIELDS = get_source_fields(PERSON_TO_LEAD)
+ORGANIZATION_TO_COMPANY_SOURCE_FIELDS = get_source_fields(ORGANIZATION_TO_COMPANY)
+ACTIVITY_TO_LEAD_SOURCE_FIELDS = get_source_fields(ACTIVITY_TO_LEAD)
+ACTIVITY_TO_EMAIL_SENT_SOURCE_FIELDS = get_source_fields(ACTIVITY_TO_EMAIL_SENT)
+
 # To send from Pipedrive to Marketo
 # /!\ If you add a field here don't forget to add it in marketo.Entity._entity_fields_to_update() too
 
@@ -273,6 +304,10 @@ COMPANY_TO_ORGANIZATION = {
     }
 }
 
+# Fields to load from Pipedrive, whose changes are worth a synchronization
+LEAD_TO_PERSON_SOURCE_FIELDS = get_source_fields(LEAD_TO_PERSON)
+COMPANY_TO_ORGANIZATION_SOURCE_FIELDS = get_source_fields(COMPANY_TO_ORGANIZATION)
+
 PIPELINE_FILTER_NAMES = ['NAM - Commercial', 'NAM - Government', 'EMEA', 'APAC', 'Renewals', 'Professional Services']
 
 OPPORTUNITY_TO_DEAL = {
@@ -306,7 +341,7 @@ OPPORTUNITY_TO_DEAL = {
         'post_adapter': adapters.datetime_to_date2
     },
     'stage': {
-        'fields': ['stage'],
+        'fields': ['stage_id'],
         'post_adapter': adapters.stage_to_name
     },
     'fiscalQuarter': {
@@ -321,6 +356,10 @@ OPPORTUNITY_TO_DEAL = {
     }
 }
 
+# Keys of the organization country and region fields, whose names conflict with the address fields
+ORGANIZATION_COUNTRY_KEY = 'b97ac2f12d2071c4c5efbf3a89c812c970f04af1'
+ORGANIZATION_REGION_KEY = 'e1cfd37b3fa5a3847f662fb7a3728c181b6dac15'
+
 COUNTRY_TO_REGION = {
     'Antigua and Barbuda': 'NAM',
     'Bahamas': 'NAM',
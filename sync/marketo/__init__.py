@@ -1,6 +1,6 @@
 import logging
 
-from .client import MarketoClient
+from .client import MarketoClient, MarketoRateLimiter
 from .helpers import compute_external_id
 from .entities import Company
 from .entities import Lead
@@ -1,10 +1,31 @@
 import importlib
 import logging
+import time
 
 from requests import Session
 
 from .helpers import is_marketo_guid
-from sync.common import memoize, simple_pluralize
+from sync.common import TTLCache, memoize, simple_pluralize
+from sync.common.ratelimit import RateLimitedAdapter, RateLimiter
+from sync.common.streaming import iter_json_array
+
+
+class MarketoRateLimiter(RateLimiter):
+    """
+    Rate limiter reading the Marketo rate limit (606) and daily quota (607) error codes as Marketo does not send rate
+    limit headers.
+    """
+
+    def handle_response(self, response, stream=False):
+        if stream or response.status_code != 200:
+            return
+        content = response.content
+        if '"606"' in content or '"607"' in content:  # Only parse responses that may hold these errors
+            for error in response.json().get('errors', []):
+                if error['code'] == '606':
+                    self.pause(self.window)
+                elif error['code'] == '607':
+                    self._logger.error('Marketo daily quota reached: %s', error['message'])
 
 
 class MarketoClient:
@@ -13,8 +34,17 @@ class MarketoClient:
     """
 
     API_VERSION = 'v1'
+    TRANSIENT_ERROR_CODES = ('604', '606', '615')  # Request timed out, rate limit and concurrent access limit reached
+    TOKEN_ERROR_CODES = ('601', '602')  # Access token invalid and expired
+    TOKEN_EXPIRY_MARGIN = 60  # Seconds before the access token expiry to fetch a new one
+    STREAM_CHUNK_SIZE = 64 * 1024  # Bytes read at once from streamed responses
+
+    # Activity types rarely change: share them between the clients of the process
+    _activity_types = TTLCache('get_activity_types', 3600)
+    _activity_type_ids = TTLCache('get_activity_type_ids', 3600)
 
-    def __init__(self, identity_endpoint, client_id, client_secret, api_endpoint):
+    def __init__(self, identity_endpoint, client_id, client_secret, api_endpoint, tracer=None, rate_limiter=None,
+                 retry_policy=None):
         self._logger = logging.getLogger(__name__)
         self._memo = {}  # The class cache
 
@@ -24,7 +54,14 @@ class MarketoClient:
         self._api_endpoint = api_endpoint
 
         self._session = Session()  # Reuse session for better performance within a single instance of the client
-
+        self._tracer = tracer  # Optional call tracer
+        if tracer is not None:
+            tracer.attach(self._session, 'marketo')
+        if rate_limiter is not None:  # Throttle API calls only, identity calls are not rate limited
+            self._session.mount(api_endpoint, RateLimitedAdapter(rate_limiter))
+        self._retry_policy = retry_policy  # Optional retry policy for transient errors
+
+        self._auth_token_expires_at = None  # Time to fetch a new access token at, set with the token
         self._auth_token = self._get_auth_token()
 
     def _get_auth_token(self):
@@ -36,13 +73,18 @@ class MarketoClient:
             'client_secret': self._client_secret
         }
 
-        r = self._session.get(auth_url, params=payload)
+        r = self._send('GET', auth_url, params=payload)
         self._logger.info('Called %s', r.url)
         r.raise_for_status()
         auth_data = r.json()
 
         self._logger.info('access_token=%s acquired expiring in %ss' %
                           (auth_data['access_token'], auth_data['expires_in']))
+        # Marketo returns the current token until it expires: only anticipate the expiry when the token is new enough
+        expires_in = auth_data['expires_in']
+        if expires_in > self.TOKEN_EXPIRY_MARGIN:
+            expires_in -= self.TOKEN_EXPIRY_MARGIN
+        self._auth_token_expires_at = time.time() + expires_in
         return auth_data['access_token']
 
     @memoize(method_name='get_entity_fields')
@@ -54,13 +96,24 @@ class MarketoClient:
         """
         return self._fetch_data(entity_name, 'describe')
 
-    @memoize(method_name='get_activity_types')
     def get_activity_types(self):
         """
         Return the activity available types loaded from Marketo.
         :return: A list of activity types
         """
-        return self._fetch_data('activity', 'types')
+        return self._activity_types.get(self._api_endpoint, lambda: self._fetch_data('activity', 'types'))
+
+    def get_activity_type_ids(self, activity_type_names):
+        """
+        Return the ids of activity types.
+        :param activity_type_names: A list of activity type names
+        :return: A list of activity type ids
+        """
+        def load():
+            ids_by_name = dict((type_['name'], type_['id']) for type_ in self.get_activity_types())
+            return [ids_by_name[name] for name in activity_type_names if name in ids_by_name]
+
+        return self._activity_type_ids.get((self._api_endpoint, tuple(activity_type_names)), load)
 
     def get_entity_data(self, entity_name, entity_id, entity_id_field, entity_fields=None):
         """
@@ -153,8 +206,8 @@ class MarketoClient:
 
         return_entities = entities
         if data_array:
-            i = 0
-            for data in data_array:
+            for i, data in enumerate(data_array):
+                i = data.get('seq', i)  # Each result refers to its input record
                 if i < len(return_entities):
                     return_entities[i].init(data)
                     if data['status'] == 'skipped':
@@ -166,7 +219,6 @@ class MarketoClient:
                         self._logger.info('entity=%s%s has been %s', entity_name,
                                           ' with id=%s' % return_entities[i].id if return_entities[i].id is not None
                                           else '', data['status'])
-                i += 1
 
         return return_entities
 
@@ -223,17 +275,15 @@ class MarketoClient:
         if paging_token:
             url = self._build_url('activity')
 
-            headers = {'Authorization': 'Bearer %s' % self._auth_token}
-
             payload = {
                 'activityTypeIds': activity_type_ids,
                 'nextPageToken': paging_token,
                 'leadIds': lead_id
             }
 
-            r = self._session.get(url, headers=headers, params=payload)
+            r = self._request('GET', url, params=payload)
 
-            self._logger.info('Called url=%s with headers=%s and parameters=%s', r.url, headers, payload)
+            self._logger.info('Called url=%s with parameters=%s', r.url, payload)
             r.raise_for_status()
             data = r.json()
 
@@ -243,15 +293,76 @@ class MarketoClient:
                     result_data = data['result']
                 elif 'errors' in data:
                     for error in data['errors']:
-                        if error['code'] == '602':
-                            self._logger.debug('Token expired, fetching new token to replay request')
-                            self._auth_token = self._get_auth_token()
-                            result_data = self.get_lead_activities(lead_id, activity_type_ids, start_datetime)
-                        else:
-                            self._logger.error('Error=%s', error['message'])
+                        self._logger.error('Error=%s', error['message'])
 
         return result_data
 
+    def get_activities(self, activity_type_ids, start_datetime, batch_size=None, stream=False):
+        """
+        Return the activities of every lead of specified types from a start date, following the paging tokens up to
+        the last page.
+        :param activity_type_ids: A list of activity type ids
+        :param start_datetime: The date to begin retrieving activities from of format 'YYYY-MM-DDTHH:MM:SS'
+        :param batch_size: The number of activities per page, 300 (Marketo maximum) if not specified
+        :param stream: True to parse the pages incrementally and return a generator holding one activity at a time
+        :return: A list of activities, a generator if streamed
+        """
+        activities = (activity for activities in self._iter_activity_pages(activity_type_ids, start_datetime,
+                                                                            batch_size, stream)
+                      for activity in activities)
+        return activities if stream else list(activities)
+
+    def iter_activity_pages(self, activity_type_ids, start_datetime, batch_size=None):
+        """
+        Return the activities of every lead of specified types from a start date page by page, so that they can be
+        processed and checkpointed one page at a time.
+        :param activity_type_ids: A list of activity type ids
+        :param start_datetime: The date to begin retrieving activities from of format 'YYYY-MM-DDTHH:MM:SS'
+        :param batch_size: The number of activities per page, 300 (Marketo maximum) if not specified
+        :return: A generator of lists of activities
+        """
+        return self._iter_activity_pages(activity_type_ids, start_datetime, batch_size, False)
+
+    def _iter_activity_pages(self, activity_type_ids, start_datetime, batch_size, stream):
+        paging_token = self._get_paging_token(start_datetime)
+        url = self._build_url('activity')
+        while paging_token:
+            payload = {
+                'activityTypeIds': activity_type_ids,
+                'nextPageToken': paging_token,
+                'batchSize': batch_size or 300
+            }
+
+            page = {}
+            yield self._get_activities_page(url, payload, page, stream)  # Consumed before the paging data is read
+
+            paging_token = None
+            if page.get('success') and page.get('moreResult'):
+                paging_token = page['nextPageToken']
+
+    def _get_activities_page(self, url, payload, page, stream):
+        """
+        Return the activities of a page.
+        :param url: The activities URL
+        :param payload: The page parameters
+        :param page: The dictionary to fill with the page paging data
+        :param stream: True to parse the page incrementally
+        :return: A list or a generator of activities
+        """
+        r = self._request('GET', url, params=payload, stream=stream)
+
+        self._logger.info('Called url=%s with parameters=%s', r.url, payload)
+        r.raise_for_status()
+        if stream:
+            return self._iter_result(r, page, lambda: self._get_activities_page(url, payload, page, False))
+        page.update(r.json())
+
+        if page.get('success'):
+            return page.pop('result', [])  # No result when there is no activity
+        for error in page.get('errors', []):
+            self._logger.error('Error=%s', error['message'])
+        return []
+
     def get_asset(self, asset_name, asset_id, more=None):
         """
         Return an asset loaded from Marketo.
@@ -265,11 +376,9 @@ class MarketoClient:
             url += '/' + more
         url += '.json'
 
-        headers = {'Authorization': 'Bearer %s' % self._auth_token}
+        r = self._request('GET', url)
 
-        r = self._session.get(url, headers=headers)
-
-        self._logger.info('Called url=%s with headers=%s', r.url, headers)
+        self._logger.info('Called url=%s', r.url)
         r.raise_for_status()
         data = r.json()
 
@@ -279,12 +388,7 @@ class MarketoClient:
                 result_data = data['result']
             else:
                 for error in data['errors']:
-                    if error['code'] == '602':
-                        self._logger.debug('Token expired, fetching new token to replay request')
-                        self._auth_token = self._get_auth_token()
-                        result_data = self.get_asset(asset_name, asset_id, more)
-                    else:
-                        self._logger.error('Error=%s', error['message'])
+                    self._logger.error('Error=%s', error['message'])
 
         data = {}
         if result_data:
@@ -298,7 +402,7 @@ class MarketoClient:
 
         return result_data[0]
 
-    def _fetch_data(self, entity_name, id_or_action, filter_type=None, fields=None):
+    def _fetch_data(self, entity_name, id_or_action, filter_type=None, fields=None, stream=False):
         self._logger.debug('Fetching entity=%s%s%s%s', entity_name,
                            ' (fields=%s)' % fields if fields is not None else '',
                            ' with id/action=%s' % id_or_action.encode('utf-8') if isinstance(id_or_action, unicode)
@@ -313,18 +417,18 @@ class MarketoClient:
         else:  # Case action
             url = self._build_url(entity_name, id_or_action)
 
-        headers = {'Authorization': 'Bearer %s' % self._auth_token}
-
         if fields:
             payload['fields'] = fields
             # Use POST method to handle long URLs such as when fields are provided
             params = {'_method': 'GET'}
-            r = self._session.post(url, headers=headers, params=params, data=payload)
+            r = self._request('POST', url, replayable=True, params=params, data=payload, stream=stream)
         else:
-            r = self._session.get(url, headers=headers, params=payload)
+            r = self._request('GET', url, params=payload, stream=stream)
 
-        self._logger.info('Called url=%s with headers=%s and parameters=%s', r.url, headers, payload)
+        self._logger.info('Called url=%s with parameters=%s', r.url, payload)
         r.raise_for_status()
+        if stream:  # Parse the result incrementally, fetching it again without streaming on token or transient error
+            return self._iter_result(r, replay=lambda: self._fetch_data(entity_name, id_or_action, filter_type, fields))
         data = r.json()
 
         result_data = {}
@@ -333,23 +437,45 @@ class MarketoClient:
                 result_data = data['result']
             else:
                 for error in data['errors']:
-                    if error['code'] == '602':
-                        self._logger.debug('Token expired, fetching new token to replay request')
-                        self._auth_token = self._get_auth_token()
-                        result_data = self._fetch_data(entity_name, id_or_action, filter_type, fields)
-                    else:
-                        self._logger.error('Error=%s', error['message'])
+                    self._logger.error('Error=%s', error['message'])
 
         return result_data
 
+    def _iter_result(self, r, envelope=None, replay=None):
+        """
+        Parse a streamed response incrementally and yield the records of its result.
+        :param r: The streamed response
+        :param envelope: The dictionary to fill with the other response members (success, errors, nextPageToken...)
+        :param replay: The function returning the result again if the request had no effect because of a token or
+        transient error, the response errors are only logged if not specified
+        :return: A generator of records
+        """
+        envelope = {} if envelope is None else envelope
+        try:
+            for record in iter_json_array(r.iter_content(self.STREAM_CHUNK_SIZE), 'result', envelope):
+                yield record
+        finally:
+            r.close()
+
+        if not envelope.get('success'):
+            errors = envelope.get('errors', [])
+            if replay is not None \
+                    and any(error['code'] in self.TOKEN_ERROR_CODES + self.TRANSIENT_ERROR_CODES for error in errors):
+                self._logger.debug('Streamed request had no effect, replaying it')
+                for record in replay():
+                    yield record
+            else:
+                for error in errors:
+                    self._logger.error('Error=%s', error['message'])
+
     def _push_data(self, entity_name, payload, action=None):
         self._logger.debug('Pushing entity=%s with data=%s%s', entity_name, payload,
                            ' with action=%s' % str(action) if action is not None else '')
 
         url = self._build_url(entity_name, action)
-        headers = {'Authorization': 'Bearer %s' % self._auth_token}
-        r = self._session.post(url, headers=headers, json=payload)  # POST method for creation and update
-        self._logger.info('Called url=%s with headers=%s and body=%s', r.url, headers, payload)
+        # POST method for creation, update and deletion, deletions only can be safely replayed
+        r = self._request('POST', url, replayable=action == 'delete', json=payload)
+        self._logger.info('Called url=%s with body=%s', r.url, payload)
         r.raise_for_status()
         data = r.json()
 
@@ -359,23 +485,17 @@ class MarketoClient:
                 result_data = data['result']
             else:
                 for error in data['errors']:
-                    if error['code'] == '602':
-                        self._logger.debug('Token expired, fetching new token to replay request')
-                        self._auth_token = self._get_auth_token()
-                        result_data = self._push_data(entity_name, data, action)
-                    else:
-                        self._logger.error('Error=%s', error['message'])
+                    self._logger.error('Error=%s', error['message'])
 
         return result_data
 
     def _get_paging_token(self, start_datetime):
         url = self._build_url('activity', 'pagingtoken')
-        headers = {'Authorization': 'Bearer %s' % self._auth_token}
         payload = {
             'sinceDatetime': start_datetime
         }
-        r = self._session.get(url, headers=headers, params=payload)
-        self._logger.info('Called url=%s with headers=%s and parameters=%s', r.url, headers, payload)
+        r = self._request('GET', url, params=payload)
+        self._logger.info('Called url=%s with parameters=%s', r.url, payload)
         r.raise_for_status()
         data = r.json()
         paging_token = ''
@@ -383,6 +503,67 @@ class MarketoClient:
             paging_token = data['nextPageToken']
         return paging_token
 
+    def _request(self, method, url, replayable=False, **kwargs):
+        """
+        Send an authenticated request to the API. A new access token is fetched before the current one expires and the
+        request is replayed once with a new token if Marketo still reports the token as invalid or expired.
+        :param method: The HTTP method
+        :param url: The URL
+        :param replayable: True if the request can be replayed although it is a POST, e.g. a lookup
+        :return: The response
+        """
+        if self._auth_token_expires_at is not None and time.time() >= self._auth_token_expires_at:
+            self._logger.debug('Token expiring, fetching new token')
+            self._auth_token = self._get_auth_token()
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['Authorization'] = 'Bearer %s' % self._auth_token
+        r = self._send(method, url, replayable, headers=headers, **kwargs)
+
+        # A streamed body is not consumed here, token errors are then found once parsed
+        if not kwargs.get('stream') and self._get_error_code(r, self.TOKEN_ERROR_CODES):
+            # The request had no effect, replay it with the same data
+            self._logger.debug('Token expired, fetching new token to replay request')
+            self._auth_token = self._get_auth_token()
+            headers['Authorization'] = 'Bearer %s' % self._auth_token
+            if self._tracer is not None:
+                self._tracer.retrying()
+            r = self._send(method, url, replayable, headers=headers, **kwargs)
+        return r
+
+    def _send(self, method, url, replayable=False, **kwargs):
+        """
+        Send a request, retrying it on transient errors if there is a retry policy.
+        :param method: The HTTP method
+        :param url: The URL
+        :param replayable: True if the request can be replayed although it is a POST, e.g. a lookup
+        :return: The response
+        """
+        send = getattr(self._session, method.lower())
+        if self._retry_policy is None:
+            return send(url, **kwargs)
+        return self._retry_policy.call(lambda: send(url, **kwargs), method,
+                                       lambda response: self._get_transient_error(response, kwargs.get('stream')),
+                                       replayable, self._tracer.retrying if self._tracer is not None else None)
+
+    def _get_transient_error(self, response, stream=False):
+        if response.status_code >= 500:
+            return 'HTTP %d' % response.status_code
+        if stream:  # Do not consume a streamed body, its errors are found once parsed
+            return None
+        return self._get_error_code(response, self.TRANSIENT_ERROR_CODES)
+
+    @staticmethod
+    def _get_error_code(response, error_codes):
+        """
+        Return the first of some error codes found in a response or None.
+        """
+        if response.ok and any('"%s"' % code in response.content for code in error_codes):
+            for error in response.json().get('errors', []):
+                if error['code'] in error_codes:
+                    return error['code']
+        return None
+
     def _build_url(self, entity_name, action=None):
         url = '%s/%s/%s' % (self._api_endpoint, self.API_VERSION, simple_pluralize(entity_name))
         if action:
@@ -11,10 +11,11 @@ class Entity:
     """
     __metaclass__ = ABCMeta  # Define Abstract Base Class
 
-    def __init__(self, client, id_=None, id_field='id', load=True):
+    def __init__(self, client, id_=None, id_field='id', load=True, fields=None):
         self._logger = logging.getLogger(__name__)
         self._client = client  # The class corresponding client instance
         self.id = None  # Entities should always have an id
+        self._requested_fields = fields  # The fields to load besides the fields to update, every field if None
 
         self._load_fields()
 
@@ -80,7 +81,7 @@ class Entity:
         """
         data = {}
         if id_ and id_field:
-            data = self._client.get_entity_data(self.entity_name, id_, id_field, self._fields)
+            data = self._client.get_entity_data(self.entity_name, id_, id_field, self._get_fields_to_load())
             if data:
                 self.init(data)
             else:
@@ -88,6 +89,17 @@ class Entity:
                                      self.entity_name, id_field, id_)
         return data
 
+    def _get_fields_to_load(self):
+        """
+        Return the fields to load: every field unless fields are requested, then the requested fields with the id and
+        the fields to update so that saving the entity does not clear the fields that have not been loaded.
+        :return: A list of field names
+        """
+        if self._requested_fields is None:
+            return self._fields
+        fields_to_load = set(self._requested_fields) | set(self._entity_fields_to_update) | {'id', self._id_field}
+        return [field for field in self._fields if field in fields_to_load]
+
     def init(self, data):
         """
         Initialize the entity with data.
@@ -148,9 +160,7 @@ class Lead(Entity):
         :param start_date: The date to begin retrieving activities from of format 'YYYY-MM-DD'
         :return: A list of activities
         """
-        activity_types = self._client.get_activity_types()
-
-        activity_ids = [type_['id'] for type_ in activity_types if type_['name'] in activities]
+        activity_ids = self._client.get_activity_type_ids(activities)
 
         if not start_date:
             start_datetime = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -159,6 +169,14 @@ class Lead(Entity):
 
         return self._client.get_lead_activities(self.id, activity_ids, start_datetime.isoformat())
 
+    def _get_fields_to_load(self):
+        fields_to_load = super(Lead, self)._get_fields_to_load()
+        if self._requested_fields is not None:
+            # The fields to update depend on the external company id
+            fields_to_load.extend(field for field in ('externalCompanyId', 'website', 'country')
+                                  if field in self._fields and field not in fields_to_load)
+        return fields_to_load
+
     @property
     def _entity_fields_to_update(self):
         field_defaults = {
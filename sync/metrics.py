@@ -0,0 +1,98 @@
+import time
+
+from sync import app
+from .common import pop_cache_stats
+from .common.retry import pop_retry_stats
+
+METRIC_PREFIX = 'sync.'
+
+_last_flush = [time.time()]
+
+
+def task_status(rv):
+    """
+    Summarize a task response to a single status.
+    >>> task_status({'status': 'created', 'id': 1})
+    'created'
+    >>> task_status({'opportunity': {'status': 'skipped', 'id': 1}})
+    'skipped'
+    >>> task_status({'status': ['created', 'created'], 'id': [1, 2]})
+    'created'
+    >>> task_status({'error': 'No lead found'})
+    'error'
+    >>> task_status({'content': 'ok'})
+    'ok'
+    >>> task_status(None)
+    'exception'
+    """
+    if rv is None:
+        return 'exception'
+    if 'error' in rv:
+        return 'error'
+    status = rv.get('status', rv.get('opportunity', {}).get('status', 'ok'))
+    if isinstance(status, list):
+        status = ','.join(sorted(set(status))) or 'none'
+    return status
+
+
+def record_task(task_name, rv, duration, tracer=None):
+    """
+    Send the metrics of a task run to Datadog. Metrics are aggregated in the thread stats and only flushed every
+    DATADOG_FLUSH_INTERVAL seconds.
+    :param task_name: The task name
+    :param rv: The task response or None if the task raised an exception
+    :param duration: The task duration in seconds
+    :param tracer: The call tracer of the task if any
+    """
+    from gae_datadog import t_stats  # Deferred: initializes the Datadog client
+
+    status = task_status(rv)
+    task_tags = ['task:' + task_name]
+    # Count runs per status to get tasks/s and no-op ratios ("skipped" status)
+    t_stats.increment(METRIC_PREFIX + 'task.runs', tags=task_tags + ['status:' + status])
+    t_stats.histogram(METRIC_PREFIX + 'task.duration', duration, tags=task_tags)
+
+    if tracer is not None:
+        summary = tracer.summary()
+        for backend, calls in summary['backends'].items():
+            backend_tags = task_tags + ['backend:' + backend]
+            t_stats.histogram(METRIC_PREFIX + 'task.calls', calls['count'], tags=backend_tags)
+            t_stats.increment(METRIC_PREFIX + 'api.calls', calls['count'], tags=backend_tags)
+            if calls['errors']:
+                t_stats.increment(METRIC_PREFIX + 'api.errors', calls['errors'], tags=backend_tags)
+            if calls['retries']:
+                t_stats.increment(METRIC_PREFIX + 'api.retries', calls['retries'], tags=backend_tags)
+
+        # The Marketo daily quota counts every REST API call, i.e. every call but the identity ones
+        quota_calls = len([trace for trace in tracer.calls
+                           if trace.backend == 'marketo' and not trace.endpoint.startswith('/identity/')])
+        if quota_calls:
+            t_stats.increment(METRIC_PREFIX + 'marketo.quota.calls', quota_calls, tags=task_tags)
+
+        for backend, rate_limit in tracer.rate_limits.items():
+            t_stats.gauge(METRIC_PREFIX + backend + '.ratelimit.remaining', rate_limit['remaining'])
+            if rate_limit['limit']:
+                t_stats.gauge(METRIC_PREFIX + backend + '.ratelimit.headroom',
+                              float(rate_limit['remaining']) / rate_limit['limit'])
+
+    for cache_name, accesses in pop_cache_stats().items():
+        cache_tags = ['cache:' + cache_name]
+        for access in ('hits', 'misses'):
+            if accesses[access]:
+                t_stats.increment(METRIC_PREFIX + 'cache.' + access, accesses[access], tags=cache_tags)
+
+    # Retries of the instance, including calls retried or given up in other tasks since the last record
+    for backend, outcomes in pop_retry_stats().items():
+        for outcome, count in outcomes.items():
+            t_stats.increment(METRIC_PREFIX + 'retry.' + outcome, count, tags=['backend:' + backend])
+
+    now = time.time()
+    if now - _last_flush[0] >= app.config.get('DATADOG_FLUSH_INTERVAL', 10):
+        _last_flush[0] = now
+        t_stats.flush()
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -1,8 +1,12 @@
 import logging
+import sys
+import threading
 
 from requests import HTTPError, Session
 
-from sync.common import memoize, simple_pluralize
+from sync.common import TTLCache, memoize, simple_pluralize
+from sync.common.ratelimit import RateLimitedAdapter
+from sync.common.streaming import iter_json_array
 
 
 class PipedriveClient:
@@ -11,13 +15,27 @@ class PipedriveClient:
     """
 
     API_ENDPOINT = 'https://api.pipedrive.com/v1'
+    STREAM_CHUNK_SIZE = 64 * 1024  # Bytes read at once from streamed responses
+    PAGE_SIZE = 100  # Entities per page of the lists, Pipedrive allows up to 500
 
-    def __init__(self, api_token):
+    # Pipelines and stages rarely change: cache them per API endpoint for every client of the process
+    _pipelines = TTLCache('get_pipelines', 3600)
+    _stages = TTLCache('get_stages', 3600)
+
+    def __init__(self, api_token, api_endpoint=None, tracer=None, rate_limiter=None, retry_policy=None):
         self._logger = logging.getLogger(__name__)
         self._memo = {}  # The class cache
 
+        self._api_endpoint = api_endpoint or self.API_ENDPOINT
+
         self._session = Session()  # Reuse session for better performance within a single instance of the client
         self._session.params = {'api_token': api_token}
+        self._tracer = tracer
+        if tracer is not None:  # Optional call tracer
+            tracer.attach(self._session, 'pipedrive')
+        if rate_limiter is not None:  # Optional rate limiter shared with the other clients
+            self._session.mount(self._api_endpoint, RateLimitedAdapter(rate_limiter))
+        self._retry_policy = retry_policy  # Optional retry policy for transient errors
 
     @memoize(method_name='get_entity_fields')
     def get_entity_fields(self, entity_name):
@@ -28,6 +46,30 @@ class PipedriveClient:
         """
         return self._fetch_data(entity_name + 'Fields')
 
+    def get_pipelines(self, refresh=False):
+        """
+        Return the pipelines loaded from Pipedrive.
+        :param refresh: True to reload the pipelines, e.g. when looking for a pipeline created since they were loaded
+        :return: A dictionary of pipeline ids mapped against their data (name, order_nr...)
+        """
+        if refresh:
+            self._pipelines.discard(self._api_endpoint)
+        return self._pipelines.get(self._api_endpoint, lambda: self._index_by_id(self._fetch_data('pipelines')))
+
+    def get_stages(self, refresh=False):
+        """
+        Return the stages of every pipeline loaded from Pipedrive.
+        :param refresh: True to reload the stages, e.g. when looking for a stage created since they were loaded
+        :return: A dictionary of stage ids mapped against their data (name, order_nr, deal_probability, pipeline_id...)
+        """
+        if refresh:
+            self._stages.discard(self._api_endpoint)
+        return self._stages.get(self._api_endpoint, lambda: self._index_by_id(self._fetch_data('stages')))
+
+    @staticmethod
+    def _index_by_id(data_array):
+        return dict((data['id'], data) for data in data_array or [])
+
     def get_entity_flow(self, entity_name, entity_id):
         """
         Return the entity list of updates loaded from Pipedrive.
@@ -37,15 +79,105 @@ class PipedriveClient:
         """
         return self._fetch_data(simple_pluralize(entity_name), '%s/flow' % entity_id)
 
-    def get_entity_data(self, entity_name, entity_id, entity_fields=None):
+    def get_entity_participants(self, entity_name, entity_id):
+        """
+        Return the entity participants loaded from Pipedrive page by page.
+        :param entity_name: The entity name (should be the same as the class name), e.g. deal
+        :param entity_id: The entity id
+        :return: A generator of participants, each holding the participant person data in person
+        """
+        return self.iter_entities(entity_name, id_or_action='%s/participants' % entity_id)
+
+    def get_entity_data(self, entity_name, entity_id, entity_fields=None, stream=False):
         """
         Return an entity data loaded from Pipedrive.
         :param entity_name: The entity name (should be the same as the class name)
         :param entity_id: The entity id
         :param entity_fields: The entity fields to return, default if not specified
+        :param stream: True to parse a list of entities incrementally and return a generator holding one at a time
         :return: A dictionary of field keys mapped against their value for the entity
         """
-        return self._fetch_data(simple_pluralize(entity_name), entity_id, entity_fields)
+        return self._fetch_data(simple_pluralize(entity_name), entity_id, entity_fields, stream)
+
+    def iter_entities(self, entity_name, params=None, page_size=None, prefetch=False, stream=False, id_or_action=None):
+        """
+        Return the entities of a list loaded from Pipedrive page by page, up to the last page.
+        :param entity_name: The entity name (should be the same as the class name), e.g. person, deal, note, activity
+        :param params: The list parameters, e.g. filter_id, deal_id or sort
+        :param page_size: The number of entities per page, PAGE_SIZE if not specified
+        :param prefetch: True to load the next page in the background while the current page is consumed
+        :param stream: True to parse each page incrementally so that a single entity is held at a time (the next page
+        cannot be prefetched then as the pagination data comes after the entities)
+        :param id_or_action: The entity id and list to load from the entity, e.g. 10/participants, the entities
+        themselves if not specified
+        :return: A generator of dictionaries of field keys mapped against their value for each entity
+        """
+        if prefetch and stream:
+            raise ValueError('Streamed pages cannot be prefetched')
+        limit = page_size or self.PAGE_SIZE
+        start = 0
+        next_page = None
+        while start is not None:
+            if next_page is not None:
+                records, envelope = next_page()
+            else:
+                records, envelope = self._fetch_page(entity_name, params, start, limit, stream, id_or_action)
+            if prefetch:
+                start = self._get_next_start(envelope)
+                next_page = self._prefetch_page(entity_name, params, start, limit, id_or_action) \
+                    if start is not None else None
+            for record in records:
+                yield record
+            if not prefetch:
+                start = self._get_next_start(envelope)
+
+    def _fetch_page(self, entity_name, params, start, limit, stream=False, id_or_action=None):
+        """
+        Return a page of entities.
+        :return: A list (a generator if streamed) of entity data and the response envelope holding the pagination data
+        (once the entities are consumed if streamed)
+        """
+        url = self._build_url(simple_pluralize(entity_name), id_or_action)
+        payload = dict(params or {}, start=start, limit=limit)
+        r = self._request('GET', url, params=payload, stream=stream)
+        self._logger.info('Called url=%s with parameters=%s', r.url, payload)
+        r.raise_for_status()
+        if stream:
+            envelope = {}
+            return self._iter_data(r, envelope), envelope
+        envelope = r.json()
+        if envelope.get('success') is False:
+            self._logger.error('Error=%s', envelope.get('error'))
+        return envelope.pop('data', None) or [], envelope
+
+    def _prefetch_page(self, entity_name, params, start, limit, id_or_action=None):
+        """
+        Start loading a page of entities in the background.
+        :return: The function waiting for the page and returning it as "_fetch_page" does
+        """
+        outcome = {}
+
+        def fetch():
+            try:
+                outcome['page'] = self._fetch_page(entity_name, params, start, limit, id_or_action=id_or_action)
+            except Exception:
+                outcome['error'] = sys.exc_info()
+
+        thread = threading.Thread(target=fetch)
+        thread.start()
+
+        def wait():
+            thread.join()
+            if 'error' in outcome:
+                raise outcome['error'][0], outcome['error'][1], outcome['error'][2]
+            return outcome['page']
+
+        return wait
+
+    @staticmethod
+    def _get_next_start(envelope):
+        pagination = (envelope.get('additional_data') or {}).get('pagination') or {}
+        return pagination.get('next_start') if pagination.get('more_items_in_collection') else None
 
     def put_entity_data(self, entity_name, entity_data, entity_id=None):
         """
@@ -71,7 +203,7 @@ class PipedriveClient:
 
             url = self._build_url(simple_pluralize(entity_name), id_)
 
-            r = self._session.delete(url)
+            r = self._request('DELETE', url)
             self._logger.info('Called url=%s', r.url)
             try:
                 r.raise_for_status()
@@ -91,7 +223,7 @@ class PipedriveClient:
 
         return return_data
 
-    def _fetch_data(self, entity_name, id_or_action=None, fields=None):
+    def _fetch_data(self, entity_name, id_or_action=None, fields=None, stream=False):
         self._logger.debug('Fetching entity=%s%s%s', entity_name,
                            ' (fields=%s)' % fields if fields is not None else '',
                            ' with id/action=%s' % id_or_action.encode('utf-8') if isinstance(id_or_action, unicode)
@@ -99,9 +231,11 @@ class PipedriveClient:
 
         url = self._build_url(entity_name, id_or_action)
         payload = fields or {}
-        r = self._session.get(url, params=payload)
+        r = self._request('GET', url, params=payload, stream=stream)
         self._logger.info('Called url=%s with parameters=%s', r.url, payload)
         r.raise_for_status()
+        if stream:
+            return self._iter_data(r)
         data = r.json()
 
         result_data = {}
@@ -113,15 +247,32 @@ class PipedriveClient:
 
         return result_data
 
+    def _iter_data(self, r, envelope=None):
+        """
+        Parse a streamed response incrementally and yield the records of its data.
+        :param r: The streamed response
+        :param envelope: The dictionary to fill with the other response members (success, error, additional_data...)
+        :return: A generator of records
+        """
+        envelope = {} if envelope is None else envelope
+        try:
+            for record in iter_json_array(r.iter_content(self.STREAM_CHUNK_SIZE), 'data', envelope):
+                yield record
+        finally:
+            r.close()
+
+        if envelope.get('success') is False:
+            self._logger.error('Error=%s', envelope.get('error'))
+
     def _push_data(self, entity_name, data, id_or_action=None):
         self._logger.debug('Pushing entity=%s with data=%s', entity_name, data)
         self._logger.debug(' with id/action=%s' % str(id_or_action) if id_or_action is not None else '')
         url = self._build_url(entity_name, id_or_action)
 
         if not id_or_action:  # Create
-            r = self._session.post(url, data=data)
+            r = self._request('POST', url, data=data)
         else:  # Update
-            r = self._session.put(url, json=data)
+            r = self._request('PUT', url, json=data)
 
         self._logger.info('Called url=%s with body=%s', r.url, data)
         r.raise_for_status()
@@ -145,9 +296,9 @@ class PipedriveClient:
         url = self._build_url(entity_name, id_or_action)
 
         if not id_or_action:  # Create
-            r = self._session.post(url, json=data)
+            r = self._request('POST', url, json=data)
         else:  # Update
-            r = self._session.put(url, json=data)
+            r = self._request('PUT', url, json=data)
         self._logger.info('Called url=%s with body=%s', r.url, data)
         r.raise_for_status()
         data = r.json()
@@ -161,8 +312,28 @@ class PipedriveClient:
 
         return result_data
 
+    def _request(self, method, url, **kwargs):
+        """
+        Send a request to the API, retrying it on transient errors if there is a retry policy.
+        :param method: The HTTP method
+        :param url: The URL
+        :return: The response
+        """
+        send = getattr(self._session, method.lower())
+        if self._retry_policy is None:
+            return send(url, **kwargs)
+        return self._retry_policy.call(lambda: send(url, **kwargs), method,
+                                       self._get_transient_error, False,
+                                       self._tracer.retrying if self._tracer is not None else None)
+
+    @staticmethod
+    def _get_transient_error(response):
+        if response.status_code >= 500 or response.status_code == 429:  # The rate limiter delays the retry of a 429
+            return 'HTTP %d' % response.status_code
+        return None
+
     def _build_url(self, entity_name, id_or_action=None):
-        url = self.API_ENDPOINT + '/' + entity_name
+        url = self._api_endpoint + '/' + entity_name
         if id_or_action:
             url += '/' + str(id_or_action)
         return url
@@ -13,9 +13,13 @@ class Entity:
     """
     __metaclass__ = ABCMeta  # Define Abstract Base Class
 
-    def __init__(self, client, id_=None, id_field='id', load=True):
+    def __init__(self, client, id_=None, id_field='id', load=True, fields=None):
         self._logger = logging.getLogger(__name__)
         self._client = client  # The class corresponding client instance
+        # The names or keys of the fields to load, every field if None. Pipedrive API always returns whole entities so
+        # the other fields are dropped: they are neither initialized nor saved
+        self._requested_fields = frozenset(fields) if fields is not None else None
+        self._field_keys_to_load = None
         self.id = None  # Entities should always have an id
 
         self._load_fields()
@@ -67,6 +71,11 @@ class Entity:
 
                 return attr
 
+            elif field_name in self.__dict__.get('_field_types', {}):
+                # Field not loaded: tell it apart from an empty field
+                raise AttributeError('Field with key=%s not loaded for entity=%s: add it to the requested fields'
+                                     % (field_name, self.entity_name))
+
             else:
                 raise AttributeError('No attribute found with name=%s' % field_name)
 
@@ -110,6 +119,8 @@ class Entity:
         data = {}
         for field_name in self._field_keys:
             field_key = self._field_keys[field_name]
+            if self._field_keys_to_load is not None and field_key not in self.__dict__:
+                continue  # Field neither loaded nor set: keep its value in Pipedrive
             attr = getattr(self, field_key)
             if attr is None or attr == '':
                 attr = self._field_defaults.get(field_key, attr)
@@ -161,10 +172,22 @@ class Entity:
                     for option in field['options']:
                         self._field_options[field_key][option['id']] = option['label']
 
-                setattr(self, field_key, None)  # Initialize field
+            self._field_keys_to_load = self._get_field_keys_to_load()
+            for field_key in self._field_types:
+                if self._field_keys_to_load is None or field_key in self._field_keys_to_load:
+                    setattr(self, field_key, None)  # Initialize field
         else:
             raise InitializationError('Load fields', 'No data returned for entity={}', self.entity_name)
 
+    def _get_field_keys_to_load(self):
+        """
+        Return the keys of the fields to load.
+        :return: A set of field keys, None to load all fields
+        """
+        if self._requested_fields is None:
+            return None
+        return frozenset(self._field_keys.get(field, field) for field in self._requested_fields) | {'id'}
+
     def _load(self, id_, id_field):
         """
         Load and initialize entity data from Pipedrive.
@@ -201,7 +224,8 @@ class Entity:
         :param data: Data to initialize the entity with
         """
         for key in data:
-            setattr(self, key, data[key])
+            if self._field_keys_to_load is None or key in self._field_keys_to_load:
+                setattr(self, key, data[key])
 
     def _find_by_name(self, name):
         """
@@ -395,10 +419,11 @@ class Note(Entity):
     def _load(self, id_, id_field):
         if id_ and id_field in ('user_id', 'deal_id', 'person_id', 'org_id'):
             try:
-                data = self._client.get_entity_data(self.entity_name, None, {id_field: id_})
+                # Always load last note: only ask for the first one of the notes sorted newest first
+                data = self._client.get_entity_data(self.entity_name, None,
+                                                    {id_field: id_, 'sort': 'add_time DESC, id DESC', 'limit': 1})
                 if data:
-                    # Always load last note
-                    self.init(data[len(data) - 1])
+                    self.init(data[0])
                 else:
                     self._logger.warning('No data could be loaded for entity=%s for %s=%s',
                                          self.entity_name, id_field, id_)
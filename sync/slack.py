@@ -0,0 +1,130 @@
+"""
+Slack notifications posted by the worker from the "notify" queue so that Slack latency and failures neither hold up nor
+retry the synchronization tasks.
+"""
+import hashlib
+import threading
+import time
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from sync import app
+from .common import TTLCache
+from .util import NOTIFY_QUEUE, SlackMessage
+
+DIGEST_MAX_ATTACHMENTS = 20  # Attachments posted per message, as Slack advises
+
+# Slack text of the notes per content hash, as the status and note notifications of a deal often render the same note
+_note_texts = TTLCache('render_note', 3600, max_size=256)
+
+_session = None  # HTTP session shared by the Slack calls of the instance so that connections are reused
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the HTTP session of the Slack calls, creating it on first use.
+    :return: The session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests  # Imported on first use to keep instance startup fast
+            _session = requests.Session()
+        return _session
+
+
+def render_note(content):
+    """
+    Return the Slack text of a note content. Only notes with HTML tags or entities are converted with html2text.
+    :param content: The note content
+    :return: The note text
+    """
+    if not content:
+        return ''
+    if '<' not in content and '&' not in content:  # Plain text
+        return content
+    key = hashlib.sha1(content.encode('utf-8') if isinstance(content, unicode) else content).hexdigest()
+    return _note_texts.get(key, lambda: _html_to_text(content))
+
+
+def _html_to_text(html):
+    import html2text  # Imported on first use to keep instance startup fast
+    return html2text.html2text(html)
+
+
+def post_message(payload):
+    """
+    Post a message on Slack.
+    :param payload: The message payload
+    :return: The Slack response content
+    """
+    r = get_session().post(app.config['SLACK_WEBHOOK_URL'], json=payload)
+    r.raise_for_status()
+    return r.content
+
+
+def send_message(payload, channels=(None,)):
+    """
+    Queue a message to post on Slack. Every channel is posted by its own task so that the channels are posted in
+    parallel and a failed post is retried alone.
+    :param payload: The message payload
+    :param channels: The channels to post the message to, None for the default channel of the webhook
+    :return: The ids of the queued messages
+    """
+    messages = [SlackMessage(payload=dict(payload, channel=channel) if channel else payload) for channel in channels]
+    keys = ndb.put_multi(messages)
+    taskqueue.Queue(NOTIFY_QUEUE).add([taskqueue.Task(url='/task/send_slack_message', target='worker',
+                                                     params={'id': key.id()}) for key in keys])
+    return [key.id() for key in keys]
+
+
+def send_deal_digest_message(deal_id, payload, delay):
+    """
+    Queue a message about a deal to post on Slack together with the other messages queued for the deal within some
+    seconds.
+    :param deal_id: The deal id
+    :param payload: The message payload
+    :param delay: The number of seconds to wait for other messages before posting the digest
+    :return: The id of the queued message
+    """
+    key = SlackMessage(parent=SlackMessage.digest_key('deal:%s' % deal_id), payload=payload).put()
+    try:
+        # A single task per deal and period of "delay" seconds
+        taskqueue.add(url='/task/send_slack_deal_digest', target='worker', queue_name=NOTIFY_QUEUE,
+                      params={'id': deal_id}, countdown=delay,
+                      name='slack-deal-digest-%s-%d' % (deal_id, time.time() // delay))
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass  # The message will be posted by the digest already scheduled
+    return key.id()
+
+
+def post_queued_message(message_id):
+    """
+    Post a queued message on Slack.
+    :param message_id: The message id
+    :return: The Slack response content, None if the message has already been posted
+    """
+    message = SlackMessage.get_by_id(message_id)
+    if message is None:
+        return None
+    content = post_message(message.payload)
+    message.key.delete()
+    return content
+
+
+def post_deal_digest(deal_id):
+    """
+    Post the messages queued for a deal on Slack as a digest of their attachments.
+    :param deal_id: The deal id
+    :return: The number of messages posted
+    """
+    messages = SlackMessage.query(ancestor=SlackMessage.digest_key('deal:%s' % deal_id)).fetch()
+    messages.sort(key=lambda message: message.created)
+    for i in range(0, len(messages), DIGEST_MAX_ATTACHMENTS):
+        batch = messages[i:i + DIGEST_MAX_ATTACHMENTS]
+        attachments = [attachment for message in batch for attachment in message.payload.get('attachments', [])]
+        post_message(dict(batch[0].payload, attachments=attachments))
+        ndb.delete_multi([message.key for message in batch])  # Posted messages are not posted again on retry
+    return len(messages)
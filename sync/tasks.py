@@ -1,11 +1,25 @@
-import html2text
-import requests
+from datetime import datetime
 
 import mappings
 import marketo
 import pipedrive
+import slack
 
-from sync import app, get_marketo_client, get_pipedrive_client
+from sync import app, g, get_marketo_client, get_pipedrive_client
+from .common import SavingError, SharedCalls
+from .common.batch import ConcurrentSaver
+from .pipedrive.helpers import to_snake_case
+from .util import IdentityLink, Watermark, WebhookFilter
+
+LEAD_BATCH_SIZE = 300  # Maximum number of filter values accepted by Marketo
+ROLE_BATCH_SIZE = 300  # Maximum number of records accepted by Marketo per call
+EMAIL_SENT_PAGE_SIZE = 300  # Email sent activities synchronized and checkpointed at once by the catch-up job
+EMAIL_SENT_MAX_ATTEMPTS = 5  # Runs of the catch-up job trying to save an Email sent activity before giving it up
+SYSTEM_FIELD_KEYS = ['active_flag', 'id', 'owner_id']  # Read by the mappings, not always listed by the fields API
+ORGANIZATION_SYNC_TIMEOUT = 60  # Seconds a task waits for the synchronization of its organization by another task
+
+# Organization synchronizations per company external id, shared by the tasks resolving the same company at once
+_organization_syncs = SharedCalls('resolve_organization_in_pipedrive', ORGANIZATION_SYNC_TIMEOUT)
 
 
 def create_or_update_person_in_pipedrive(lead_id):
@@ -17,10 +31,11 @@ def create_or_update_person_in_pipedrive(lead_id):
     :return: A custom response object containing the synchronized entity status and id
     """
     app.logger.info('Fetching lead data from Marketo with id=%s', str(lead_id))
-    lead = marketo.Lead(get_marketo_client(), lead_id)
+    lead = marketo.Lead(get_marketo_client(), lead_id, fields=mappings.PERSON_TO_LEAD_SOURCE_FIELDS)
 
     if lead.id is not None:
-        person = pipedrive.Person(get_pipedrive_client(), lead.pipedriveId)
+        person_id = lead.pipedriveId or IdentityLink.get_linked_id('lead', lead.id)
+        person = pipedrive.Person(get_pipedrive_client(), person_id, fields=mappings.PERSON_TO_LEAD)
         if person.id is None:
             app.logger.info('New person created')
             status = 'created'
@@ -47,6 +62,9 @@ def create_or_update_person_in_pipedrive(lead_id):
             app.logger.info('Nothing to do in Pipedrive for person with id=%s', person.id)
             status = 'skipped'
 
+        if person.id is not None:  # Up-to-date or not, so that the next tasks load it directly
+            IdentityLink.link('person', person.id, 'lead', lead.id)
+
         response = {
             'status': status,
             'id': person.id
@@ -98,7 +116,8 @@ def create_or_update_organization_in_pipedrive(company_external_id):
     :return: A custom response object containing the synchronized entity status and id
     """
     app.logger.info('Fetching company data from Marketo with external_id=%s', str(company_external_id))
-    company = marketo.Company(get_marketo_client(), company_external_id, 'externalCompanyId')
+    company = marketo.Company(get_marketo_client(), company_external_id, 'externalCompanyId',
+                              fields=mappings.ORGANIZATION_TO_COMPANY_SOURCE_FIELDS | {'website'})
 
     if company.id is not None:
         organization = find_organization_in_pipedrive(company)
@@ -124,6 +143,9 @@ def create_or_update_organization_in_pipedrive(company_external_id):
             app.logger.info('Nothing to do in Pipedrive for organization with id=%s', organization.id)
             status = 'skipped'
 
+        if organization.id is not None:  # Up-to-date or not, so that the next tasks load it directly
+            IdentityLink.link('organization', organization.id, 'company', company.id)
+
         response = {
             'status': status,
             'id': organization.id
@@ -139,18 +161,48 @@ def create_or_update_organization_in_pipedrive(company_external_id):
     return response
 
 
+def resolve_organization_in_pipedrive(company_external_id):
+    """
+    Return the id of the organization synchronized from a company, synchronizing it once per task.
+    Concurrent tasks resolving the same company wait for the running synchronization and reuse its result, the next
+    tasks synchronize it again so that the company changes reach the organization.
+    :param company_external_id: The company external id
+    :return: The organization id or None if the company could not be synchronized
+    """
+    if not hasattr(g, 'organization_ids'):
+        g.organization_ids = {}  # Organization ids per company external id resolved by the current task
+    if company_external_id not in g.organization_ids:
+        organization_id = _organization_syncs.call(
+            company_external_id, lambda: create_or_update_organization_in_pipedrive(company_external_id).get('id'))
+        if organization_id is None:
+            return None  # The company may be created in the meantime
+        g.organization_ids[company_external_id] = organization_id
+    return g.organization_ids[company_external_id]
+
+
 def find_organization_in_pipedrive(company):
     # Search for the organization in Pipedrive
-    # Try by id
+    # Try linked organization first
+    organization_id = IdentityLink.get_linked_id('company', company.id)
+    if organization_id is not None:
+        app.logger.debug('Trying to fetch linked organization data from Pipedrive with id=%s', organization_id)
+        organization = pipedrive.Organization(get_pipedrive_client(), organization_id,
+                                              fields=mappings.ORGANIZATION_TO_COMPANY)
+        if organization.id is not None:
+            return organization
+    # Then by id
     app.logger.debug('Trying to fetch organization data from Pipedrive with marketo_id=%s', company.id)
-    organization = pipedrive.Organization(get_pipedrive_client(), company.id, 'marketoid')
+    organization = pipedrive.Organization(get_pipedrive_client(), company.id, 'marketoid',
+                                          fields=mappings.ORGANIZATION_TO_COMPANY)
     if organization.id is None:  # Then name
         app.logger.debug('Trying to fetch organization data from Pipedrive with name=%s', company.company)
-        organization = pipedrive.Organization(get_pipedrive_client(), company.company, 'name')
+        organization = pipedrive.Organization(get_pipedrive_client(), company.company, 'name',
+                                              fields=mappings.ORGANIZATION_TO_COMPANY)
     if organization.id is None:  # Finally Email domain
         app.logger.debug('Trying to fetch organization data from Pipedrive with email_domain=%s',
                       company.website)
-        organization = pipedrive.Organization(get_pipedrive_client(), company.website, 'email_domain')
+        organization = pipedrive.Organization(get_pipedrive_client(), company.website, 'email_domain',
+                                              fields=mappings.ORGANIZATION_TO_COMPANY)
     return organization
 
 
@@ -163,10 +215,12 @@ def create_or_update_lead_in_marketo(person_id):
     :return: A custom response object containing the synchronized entity status and id
     """
     app.logger.info('Fetching person data from Pipedrive with id=%s', str(person_id))
-    person = pipedrive.Person(get_pipedrive_client(), person_id)
+    person = pipedrive.Person(get_pipedrive_client(), person_id,
+                              fields=mappings.LEAD_TO_PERSON_SOURCE_FIELDS | {'marketoid'})
 
     if person.id is not None:
-        lead = marketo.Lead(get_marketo_client(), person.marketoid)
+        lead_id = person.marketoid or IdentityLink.get_linked_id('person', person.id)
+        lead = marketo.Lead(get_marketo_client(), lead_id, fields=mappings.LEAD_TO_PERSON)
         if lead.id is None:
             app.logger.info('New lead created')
             status = 'created'
@@ -193,6 +247,9 @@ def create_or_update_lead_in_marketo(person_id):
             app.logger.info('Nothing to do in Marketo for lead with id=%s', lead.id)
             status = 'skipped'
 
+        if lead.id is not None:  # Up-to-date or not, so that the next tasks load it directly
+            IdentityLink.link('person', person.id, 'lead', lead.id)
+
         response = {
             'status': status,
             'id': lead.id
@@ -218,7 +275,8 @@ def create_or_update_company_in_marketo(organization_id):
     :return: A custom response object containing the synchronized entity status and id
     """
     app.logger.info('Fetching organization data from Pipedrive with id=%s', str(organization_id))
-    organization = pipedrive.Organization(get_pipedrive_client(), organization_id)
+    organization = pipedrive.Organization(get_pipedrive_client(), organization_id,
+                                          fields=mappings.COMPANY_TO_ORGANIZATION_SOURCE_FIELDS | {'marketoid'})
 
     if organization.id is not None:
         company = find_company_in_marketo(organization)
@@ -258,6 +316,9 @@ def create_or_update_company_in_marketo(organization_id):
                          company.externalCompanyId)
             status = 'skipped'
 
+        if company.id is not None:  # Up-to-date or not, so that the next tasks load it directly
+            IdentityLink.link('organization', organization.id, 'company', company.id)
+
         response = {
             'status': status,
             'id': company.id,
@@ -276,16 +337,25 @@ def create_or_update_company_in_marketo(organization_id):
 
 def find_company_in_marketo(organization):
     # Search for the company in Marketo
-    # Try id
+    # Try linked company first
+    company_id = IdentityLink.get_linked_id('organization', organization.id)
+    if company_id is not None:
+        app.logger.debug('Trying to fetch linked company data from Marketo with id=%s', company_id)
+        company = marketo.Company(get_marketo_client(), company_id, fields=mappings.COMPANY_TO_ORGANIZATION)
+        if company.id is not None:
+            return company
+    # Then id
     app.logger.debug('Trying to fetch company data from Marketo with id=%s', organization.marketoid)
-    company = marketo.Company(get_marketo_client(), organization.marketoid)
+    company = marketo.Company(get_marketo_client(), organization.marketoid, fields=mappings.COMPANY_TO_ORGANIZATION)
     if company.id is None:  # Then external id  # TODO remove because useless?
         company_external_id = marketo.compute_external_id('organization', organization.id)
         app.logger.debug('Trying to fetch company data from Marketo with external_id=%s', company_external_id)
-        company = marketo.Company(get_marketo_client(), company_external_id, 'externalCompanyId')
+        company = marketo.Company(get_marketo_client(), company_external_id, 'externalCompanyId',
+                                  fields=mappings.COMPANY_TO_ORGANIZATION)
     if company.id is None:  # Finally name
         app.logger.debug('Trying to fetch company data from Marketo with name=%s', organization.name)
-        company = marketo.Company(get_marketo_client(), organization.name, 'company')
+        company = marketo.Company(get_marketo_client(), organization.name, 'company',
+                                  fields=mappings.COMPANY_TO_ORGANIZATION)
     return company
 
 
@@ -296,7 +366,7 @@ def delete_lead_in_marketo(pipedrive_marketo_id):
     :return: A custom response object containing the synchronized entity status and id
     """
     app.logger.info('Deleting person in Marketo with id=%s', str(pipedrive_marketo_id))
-    lead = marketo.Lead(get_marketo_client(), pipedrive_marketo_id)
+    lead = marketo.Lead(get_marketo_client(), pipedrive_marketo_id, fields=[])  # Only the fields to update
 
     if lead.id is not None:
         lead.toDelete = True
@@ -338,13 +408,12 @@ def create_or_update_opportunity_in_marketo(deal_id):
     if deal.id is not None:
 
         # Filter deals
-        pipeline = pipedrive.Pipeline(get_pipedrive_client(), deal.pipeline_id)
-        if pipeline.name in mappings.PIPELINE_FILTER_NAMES:
+        if is_pipeline_synchronized(deal.pipeline_id):
 
             # Opportunity
             opportunity_external_id = marketo.compute_external_id('deal', deal.id)
             opportunity = marketo.Opportunity(get_marketo_client(), opportunity_external_id,
-                                              'externalOpportunityId')
+                                              'externalOpportunityId', fields=mappings.OPPORTUNITY_TO_DEAL)
 
             data_changed = False
             if opportunity.id is None:
@@ -380,22 +449,14 @@ def create_or_update_opportunity_in_marketo(deal_id):
                 }
             }
 
-            # Role
-            if deal.contact_person and deal.contact_person.marketoid:  # Ensure person has been synced # TODO create if not?
-                # Role will automatically be created or updated using these 3 fields ("dedupeFields")
-                role = marketo.Role(get_marketo_client())
-                role.externalOpportunityId = opportunity.externalOpportunityId
-                role.leadId = deal.contact_person.marketoid
-                role.role = deal.champion.title if deal.champion and deal.champion.title else 'Default Role'
-                role.isPrimary = deal.champion and deal.champion.marketoid == role.leadId
-                app.logger.info(
-                    'Sending deal data with id=%s to Marketo for role with (externalOpportunityId=%s, leadId=%s, role=%s)',
-                    str(deal_id), role.externalOpportunityId, role.leadId, role.role)
-                role.save()
-                response['role'] = {'id': role.id}
+            # Roles
+            roles = compute_roles(deal, opportunity)
+            if roles:
+                response['roles'] = save_roles_in_marketo(roles)
 
         else:
-            message = 'Deal synchronization with id=%s not enabled for pipeline=%s' % (deal_id, pipeline.name)
+            message = 'Deal synchronization with id=%s not enabled for pipeline=%s' \
+                      % (deal_id, get_pipeline_name(deal.pipeline_id))
             app.logger.info(message)
             response = {
                 'status': 'skipped',
@@ -412,6 +473,98 @@ def create_or_update_opportunity_in_marketo(deal_id):
     return response
 
 
+def get_pipeline_name(pipeline_id):
+    """
+    Return the name of a pipeline from the pipelines cached for the whole process, reloading them if it is unknown.
+    :param pipeline_id: The pipeline id
+    :return: The pipeline name or None if there is no such pipeline
+    """
+    pipelines = get_pipedrive_client().get_pipelines()
+    if pipeline_id not in pipelines:  # The pipeline may have been created since the pipelines were loaded
+        pipelines = get_pipedrive_client().get_pipelines(refresh=True)
+    return pipelines[pipeline_id]['name'] if pipeline_id in pipelines else None
+
+
+def is_pipeline_synchronized(pipeline_id):
+    """
+    Return whether the deals of a pipeline are synchronized, i.e. whether its name is a filtered pipeline name.
+    :param pipeline_id: The pipeline id
+    :return: True if the deals of the pipeline are synchronized
+    """
+    return get_pipeline_name(pipeline_id) in mappings.PIPELINE_FILTER_NAMES
+
+
+def compute_roles(deal, opportunity):
+    """
+    Compute the opportunity roles of a deal, i.e. the roles of the deal contact person and participants that have been
+    synchronized with a lead.
+    :param deal: The deal
+    :param opportunity: The opportunity synchronized with the deal
+    :return: A list of roles to save
+    """
+    roles = []
+    if deal.contact_person and deal.contact_person.marketoid:  # Ensure person has been synced # TODO create if not?
+        role = create_role(opportunity, deal.contact_person.marketoid,
+                           deal.champion.title if deal.champion and deal.champion.title else 'Default Role')
+        role.isPrimary = deal.champion and deal.champion.marketoid == role.leadId
+        roles.append(role)
+
+    if getattr(deal, 'participants_count', None) != 0:  # Spare the call when the deal has no participants
+        lead_ids = set(role.leadId for role in roles)  # The contact person is usually a participant too
+        for participant in get_pipedrive_client().get_entity_participants('deal', deal.id):
+            # The participant person data comes with the participant: no need to load it
+            person = pipedrive.Person(get_pipedrive_client(), fields=['marketoid'])
+            person.init(participant.get('person') or {})
+            if person.marketoid and person.marketoid not in lead_ids:
+                lead_ids.add(person.marketoid)
+                roles.append(create_role(opportunity, person.marketoid, 'Default Role'))
+    return roles
+
+
+def create_role(opportunity, lead_id, role_name):
+    """
+    Create an opportunity role. It will automatically be created or updated in Marketo using its 3 fields
+    externalOpportunityId, leadId and role ("dedupeFields").
+    :param opportunity: The opportunity
+    :param lead_id: The lead id
+    :param role_name: The role name
+    :return: The role to save
+    """
+    role = marketo.Role(get_marketo_client())
+    role.externalOpportunityId = opportunity.externalOpportunityId
+    role.leadId = lead_id
+    role.role = role_name
+    return role
+
+
+def save_roles_in_marketo(roles):
+    """
+    Save (i.e. create or update) opportunity roles in Marketo with one call per ROLE_BATCH_SIZE roles, whether they
+    belong to one or several deals. A skipped role does not prevent the other ones from being saved.
+    :param roles: The roles to save
+    :return: A list of custom response objects containing each role status and id
+    """
+    responses = []
+    for i in range(0, len(roles), ROLE_BATCH_SIZE):
+        batch = roles[i:i + ROLE_BATCH_SIZE]
+        for role in batch:
+            app.logger.info('Sending role with (externalOpportunityId=%s, leadId=%s, role=%s) to Marketo',
+                            role.externalOpportunityId, role.leadId, role.role)
+        get_marketo_client().put_entities(batch[0].entity_name, batch)
+        for role in batch:
+            status = getattr(role, 'status', None)  # Set from the role result
+            if status is None:
+                # Fail the task so that it is retried rather than losing the role
+                raise SavingError('Save entities', 'No result returned for entity=role with '
+                                                   '(externalOpportunityId={}, leadId={})',
+                                  role.externalOpportunityId, role.leadId)
+            responses.append({
+                'status': status,
+                'id': role.id
+            })
+    return responses
+
+
 def create_activity_in_pipedrive(lead_id):
     """
     Create an activity in Pipedrive.
@@ -420,7 +573,7 @@ def create_activity_in_pipedrive(lead_id):
     :return: A custom response object containing the synchronized entity status and id
     """
     app.logger.info('Fetching lead data from Marketo with id=%s', str(lead_id))
-    lead = marketo.Lead(get_marketo_client(), lead_id)
+    lead = marketo.Lead(get_marketo_client(), lead_id, fields=mappings.ACTIVITY_TO_LEAD_SOURCE_FIELDS)
 
     if lead.id is not None:
         activity = pipedrive.Activity(get_pipedrive_client())
@@ -450,40 +603,27 @@ def create_activity_in_pipedrive(lead_id):
 
 def create_activity_in_pipedrive_for_email_sent(lead_id):
     """
-    Create one or several activities for one or several Email sent in Pipedrive.
+    Create one or several activities for one or several Email sent in Pipedrive, skipping the Email sent whose activity
+    has already been created.
     Data to set is defined in mappings.
     :param lead_id: The lead id to synchronize data from
     :return: A custom response object containing the synchronized entity statuses and ids
     """
     app.logger.info('Fetching lead data from Marketo with id=%s', str(lead_id))
-    lead = marketo.Lead(get_marketo_client(), lead_id)
+    lead = marketo.Lead(get_marketo_client(), lead_id, fields=mappings.ACTIVITY_TO_EMAIL_SENT_SOURCE_FIELDS)
 
     if lead.id is not None:
         mkto_activities = lead.get_activities(['Send Email'])
-        statuses = []
-        ids = []
-        for mkto_activity in mkto_activities:
-            activity = pipedrive.Activity(get_pipedrive_client())
-            app.logger.info('New activity created')
-            statuses.append('created')
-
-            for pd_field in mappings.ACTIVITY_TO_EMAIL_SENT:
-                update_field(lead, activity, pd_field, mappings.ACTIVITY_TO_EMAIL_SENT[pd_field])
-
-            activity.subject = mkto_activity['primaryAttributeValue']
-            email_content = get_marketo_client().get_asset('email', mkto_activity['primaryAttributeValueId'], 'content')
-            if email_content and 'value' in email_content:
-                content_text = [value['value'] for value in email_content['value'] if value['type'] == 'Text']
-                if content_text:
-                    activity.note = content_text[0]
-
-            app.logger.info('Sending lead activities with id=%s to Pipedrive activities', str(lead_id))
-            activity.save()
-            ids.append(activity.id)
-
+        app.logger.info('Sending lead activities with id=%s to Pipedrive activities', str(lead_id))
+        synced_activities, outcomes = save_email_sent_activities(mkto_activities, {}, {lead.id: lead})
+        error_count = len([outcome for outcome in outcomes if outcome['status'] == 'error'])
+        if error_count:
+            # Fail the task so that it is retried: the saved activities are linked and will not be created again
+            raise SavingError('Save entities', '{} of {} activities not saved for lead with id={}', error_count,
+                              len(outcomes), lead_id)
         response = {
-            'status': statuses,
-            'id': ids
+            'status': [outcome['status'] for outcome in outcomes],
+            'id': [outcome.get('id') for outcome in outcomes]
         }
     else:
         message = 'No lead found in Marketo with id=%s' % str(lead_id)
@@ -495,19 +635,174 @@ def create_activity_in_pipedrive_for_email_sent(lead_id):
     return response
 
 
+def create_activities_in_pipedrive_for_emails_sent():
+    """
+    Create the activities in Pipedrive for the Email sent to every lead since the last run (catch-up job).
+    The activities of all leads are processed page by page: the leads of a page are loaded in batches, its Pipedrive
+    activities are saved concurrently and the watermark is moved after them, so that a run interrupted by the request
+    deadline resumes after the last page saved. The activities which could not be saved are retried by the next runs, up
+    to EMAIL_SENT_MAX_ATTEMPTS times.
+    Data to set is defined in mappings.
+    :return: A custom response object containing the synchronized entity statuses and ids
+    """
+    watermark = Watermark.get_or_insert('create_activities_in_pipedrive_for_emails_sent')
+    start_datetime = watermark.datetime or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_id = watermark.last_id or 0
+    # The activities which could not be saved by the previous runs and their number of attempts
+    attempts = dict((failed_id, 0) for failed_id in watermark.failed_ids)
+    attempts.update(zip(watermark.failed_ids, watermark.failed_attempts))
+    retried_ids = set(attempts)
+    failed_activities = []
+    last_activity = None
+
+    app.logger.info('Fetching Email sent activities from Marketo since %s', start_datetime.isoformat())
+    activity_type_ids = get_marketo_client().get_activity_type_ids(['Send Email'])
+    pages = get_marketo_client().iter_activity_pages(activity_type_ids, start_datetime.isoformat(),
+                                                     EMAIL_SENT_PAGE_SIZE)
+    email_contents = {}  # Emails of a campaign are sent to many leads
+    statuses = []
+    ids = []
+    for page in pages:
+        mkto_activities = [mkto_activity for mkto_activity in page
+                           # Skip the activities synchronized by the previous runs
+                           if mkto_activity['id'] > start_id or mkto_activity['id'] in retried_ids]
+        if not mkto_activities:
+            continue
+        mkto_activities.sort(key=lambda mkto_activity: mkto_activity['id'])
+        last_activity = mkto_activities[-1]
+
+        synced_activities, outcomes = save_email_sent_activities(mkto_activities, email_contents)
+        statuses.extend(outcome['status'] for outcome in outcomes)
+        ids.extend(outcome.get('id') for outcome in outcomes)
+
+        # Move the watermark after the page, the activities which could not be saved are retried next time
+        retried_ids.difference_update(mkto_activity['id'] for mkto_activity in mkto_activities)
+        for mkto_activity, outcome in zip(synced_activities, outcomes):
+            if outcome['status'] == 'error' and count_email_sent_attempt(attempts, mkto_activity['id']):
+                failed_activities.append(mkto_activity)
+        set_email_sent_watermark(watermark, failed_activities, last_activity, retried_ids, attempts)
+        watermark.put()
+
+    if retried_ids:
+        # The failed activities not returned again do not hold the watermark either, e.g. if deleted in Marketo
+        retried_ids = set(retried_id for retried_id in retried_ids if count_email_sent_attempt(attempts, retried_id))
+        set_email_sent_watermark(watermark, failed_activities, last_activity, retried_ids, attempts)
+        watermark.put()
+
+    return {
+        'status': statuses,
+        'id': ids
+    }
+
+
+def count_email_sent_attempt(attempts, mkto_activity_id):
+    """
+    Count a failed attempt to save the Pipedrive activity of an Email sent activity.
+    :param attempts: The number of attempts per Email sent activity id, updated
+    :param mkto_activity_id: The Email sent activity id
+    :return: True if the activity is to be retried, False if it has failed too many times and is given up
+    """
+    attempts[mkto_activity_id] = attempts.get(mkto_activity_id, 0) + 1
+    if attempts[mkto_activity_id] < EMAIL_SENT_MAX_ATTEMPTS:
+        return True
+    app.logger.error('Giving up Email sent activity with id=%s after %d attempts', mkto_activity_id,
+                     attempts[mkto_activity_id])
+    return False
+
+
+def set_email_sent_watermark(watermark, failed_activities, last_activity, retried_ids, attempts):
+    """
+    Set the position of the Email sent activities catch-up job.
+    :param watermark: The watermark of the job
+    :param failed_activities: The activities of the run which could not be saved and are to be retried
+    :param last_activity: The last activity processed by the run, None if no activity has been
+    :param retried_ids: The ids of the activities to retry from the previous runs not processed again yet
+    :param attempts: The number of attempts per Email sent activity id
+    """
+    if not retried_ids:  # Otherwise keep the date of the failed activities not seen again yet
+        resume_activity = failed_activities[0] if failed_activities else last_activity
+        if resume_activity is not None:
+            watermark.datetime = datetime.strptime(resume_activity['activityDate'][:19], '%Y-%m-%dT%H:%M:%S')
+    if last_activity is not None:
+        watermark.last_id = max(watermark.last_id or 0, last_activity['id'])
+    watermark.failed_ids = [mkto_activity['id'] for mkto_activity in failed_activities] + sorted(retried_ids)
+    watermark.failed_attempts = [attempts[failed_id] for failed_id in watermark.failed_ids]
+
+
+def save_email_sent_activities(mkto_activities, email_contents, leads=None):
+    """
+    Save the Pipedrive activities of Email sent activities, skipping the leads not synchronized with Pipedrive and the
+    activities already saved. The saved activities are linked to their Email sent activity so that they are not saved
+    twice, whether by the task of their lead or by the catch-up job.
+    :param mkto_activities: The Email sent activities
+    :param email_contents: The email contents already loaded per email id, completed with the loaded ones
+    :param leads: The leads of the activities per id, loaded if not specified
+    :return: The activities saved and a list of custom response objects containing the status and id or error of each
+    """
+    # Pipedrive activity ids per Email sent activity id for the activities already saved
+    activity_ids = IdentityLink.get_linked_ids('email_sent', [mkto_activity['id'] for mkto_activity in mkto_activities])
+    if activity_ids:
+        app.logger.info('Skipping %d activities already saved in Pipedrive', len(activity_ids))
+        mkto_activities = [mkto_activity for mkto_activity in mkto_activities if mkto_activity['id'] not in activity_ids]
+
+    if leads is None:
+        # Load the leads of the activities with only the fields needed by the mapping
+        lead_ids = sorted(set(mkto_activity['leadId'] for mkto_activity in mkto_activities))
+        lead_fields = ['id'] + sorted(mappings.ACTIVITY_TO_EMAIL_SENT_SOURCE_FIELDS)
+        leads = {}
+        for i in range(0, len(lead_ids), LEAD_BATCH_SIZE):
+            batch = ','.join(str(lead_id) for lead_id in lead_ids[i:i + LEAD_BATCH_SIZE])
+            for lead in get_marketo_client().get_entities('lead', batch, 'id', lead_fields):
+                leads[lead.id] = lead
+
+    saver = ConcurrentSaver(app.config.get('PD_MAX_CONCURRENT_SAVES', 1))
+    synced_activities = []
+    for mkto_activity in mkto_activities:
+        lead = leads.get(mkto_activity['leadId'])
+        if lead is None or not lead.pipedriveId:
+            app.logger.info('Skipping activity with id=%s: lead with id=%s not synchronized with Pipedrive',
+                            mkto_activity['id'], mkto_activity['leadId'])
+            continue
+
+        activity = pipedrive.Activity(get_pipedrive_client())
+        for pd_field in mappings.ACTIVITY_TO_EMAIL_SENT:
+            update_field(lead, activity, pd_field, mappings.ACTIVITY_TO_EMAIL_SENT[pd_field])
+
+        activity.subject = mkto_activity['primaryAttributeValue']
+        email_id = mkto_activity['primaryAttributeValueId']
+        if email_id not in email_contents:
+            email_contents[email_id] = get_marketo_client().get_asset('email', email_id, 'content')
+        email_content = email_contents[email_id]
+        if email_content and 'value' in email_content:
+            content_text = [value['value'] for value in email_content['value'] if value['type'] == 'Text']
+            if content_text:
+                activity.note = content_text[0]
+
+        saver.add(activity)
+        synced_activities.append(mkto_activity)
+
+    app.logger.info('Sending %d activities for %d leads to Pipedrive', len(synced_activities), len(leads))
+    outcomes = saver.flush()
+    IdentityLink.link_multi('email_sent', 'activity', dict(
+        (mkto_activity['id'], outcome['id']) for mkto_activity, outcome in zip(synced_activities, outcomes)
+        if outcome['status'] != 'error'))
+    return synced_activities, outcomes
+
+
 def compute_organization_in_pipedrive(organization_id):
     app.logger.info('Fetching organization data from Pipedrive with id=%s', str(organization_id))
-    organization = pipedrive.Organization(get_pipedrive_client(), organization_id)
+    organization = pipedrive.Organization(get_pipedrive_client(), organization_id,
+                                          fields=[mappings.ORGANIZATION_COUNTRY_KEY, mappings.ORGANIZATION_REGION_KEY])
 
     if organization.id is not None:
         status = 'skipped'
         # Use keys to avoid conflicts in field names and keys
-        if organization.b97ac2f12d2071c4c5efbf3a89c812c970f04af1\
-                and organization.b97ac2f12d2071c4c5efbf3a89c812c970f04af1 in mappings.COUNTRY_TO_REGION:
-            old_region = organization.e1cfd37b3fa5a3847f662fb7a3728c181b6dac15
-            new_region = mappings.COUNTRY_TO_REGION[organization.b97ac2f12d2071c4c5efbf3a89c812c970f04af1]
+        country = getattr(organization, mappings.ORGANIZATION_COUNTRY_KEY)
+        if country and country in mappings.COUNTRY_TO_REGION:
+            old_region = getattr(organization, mappings.ORGANIZATION_REGION_KEY)
+            new_region = mappings.COUNTRY_TO_REGION[country]
             if new_region and new_region != old_region:
-                organization.e1cfd37b3fa5a3847f662fb7a3728c181b6dac15 = new_region
+                setattr(organization, mappings.ORGANIZATION_REGION_KEY, new_region)
                 organization.save()
                 status = 'updated'
 
@@ -554,9 +849,7 @@ def notify_deal_in_slack_for_status(deal_id):
                                       '*Pipeline*: {}').format(encoded_organization_name,
                                                              deal.currency,
                                                              deal.value,
-                                                             pipedrive
-                                                             .Pipeline(get_pipedrive_client(), deal.pipeline_id)
-                                                             .name),
+                                                             get_pipeline_name(deal.pipeline_id)),
                             'short': True
                         },
                         {
@@ -570,8 +863,7 @@ def notify_deal_in_slack_for_status(deal_id):
                         },
                         {
                             'title': 'Comments',
-                            'value': html2text.html2text(status_comment.content)
-                            if status_comment and status_comment.content else '',
+                            'value': slack.render_note(status_comment.content) if status_comment else '',
                             'short': False
                         }
                     ],
@@ -580,14 +872,13 @@ def notify_deal_in_slack_for_status(deal_id):
             ]
         }
 
-        content = post_message_on_slack(payload)
-
+        channels = [None]  # Default channel of the webhook
         if deal.status == 'won' and deal.value >= 100000:
-            payload['channel'] = '#general'
-            content = post_message_on_slack(payload)
+            channels.append('#general')
 
         response = {
-            'content': content
+            'status': 'queued',
+            'id': slack.send_message(payload, channels)
         }
 
     else:
@@ -617,8 +908,7 @@ def notify_deal_in_slack_for_note(deal_id):
                         .format(app.config['PD_APP_URL'], deal.id, encoded_deal_title, encoded_organization_name),
                     'fields': [
                         {
-                            'value': html2text.html2text(status_comment.content)
-                            if status_comment and status_comment.content else '',
+                            'value': slack.render_note(status_comment.content) if status_comment else '',
                             'short': False
                         }
                     ],
@@ -626,10 +916,15 @@ def notify_deal_in_slack_for_note(deal_id):
                 }
             ]
         }
-        content = post_message_on_slack(payload)
+        digest_delay = app.config.get('SLACK_NOTE_DIGEST_DELAY')
+        if digest_delay:  # Gather the notes added to a busy deal in a single message
+            message_ids = [slack.send_deal_digest_message(deal.id, payload, digest_delay)]
+        else:
+            message_ids = slack.send_message(payload)
 
         response = {
-            'content': content
+            'status': 'queued',
+            'id': message_ids
         }
 
     else:
@@ -642,11 +937,77 @@ def notify_deal_in_slack_for_note(deal_id):
     return response
 
 
-def post_message_on_slack(payload):
-    url = app.config['SLACK_WEBHOOK_URL']
-    r = requests.post(url, json=payload)
-    r.raise_for_status()
-    return r.content
+def send_slack_message(message_id):
+    """
+    Post a message queued by the notification tasks on Slack.
+    :param message_id: The message id
+    :return: A custom response object containing the message status and id
+    """
+    content = slack.post_queued_message(message_id)
+    if content is None:
+        app.logger.info('Slack message with id=%s already posted', message_id)
+        status = 'skipped'
+    else:
+        status = 'sent'
+
+    return {
+        'status': status,
+        'id': message_id
+    }
+
+
+def send_slack_deal_digest(deal_id):
+    """
+    Post the messages queued for a deal on Slack as a single digest.
+    :param deal_id: The deal id
+    :return: A custom response object containing the digest status and number of messages
+    """
+    count = slack.post_deal_digest(deal_id)
+    app.logger.info('Posted %d Slack messages for deal with id=%s', count, deal_id)
+
+    return {
+        'status': 'sent' if count else 'skipped',
+        'id': deal_id,
+        'count': count
+    }
+
+
+def update_webhook_filters():
+    """
+    Compute the values the frontend filters the webhooks with and store them in the datastore (scheduled job): the ids
+    of the pipelines whose deals are not synchronized and the keys of the fields read by the person and organization
+    mappings.
+    :return: A custom response object containing the updated status and filter names
+    """
+    pipelines = get_pipedrive_client().get_pipelines(refresh=True)
+    values_per_name = {
+        'skipped_pipeline_ids': sorted(pipeline_id for pipeline_id, pipeline in pipelines.items()
+                                       if pipeline['name'] not in mappings.PIPELINE_FILTER_NAMES),
+        'person_source_field_keys': get_source_field_keys('person', mappings.LEAD_TO_PERSON_SOURCE_FIELDS),
+        'organization_source_field_keys': get_source_field_keys('organization',
+                                                                mappings.COMPANY_TO_ORGANIZATION_SOURCE_FIELDS)
+    }
+    WebhookFilter.put_values(values_per_name)
+
+    return {
+        'status': 'updated',
+        'id': sorted(values_per_name)
+    }
+
+
+def get_source_field_keys(entity_name, source_fields):
+    """
+    Return the keys of the fields read by a mapping, as found in the webhooks.
+    :param entity_name: The entity name
+    :param source_fields: The names or keys of the fields read by the mapping, None for every field
+    :return: A sorted list of field keys, None for every field
+    """
+    if source_fields is None:
+        return None
+    fields = get_pipedrive_client().get_entity_fields(entity_name)
+    field_keys = set(field['key'] for field in fields
+                     if field['key'] in source_fields or to_snake_case(field['name']) in source_fields)
+    return sorted(field_keys.union(SYSTEM_FIELD_KEYS))
 
 
 def update_field(from_entity, to_entity, to_field, mapping):
@@ -44,6 +44,30 @@ def authenticate(authorized_keys):
     return decorator
 
 
+REALTIME_QUEUE = 'realtime'  # Synchronization of the changes made by the users
+BULK_QUEUE = 'bulk'  # Fan-outs and recomputations that may wait, their calls leave a share of the rate limits
+NOTIFY_QUEUE = 'notify'  # Slack notifications
+
+# Queue of the tasks not run from the realtime queue per task name
+TASK_QUEUES = {
+    'create_activity_in_pipedrive_for_email_sent': BULK_QUEUE,
+    'compute_organization_in_pipedrive': BULK_QUEUE,
+    'notify_deal_in_slack_for_status': NOTIFY_QUEUE,
+    'notify_deal_in_slack_for_note': NOTIFY_QUEUE,
+    'send_slack_message': NOTIFY_QUEUE,
+    'send_slack_deal_digest': NOTIFY_QUEUE,
+}
+
+
+def get_task_queue(task_name):
+    """
+    Return the name of the push queue running a task.
+    :param task_name: The task name
+    :return: The queue name
+    """
+    return TASK_QUEUES.get(task_name, REALTIME_QUEUE)
+
+
 class EnqueuedTask(ndb.Model):
     """
     The task model in the datastore.
@@ -51,3 +75,122 @@ class EnqueuedTask(ndb.Model):
     name = ndb.StringProperty()
     params = ndb.JsonProperty(indexed=True)
     ata = ndb.DateTimeProperty()
+
+
+class Watermark(ndb.Model):
+    """
+    The position reached by a catch-up job in the datastore, keyed by job name.
+    """
+    datetime = ndb.DateTimeProperty()  # The date to resume from, the date of the last or first failed record
+    last_id = ndb.IntegerProperty()  # The id of the last synchronized record as several records may share a date
+    failed_ids = ndb.IntegerProperty(repeated=True)  # The ids of the records to synchronize again
+    failed_attempts = ndb.IntegerProperty(repeated=True)  # The number of failed attempts of each of these records
+
+
+class WebhookFilter(ndb.Model):
+    """
+    The values the frontend filters a kind of webhook with in the datastore, keyed by filter name. They are computed by
+    the worker, which loads the mappings and calls the APIs, so that the frontend does neither.
+    """
+    values = ndb.JsonProperty()
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def get_values(cls, name):
+        """
+        Return the values of a filter.
+        :param name: The filter name, e.g. "skipped_pipeline_ids"
+        :return: The filter values or None if they have not been computed
+        """
+        webhook_filter = cls.get_by_id(name)
+        return webhook_filter.values if webhook_filter is not None else None
+
+    @classmethod
+    def put_values(cls, values_per_name):
+        """
+        Store the values of filters.
+        :param values_per_name: The filter values per filter name, None to remove a filter so that its webhooks are
+        no longer filtered
+        """
+        ndb.put_multi([cls(id=name, values=values) for name, values in values_per_name.items() if values is not None])
+        ndb.delete_multi([ndb.Key(cls, name) for name, values in values_per_name.items() if values is None])
+
+
+class IdentityLink(ndb.Model):
+    """
+    The link between a Pipedrive and a Marketo entity in the datastore, stored in both directions and keyed by
+    "<entity name>:<entity id>" (e.g. "organization:20" -> company 10 and "company:10" -> organization 20) so that
+    resolving the entity of the other system takes a single get.
+    """
+    linked_id = ndb.GenericProperty(indexed=False)
+
+    @staticmethod
+    def _key_name(entity_name, id_):
+        return '%s:%s' % (entity_name, id_)
+
+    @classmethod
+    def link(cls, entity_name, id_, linked_entity_name, linked_id):
+        """
+        Store the link between two entities.
+        :param entity_name: The entity name, e.g. "organization"
+        :param id_: The entity id
+        :param linked_entity_name: The linked entity name, e.g. "company"
+        :param linked_id: The linked entity id
+        """
+        cls.link_multi(entity_name, linked_entity_name, {id_: linked_id})
+
+    @classmethod
+    def link_multi(cls, entity_name, linked_entity_name, linked_ids):
+        """
+        Store the links between entities of the same kind and their linked entities with a single datastore call.
+        :param entity_name: The entity name, e.g. "email_sent"
+        :param linked_entity_name: The linked entity name, e.g. "activity"
+        :param linked_ids: The linked entity id per entity id
+        """
+        links = []
+        for id_, linked_id in linked_ids.items():
+            links.append(cls(id=cls._key_name(entity_name, id_), linked_id=linked_id))
+            links.append(cls(id=cls._key_name(linked_entity_name, linked_id), linked_id=id_))
+        ndb.put_multi(links)
+
+    @classmethod
+    def get_linked_id(cls, entity_name, id_):
+        """
+        Return the id of the entity linked to an entity.
+        :param entity_name: The entity name
+        :param id_: The entity id
+        :return: The linked entity id or None if the entities have not been linked yet
+        """
+        if id_ is None:
+            return None
+        link = cls.get_by_id(cls._key_name(entity_name, id_))
+        return link.linked_id if link is not None else None
+
+    @classmethod
+    def get_linked_ids(cls, entity_name, ids):
+        """
+        Return the ids of the entities linked to entities of the same kind with a single datastore call.
+        :param entity_name: The entity name
+        :param ids: The entity ids
+        :return: The linked entity id per entity id, for the entities which have been linked only
+        """
+        links = ndb.get_multi([ndb.Key(cls, cls._key_name(entity_name, id_)) for id_ in ids])
+        return dict((id_, link.linked_id) for id_, link in zip(ids, links) if link is not None)
+
+
+class SlackMessage(ndb.Model):
+    """
+    A Slack message waiting to be posted by the worker in the datastore. The messages of a digest share the digest key
+    as parent so that they are gathered by a strongly consistent query.
+    """
+    payload = ndb.JsonProperty()
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+    @staticmethod
+    def digest_key(name):
+        """
+        Return the parent key of the messages of a digest.
+        :param name: The digest name, e.g. "deal:20"
+        :return: The digest key
+        """
+        return ndb.Key('SlackDigest', name)
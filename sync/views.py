@@ -3,7 +3,11 @@ from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
 from sync import app
-from .util import authenticate, EnqueuedTask
+from .common import TTLCache
+from .util import authenticate, EnqueuedTask, get_task_queue, WebhookFilter
+
+# Webhook filter values per filter name, read from the datastore where the worker stores them
+_webhook_filters = TTLCache('get_webhook_filter', 300)
 
 
 @app.route('/marketo/lead/<int:lead_id>', methods=['POST'])
@@ -34,7 +38,10 @@ def sync_person_with_params():
     if params is not None and 'current' in params and 'id' in params['current'] and params['current']['id'] is not None:
         try:
             person_id = int(params['current']['id'])
-            rv = enqueue_task('create_or_update_lead_in_marketo', {'id': person_id})
+            if has_source_field_changed(params, 'person'):
+                rv = enqueue_task('create_or_update_lead_in_marketo', {'id': person_id})
+            else:
+                rv = skip_webhook('person', person_id)
         except ValueError:
             message = 'Incorrect id=%s' % str(params['current']['id'])
             app.logger.error(message)
@@ -85,7 +92,10 @@ def sync_organization_with_params():
     if params is not None and 'current' in params and 'id' in params['current'] and params['current']['id'] is not None:
         try:
             organization_id = int(params['current']['id'])
-            rv = enqueue_task('create_or_update_company_in_marketo', {'id': organization_id})
+            if has_source_field_changed(params, 'organization'):
+                rv = enqueue_task('create_or_update_company_in_marketo', {'id': organization_id})
+            else:
+                rv = skip_webhook('organization', organization_id)
         except ValueError:
             message = 'Incorrect id=%s' % str(params['current']['id'])
             app.logger.error(message)
@@ -109,7 +119,14 @@ def sync_deal_with_params():
     if params is not None and 'current' in params and 'id' in params['current'] and params['current']['id'] is not None:
         try:
             deal_id = int(params['current']['id'])
-            rv = enqueue_task('create_or_update_opportunity_in_marketo', {'id': deal_id})
+            pipeline_id = params['current'].get('pipeline_id')
+            if pipeline_id is not None and not is_deal_pipeline_synchronized(pipeline_id):
+                # Drop the deal before enqueueing a task that would skip it anyway
+                message = 'Deal synchronization with id=%s not enabled for pipeline_id=%s' % (deal_id, pipeline_id)
+                app.logger.info(message)
+                rv = {'status': 'skipped', 'message': message}
+            else:
+                rv = enqueue_task('create_or_update_opportunity_in_marketo', {'id': deal_id})
         except ValueError:
             message = 'Incorrect id=%s' % str(params['current']['id'])
             app.logger.error(message)
@@ -183,13 +200,64 @@ def compute_deal_with_params():
     return jsonify(**rv)
 
 
+def has_source_field_changed(params, entity_name):
+    """
+    Return whether a webhook reports a change of a field read by a mapping, assuming it does if it cannot be told.
+    :param params: The webhook parameters containing the current and previous entity data
+    :param entity_name: The entity name
+    :return: True if a field read by the mapping changed
+    """
+    previous = params.get('previous')
+    field_keys = get_webhook_filter(entity_name + '_source_field_keys')
+    if not previous or field_keys is None:  # Entity added or fields not known yet
+        return True
+    return any(params['current'].get(key) != previous.get(key) for key in field_keys)
+
+
+def skip_webhook(entity_name, id_):
+    """
+    Skip a webhook that does not change any synchronized field.
+    :param entity_name: The entity name
+    :param id_: The entity id
+    :return: A custom response object containing the skipped status and a message
+    """
+    message = 'No synchronized field changed for %s with id=%s' % (entity_name, id_)
+    app.logger.info(message)
+    return {'status': 'skipped', 'message': message}
+
+
+def is_deal_pipeline_synchronized(pipeline_id):
+    """
+    Return whether the deals of a pipeline are synchronized, assuming they are if the pipeline is not known to be
+    skipped so that the task decides.
+    :param pipeline_id: The pipeline id
+    :return: True if the deals of the pipeline are synchronized
+    """
+    skipped_pipeline_ids = get_webhook_filter('skipped_pipeline_ids')
+    return skipped_pipeline_ids is None or int(pipeline_id) not in skipped_pipeline_ids
+
+
+def get_webhook_filter(name):
+    """
+    Return the values of a webhook filter computed by the update_webhook_filters job.
+    :param name: The filter name
+    :return: The filter values or None if they have not been computed yet
+    """
+    values = _webhook_filters.get(name, lambda: WebhookFilter.get_values(name))
+    if values is None:
+        _webhook_filters.discard(name)  # The job may compute them in the meantime
+    return values
+
+
 def enqueue_task(task_name, params):
     """
-    Create a task and place it in a push queue for further processing.
+    Create a task and place it in the push queue of its priority for further processing.
     :param task_name: The task name
     :param params: The task parameters
     :return: A custom response object containing a message
     """
+    queue_name = get_task_queue(task_name)
+
     # Search for the task in the datastore
     already_enqueued_task = EnqueuedTask.query(ndb.AND(EnqueuedTask.name == task_name, EnqueuedTask.params == params))\
         .get()
@@ -204,7 +272,7 @@ def enqueue_task(task_name, params):
                 already_enqueued_task_key = already_enqueued_task.key
                 already_enqueued_task_id = already_enqueued_task_key.id()
                 already_enqueued_task_key.delete()  # It may delete a running task
-                queue = taskqueue.Queue('default')
+                queue = taskqueue.Queue(queue_name)
                 former_task = taskqueue.Task(name=already_enqueued_task_id)
                 queue.delete_tasks(former_task)
             except taskqueue.BadTaskStateError:
@@ -214,6 +282,7 @@ def enqueue_task(task_name, params):
         task = taskqueue.add(
             url='/task/%s' % task_name,
             target='worker',
+            queue_name=queue_name,
             params=params)
 
         # Store the task to prevent from duplicates
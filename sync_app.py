@@ -1 +1,3 @@
 from sync import app as application
+# Register the webhook routes, the worker imports the sync package without them
+import sync.views
@@ -6,3 +6,4 @@ import sync
 # Discover necessary modules
 import sync.mappings
 import sync.tasks
+import sync.views
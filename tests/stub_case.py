@@ -0,0 +1,35 @@
+# coding=UTF-8
+from .context import sync
+from .stub_server import StubBackends
+
+import unittest
+
+from google.appengine.ext import ndb, testbed
+
+
+class StubTestCase(unittest.TestCase):
+    """
+    Point the application to the local stub servers for each test and restore its configuration afterwards.
+    """
+    backends_options = {}
+    use_testbed = False  # Activate the datastore, memcache and task queue stubs
+
+    def setUp(self):
+        self.backends = StubBackends(**self.backends_options).start()
+        self.app_config = dict(sync.app.config)
+        sync.app.config.update(self.backends.app_config())
+        if self.use_testbed:
+            self.testbed = testbed.Testbed()
+            self.testbed.activate()
+            self.testbed.init_datastore_v3_stub()
+            self.testbed.init_memcache_stub()
+            self.testbed.init_taskqueue_stub(root_path=sync.app.root_path + '/..')
+            self.taskqueue_stub = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+            ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        if self.use_testbed:
+            self.testbed.deactivate()
+        self.backends.stop()
+        sync.app.config.clear()
+        sync.app.config.update(self.app_config)
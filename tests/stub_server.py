@@ -0,0 +1,883 @@
+# coding=UTF-8
+"""
+Local HTTP stand-ins for the Marketo REST API (and its identity service), the Pipedrive v1 API and Slack webhooks.
+
+The servers are loaded with the JSON files of the resources folder, can generate synthetic records at scale and
+simulate latency, rate limits and errors so that the real clients can be exercised end to end without network:
+
+    with StubBackends(latency=0.05) as backends:
+        mkto = sync.marketo.MarketoClient(**backends.marketo_client_config())
+        pd = sync.pipedrive.PipedriveClient(**backends.pipedrive_client_config())
+        backends.pipedrive.generate('person', 1000)
+"""
+import base64
+import copy
+import json
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import defaultdict
+from datetime import datetime
+from urlparse import parse_qs, urlparse
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), 'resources')
+
+
+def load_resource(name):
+    """
+    Return the content of a JSON file of the resources folder or None if it does not exist.
+    :param name: The file name without extension
+    """
+    path = os.path.join(RESOURCES_DIR, name + '.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def endpoint_template(method, path):
+    """
+    Return the endpoint a request has been made to with ids replaced by a placeholder.
+    >>> endpoint_template('GET', '/v1/persons/10')
+    'GET /v1/persons/{id}'
+    >>> endpoint_template('GET', '/rest/asset/v1/email/1/content.json')
+    'GET /rest/asset/v1/email/{id}/content.json'
+    """
+    return '%s %s' % (method, re.sub(r'/\d+(?=/|\.json|$)', '/{id}', path))
+
+
+def query_values(params, key):
+    """
+    Return the values of a query parameter either repeated or comma separated.
+    >>> query_values({'ids': ['1,2', '3']}, 'ids')
+    ['1', '2', '3']
+    >>> query_values({}, 'ids')
+    []
+    """
+    values = []
+    for value in params.get(key, []):
+        values.extend(v.strip() for v in value.split(',') if v.strip())
+    return values
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections alive so that clients can reuse them as with the real APIs
+    wbufsize = -1  # Send each response at once rather than line by line
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.stub.dispatch(self)
+
+    def do_POST(self):
+        self.server.stub.dispatch(self)
+
+    def do_PUT(self):
+        self.server.stub.dispatch(self)
+
+    def do_DELETE(self):
+        self.server.stub.dispatch(self)
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark and test outputs clean
+
+
+class StubServer(object):
+    """
+    The base class for a local API stand-in. It serves requests on a random local port in a background thread.
+    """
+
+    def __init__(self, latency=0, jitter=0, rate_limit=None, rate_window=1, error_rate=0, seed=None):
+        """
+        :param latency: The fixed delay in seconds added to every response
+        :param jitter: The maximum random delay in seconds added to the fixed one
+        :param rate_limit: The maximum number of requests per rate window, unlimited if not specified
+        :param rate_window: The rate window duration in seconds
+        :param error_rate: The ratio of requests randomly failing with a transient error
+        :param seed: The random generator seed for reproducible runs
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.error_rate = error_rate
+
+        self.calls = defaultdict(lambda: {'count': 0, 'bytes_in': 0, 'bytes_out': 0})  # Per endpoint template
+        self.store = defaultdict(dict)  # Records per collection and id
+
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._next_ids = defaultdict(lambda: 100000)
+        self._window_start = time.time()
+        self._window_count = 0
+        self._errors_to_inject = 0
+        self._server = None
+        self._thread = None
+
+        self.load_resources()
+
+    @property
+    def url(self):
+        return 'http://%s:%s' % self._server.server_address
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _RequestHandler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+
+    def inject_errors(self, count=1):
+        """
+        Make the next requests fail with a transient error.
+        :param count: The number of requests to fail
+        """
+        with self._lock:
+            self._errors_to_inject += count
+
+    def next_id(self, collection):
+        with self._lock:
+            self._next_ids[collection] += 1
+            return self._next_ids[collection]
+
+    def load_resources(self):
+        """
+        Load the records served by default.
+        """
+        pass
+
+    def generate(self, entity_name, count, **fields):
+        """
+        Create synthetic records cloned from the first loaded record of an entity.
+        :param entity_name: The entity name
+        :param count: The number of records to create
+        :param fields: Field values to set on every record
+        :return: The created records
+        """
+        collection = self._collection(entity_name)
+        with self._lock:
+            template = self.store[collection][min(self.store[collection])]
+            records = []
+            for _ in range(count):
+                record = copy.deepcopy(template)
+                id_ = self.next_id(collection)
+                self._uniquify(record, id_)
+                record.update(fields)
+                self.store[collection][self._assign_id(entity_name, record, id_)] = record
+                records.append(record)
+        return records
+
+    def dispatch(self, handler):
+        parsed_url = urlparse(handler.path)
+        params = parse_qs(parsed_url.query, keep_blank_values=True)
+        length = int(handler.headers.getheader('content-length') or 0)
+        body = handler.rfile.read(length) if length else ''
+        if handler.headers.getheader('content-type', '').startswith('application/json'):
+            data = json.loads(body) if body else {}
+        else:
+            data = parse_qs(body, keep_blank_values=True)
+
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        with self._lock:
+            rate_headers, rate_limited = self._consume_rate()
+            failing = self._errors_to_inject > 0 or (self.error_rate and self._random.random() < self.error_rate)
+            if self._errors_to_inject > 0:
+                self._errors_to_inject -= 1
+
+        if rate_limited:
+            status, content = self.rate_limited_response()
+        elif failing:
+            status, content = self.error_response()
+        else:
+            try:
+                with self._lock:
+                    status, content = self.route(handler.command, parsed_url.path, params, data, handler.headers)
+            except Exception:
+                logging.getLogger(__name__).exception('Stub failed to handle %s %s', handler.command, handler.path)
+                status, content = 500, 'Stub error'
+
+        payload = content if isinstance(content, str) else json.dumps(content)
+        with self._lock:  # Before the response so that the client never reads the stats without its call
+            stats = self.calls[endpoint_template(handler.command, parsed_url.path)]
+            stats['count'] += 1
+            stats['bytes_in'] += len(body)
+            stats['bytes_out'] += len(payload)
+
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'text/plain' if isinstance(content, str) else 'application/json')
+        handler.send_header('Content-Length', str(len(payload)))
+        for header, value in self.response_headers(rate_headers):
+            handler.send_header(header, value)
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _consume_rate(self):
+        now = time.time()
+        if now - self._window_start >= self.rate_window:
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+        rate_headers = {}
+        rate_limited = False
+        if self.rate_limit:
+            rate_headers = {
+                'limit': self.rate_limit,
+                'remaining': max(self.rate_limit - self._window_count, 0),
+                'reset': max(int(round(self._window_start + self.rate_window - now)), 1)
+            }
+            rate_limited = self._window_count > self.rate_limit
+        return rate_headers, rate_limited
+
+    def response_headers(self, rate_headers):
+        return []
+
+    def route(self, method, path, params, data, headers):
+        raise NotImplementedError
+
+    def rate_limited_response(self):
+        raise NotImplementedError
+
+    def error_response(self):
+        raise NotImplementedError
+
+    def _collection(self, entity_name):
+        return entity_name
+
+    def _assign_id(self, entity_name, record, id_):
+        record['id'] = id_
+        return id_
+
+    def _uniquify(self, record, id_):
+        for key, value in record.items():
+            if not isinstance(value, basestring) or not value:
+                continue
+            if key == 'marketoGUID':
+                record[key] = str(uuid.UUID(int=id_))
+            elif '@' in value and ' ' not in value:
+                record[key] = 'stub%s@%s' % (id_, value.split('@')[-1])
+            elif key in ('name', 'company', 'title', 'externalCompanyId', 'externalOpportunityId', 'firstName',
+                         'lastName'):
+                record[key] = '%s %s' % (value, id_)
+
+
+class MarketoStubServer(StubServer):
+    """
+    Stand-in for the Marketo identity service (/identity) and REST API (/rest).
+    Rate limits and transient errors are reported the Marketo way, i.e. with 606 and 604 error codes.
+    """
+
+    ENTITIES = {
+        'leads': 'lead',
+        'companies': 'company',
+        'opportunities': 'opportunity',
+        'opportunities/roles': 'role'
+    }
+
+    FIELDS_RESOURCES = {
+        'lead': 'leadFields',
+        'company': 'companyFields',
+        'opportunity': 'opportunityFields',
+        'role': 'opportunityRoleFields'
+    }
+
+    def __init__(self, token_ttl=3600, **kwargs):
+        """
+        :param token_ttl: The access token lifetime in seconds
+        """
+        self.token_ttl = token_ttl
+        self._tokens = {}  # Access token mapped against its expiry time
+        super(MarketoStubServer, self).__init__(**kwargs)
+
+    def marketo_client_config(self):
+        """
+        Return the MarketoClient constructor parameters to use the stub.
+        """
+        return {
+            'identity_endpoint': self.url + '/identity',
+            'client_id': 'stub',
+            'client_secret': 'stub',
+            'api_endpoint': self.url + '/rest'
+        }
+
+    def expire_tokens(self):
+        """
+        Expire every access token issued so far.
+        """
+        with self._lock:
+            for token in self._tokens:
+                self._tokens[token] = 0
+
+    def load_resources(self):
+        for file_name in sorted(os.listdir(RESOURCES_DIR)):
+            match = re.match(r'^(lead|company|opportunity|role)(\d+)\.json$', file_name)
+            if match:
+                for record in load_resource(file_name[:-5]).get('result', []):
+                    record.pop('seq', None)
+                    self.store[match.group(1)][self._record_id(match.group(1), record)] = record
+        self.store['activity_type'] = dict((type_['id'], type_) for type_ in load_resource('activityTypes')['result'])
+        # The lead activities are served in the sync tests as the answer to a "Send Email" query
+        send_email_id = self.activity_type_id('Send Email')
+        for activity in load_resource('activities20')['result']:
+            activity['activityTypeId'] = send_email_id
+            self.store['activity'][activity['id']] = activity
+
+    def describe(self, entity_name):
+        """
+        Return the entity description. The described fixtures missing some fields, the fields found in the loaded
+        records are added as Marketo would describe them.
+        :param entity_name: The entity name
+        :return: The description response
+        """
+        data = load_resource(self.FIELDS_RESOURCES[entity_name])
+        if 'fields' not in data['result'][0]:  # Leads are described field by field
+            return data
+        fields = data['result'][0]['fields']
+        described = set(field['name'] for field in fields)
+        for record in self.store[entity_name].values():
+            for key in sorted(record):
+                if key not in described:
+                    described.add(key)
+                    fields.append({'name': key, 'displayName': key, 'dataType': 'string', 'updateable': True})
+        return data
+
+    def activity_type_id(self, name):
+        return next(type_['id'] for type_ in self.store['activity_type'].values() if type_['name'] == name)
+
+    def generate_activities(self, lead_ids, activity_type_name, count_per_lead, activity_date=None):
+        """
+        Create synthetic activities for leads.
+        :param lead_ids: The lead ids
+        :param activity_type_name: The activity type name, e.g. "Send Email"
+        :param count_per_lead: The number of activities per lead
+        :param activity_date: The activity date, now if not specified
+        :return: The created activities
+        """
+        activity_type_id = self.activity_type_id(activity_type_name)
+        activity_date = activity_date or datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        activities = []
+        with self._lock:
+            for lead_id in lead_ids:
+                for i in range(count_per_lead):
+                    id_ = self.next_id('activity')
+                    activity = {
+                        'id': id_,
+                        'marketoGUID': str(id_),
+                        'leadId': lead_id,
+                        'activityDate': activity_date,
+                        'activityTypeId': activity_type_id,
+                        'campaignId': 1,
+                        'primaryAttributeValueId': 1,
+                        'primaryAttributeValue': 'Stub Email %s' % (i + 1),
+                        'attributes': []
+                    }
+                    self.store['activity'][id_] = activity
+                    activities.append(activity)
+        return activities
+
+    def rate_limited_response(self):
+        return 200, self._failure('606', 'Max rate limit \'100\' exceeded with in \'20\' secs')
+
+    def error_response(self):
+        return 200, self._failure('604', 'Request timed out')
+
+    def route(self, method, path, params, data, headers):
+        if path == '/identity/oauth/token':
+            return self._issue_token()
+
+        authorization = headers.getheader('authorization', '')
+        token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') \
+            else (params.get('access_token') or [None])[0]
+        if token not in self._tokens:
+            return 200, self._failure('601', 'Access token invalid')
+        if self._tokens[token] < time.time():
+            return 200, self._failure('602', 'Access token expired')
+
+        if method == 'POST' and (params.get('_method') or [None])[0] == 'GET':
+            method = 'GET'  # Long query sent as form data
+            params = dict(params, **data)
+
+        match = re.match(r'^/rest/asset/v1/(\w+)/(\d+)(/content)?\.json$', path)
+        if match:
+            return self._get_asset(match.group(1), int(match.group(2)), match.group(3))
+        match = re.match(r'^/rest/v1/(leads|companies|opportunities/roles|opportunities|activities)(/\w+)?\.json$',
+                         path)
+        if not match:
+            return 404, self._failure('404', 'Unknown endpoint %s' % path)
+        collection, action = match.group(1), (match.group(2) or '')[1:]
+
+        if collection == 'activities':
+            if action == 'types':
+                return 200, self._success(self.store['activity_type'].values())
+            elif action == 'pagingtoken':
+                return 200, dict(self._success(None), nextPageToken=self._paging_token(
+                    params['sinceDatetime'][0], 0))
+            return self._get_activities(params)
+
+        entity_name = self.ENTITIES[collection]
+        if action == 'describe':
+            return 200, self.describe(entity_name)
+        elif action == 'delete':
+            return 200, self._success(self._delete(entity_name, data))
+        elif method == 'GET':
+            return 200, self._success(self._query(entity_name, params))
+        return 200, self._success(self._upsert(entity_name, data))
+
+    def _issue_token(self):
+        token = 'stub-%s' % uuid.uuid4().hex
+        self._tokens[token] = time.time() + self.token_ttl
+        return 200, {'access_token': token, 'token_type': 'bearer', 'expires_in': self.token_ttl, 'scope': 'stub'}
+
+    def _success(self, result):
+        data = {'requestId': uuid.uuid4().hex[:12], 'success': True}
+        if result is not None:
+            data['result'] = list(result)
+        return data
+
+    def _failure(self, code, message):
+        return {'requestId': uuid.uuid4().hex[:12], 'success': False, 'errors': [{'code': code, 'message': message}]}
+
+    def _id_field(self, entity_name):
+        return 'id' if entity_name in ('lead', 'company') else 'marketoGUID'
+
+    def _assign_id(self, entity_name, record, id_):
+        if self._id_field(entity_name) == 'marketoGUID':
+            record['marketoGUID'] = str(uuid.UUID(int=id_))
+            return record['marketoGUID']
+        return super(MarketoStubServer, self)._assign_id(entity_name, record, id_)
+
+    def _record_id(self, entity_name, record):
+        id_ = record[self._id_field(entity_name)]
+        return int(id_) if self._id_field(entity_name) == 'id' else id_
+
+    def _dedupe_fields(self, entity_name, lookup_field=None):
+        if lookup_field:
+            return [lookup_field]
+        return load_resource(self.FIELDS_RESOURCES[entity_name])['result'][0].get('dedupeFields', ['email'])
+
+    def _find(self, entity_name, data, fields):
+        return next((record for record in self.store[entity_name].values()
+                     if all(unicode(record.get(field)) == unicode(data.get(field)) for field in fields)), None)
+
+    def _query(self, entity_name, params):
+        filter_type = params['filterType'][0]
+        filter_values = query_values(params, 'filterValues')
+        fields = query_values(params, 'fields')
+        records = [record for record in self.store[entity_name].values()
+                   if unicode(record.get(filter_type)) in filter_values]
+        if fields:  # Only return the requested fields as Marketo does
+            records = [dict((key, value) for key, value in record.items()
+                            if key in fields or key == self._id_field(entity_name)) for record in records]
+        return records
+
+    def _upsert(self, entity_name, data):
+        results = []
+        id_field = self._id_field(entity_name)
+        lookup_field = data.get('lookupField') or ('email' if entity_name == 'lead' else None)
+        for seq, input_ in enumerate(data.get('input', [])):
+            record = self._find(entity_name, input_, self._dedupe_fields(entity_name, lookup_field))
+            if record is None and lookup_field == 'id':
+                results.append({'seq': seq, 'status': 'skipped',
+                                'reasons': [{'code': '1004', 'message': '%s not found' % entity_name.capitalize()}]})
+                continue
+            if record is None:
+                id_ = self.next_id(entity_name)
+                record = {id_field: id_ if id_field == 'id' else str(uuid.UUID(int=id_))}
+                self.store[entity_name][self._record_id(entity_name, record)] = record
+                status = 'created'
+            else:
+                status = 'updated'
+            record.update((key, value) for key, value in input_.items() if key != id_field)
+            results.append({'seq': seq, id_field: record[id_field], 'status': status})
+        return results
+
+    def _delete(self, entity_name, data):
+        results = []
+        for seq, input_ in enumerate(data.get('input', [])):
+            fields = [key for key in input_]
+            record = self._find(entity_name, input_, fields)
+            if record is None:
+                results.append({'seq': seq, 'status': 'skipped',
+                                'reasons': [{'code': '1013', 'message': 'Record not found'}]})
+            else:
+                del self.store[entity_name][self._record_id(entity_name, record)]
+                id_field = self._id_field(entity_name)
+                results.append({'seq': seq, id_field: record[id_field], 'status': 'deleted'})
+        return results
+
+    def _paging_token(self, since_datetime, offset):
+        return base64.urlsafe_b64encode('%s|%d' % (since_datetime, offset))
+
+    def _get_activities(self, params):
+        since_datetime, offset = base64.urlsafe_b64decode(params['nextPageToken'][0]).rsplit('|', 1)
+        offset = int(offset)
+        since_datetime = since_datetime[:19]
+        type_ids = [int(id_) for id_ in query_values(params, 'activityTypeIds')]
+        lead_ids = [int(id_) for id_ in query_values(params, 'leadIds')]
+        batch_size = int((params.get('batchSize') or [300])[0])
+        activities = sorted((activity for activity in self.store['activity'].values()
+                             if activity['activityTypeId'] in type_ids
+                             and (not lead_ids or activity['leadId'] in lead_ids)
+                             and activity['activityDate'][:19] >= since_datetime), key=lambda a: a['id'])
+        page = activities[offset:offset + batch_size]
+        data = self._success(page or None)  # Marketo omits the result when there is no activity
+        data['moreResult'] = offset + batch_size < len(activities)
+        data['nextPageToken'] = self._paging_token(since_datetime, offset + len(page))
+        return 200, data
+
+    def _get_asset(self, asset_name, asset_id, content):
+        resource = load_resource('%s%s' % (asset_name, asset_id))
+        if resource is None and content:
+            resource = self._success([{'htmlId': 'Section 1', 'contentType': 'Text',
+                                       'value': [{'type': 'HTML', 'value': '<p>Stub email %s</p>' % asset_id},
+                                                 {'type': 'Text', 'value': 'Stub email %s' % asset_id}]}])
+        elif resource is None:
+            resource = self._success([{'id': asset_id, 'name': '%s %s' % (asset_name.capitalize(), asset_id)}])
+        return 200, resource
+
+
+class PipedriveStubServer(StubServer):
+    """
+    Stand-in for the Pipedrive v1 API (/v1).
+    Every response carries the X-RateLimit-* headers and rate limits are reported with 429 responses.
+    """
+
+    COLLECTIONS = {
+        'persons': 'person',
+        'organizations': 'organization',
+        'deals': 'deal',
+        'users': 'user',
+        'stages': 'stage',
+        'pipelines': 'pipeline',
+        'notes': 'note',
+        'activities': 'activity',
+        'filters': 'filter'
+    }
+
+    FILTER_TYPES = {
+        'org': 'organization',
+        'people': 'person',
+        'deals': 'deal'
+    }
+
+    NOTE_FIELDS = [
+        {'id': 1, 'key': 'id', 'name': 'ID', 'field_type': 'int'},
+        {'id': 2, 'key': 'content', 'name': 'Content', 'field_type': 'text'},
+        {'id': 3, 'key': 'deal_id', 'name': 'Deal', 'field_type': 'int'},
+        {'id': 4, 'key': 'person_id', 'name': 'Person', 'field_type': 'int'},
+        {'id': 5, 'key': 'org_id', 'name': 'Organization', 'field_type': 'int'},
+        {'id': 6, 'key': 'user_id', 'name': 'User', 'field_type': 'int'},
+        {'id': 7, 'key': 'add_time', 'name': 'Add time', 'field_type': 'date'},
+        {'id': 8, 'key': 'update_time', 'name': 'Update time', 'field_type': 'date'}
+    ]
+
+    # Custom fields used by the mappings but missing from the described fixtures
+    CUSTOM_FIELDS = {
+        'person': ['Lead rating', 'Lead state'],
+        'deal': ['Deal type', 'Why']
+    }
+
+    def __init__(self, **kwargs):
+        self._field_ids = {}  # Field keys per entity and field id
+        super(PipedriveStubServer, self).__init__(**kwargs)
+
+    def pipedrive_client_config(self):
+        """
+        Return the PipedriveClient constructor parameters to use the stub.
+        """
+        return {
+            'api_token': 'stub',
+            'api_endpoint': self.url + '/v1'
+        }
+
+    def load_resources(self):
+        for file_name in sorted(os.listdir(RESOURCES_DIR)):
+            match = re.match(r'^(person|organization|deal|user|stage|pipeline|filter)(\d+)\.json$', file_name)
+            if match:
+                record = load_resource(file_name[:-5])['data']
+                self.store[match.group(1)][record['id']] = record
+
+    def fields(self, entity_name):
+        """
+        Return the entity fields response, including the missing custom fields.
+        :param entity_name: The entity name
+        :return: The fields response or None if the entity has no fields
+        """
+        resource = load_resource(entity_name + 'Fields')
+        if resource is None:
+            return self._success(self.NOTE_FIELDS) if entity_name == 'note' else None
+        next_id = max(field['id'] for field in resource['data']) + 1
+        for i, name in enumerate(self.CUSTOM_FIELDS.get(entity_name, [])):
+            resource['data'].append({'id': next_id + i, 'key': hashlib.sha1(name).hexdigest(), 'name': name,
+                                     'field_type': 'varchar', 'edit_flag': True})
+        return resource
+
+    def generate_notes(self, deal_id, count, content='<p>Stub note</p>'):
+        """
+        Create synthetic notes for a deal.
+        :param deal_id: The deal id
+        :param count: The number of notes to create
+        :param content: The notes content
+        :return: The created notes
+        """
+        notes = []
+        with self._lock:
+            for i in range(count):
+                id_ = self.next_id('note')
+                note = {'id': id_, 'deal_id': deal_id, 'content': content, 'active_flag': True,
+                        'add_time': '2016-01-01 00:%02d:%02d' % (i // 60 % 60, i % 60)}
+                self.store['note'][id_] = note
+                notes.append(note)
+        return notes
+
+    def add_participants(self, deal_id, person_ids):
+        """
+        Add participants to a deal.
+        :param deal_id: The deal id
+        :param person_ids: The ids of the participant persons
+        :return: The created participants
+        """
+        participants = []
+        with self._lock:
+            for person_id in person_ids:
+                id_ = self.next_id('participant')
+                person = self.store['person'][person_id]
+                participant = {'id': id_, 'deal_id': deal_id, 'active_flag': True,
+                               'person_id': {'name': person.get('name'), 'value': person_id}}
+                self.store['participant'][id_] = participant
+                participants.append(participant)
+            self.store['deal'][deal_id]['participants_count'] = len(
+                [record for record in self.store['participant'].values() if record['deal_id'] == deal_id])
+        return participants
+
+    def response_headers(self, rate_headers):
+        return [('X-RateLimit-%s' % header.capitalize(), str(value)) for header, value in rate_headers.items()]
+
+    def rate_limited_response(self):
+        return 429, {'success': False, 'error': 'Request over limit', 'errorCode': 429}
+
+    def error_response(self):
+        return 503, {'success': False, 'error': 'Service unavailable', 'errorCode': 503}
+
+    def route(self, method, path, params, data, headers):
+        if not params.get('api_token'):
+            return 401, {'success': False, 'error': 'You need to be authorized to make this request.',
+                         'errorCode': 401}
+
+        match = re.match(r'^/v1/(\w+)Fields$', path)
+        if match:
+            resource = self.fields(match.group(1))
+            return (200, resource) if resource else (404, self._failure('Unknown fields'))
+
+        match = re.match(r'^/v1/(\w+)(?:/(\w+))?(?:/(\w+))?$', path)
+        if not match or match.group(1) not in self.COLLECTIONS:
+            return 404, self._failure('Unknown endpoint %s' % path)
+        entity_name = self.COLLECTIONS[match.group(1)]
+        id_or_action = match.group(2)
+
+        if id_or_action == 'find':
+            return 200, self._success(self._find_by_term(entity_name, params['term'][0]))
+        elif id_or_action:
+            id_ = int(id_or_action)
+            if id_ not in self.store[entity_name]:
+                return 404, self._failure('%s not found' % entity_name.capitalize())
+            elif match.group(3) == 'participants' and method == 'GET':
+                return 200, self._list('participant', dict(params, deal_id=[unicode(id_)]))
+            elif method == 'GET':
+                return 200, self._success(self._complete(entity_name, self.store[entity_name][id_]))
+            elif method == 'PUT':
+                self.store[entity_name][id_].update(self._values(data))
+                return 200, self._success(self.store[entity_name][id_])
+            elif method == 'DELETE':
+                del self.store[entity_name][id_]
+                return 200, self._success({'id': id_})
+        elif method == 'POST':
+            id_ = self.next_id(entity_name)
+            record = dict(self._values(data), id=id_, active_flag=True,
+                          add_time=datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'))
+            self.store[entity_name][id_] = record
+            return 201, self._success(record)
+        elif method == 'GET':
+            return 200, self._list(entity_name, params)
+        return 405, self._failure('Method not allowed')
+
+    def _success(self, data, additional_data=None):
+        response = {'success': True, 'data': data}
+        if additional_data is not None:
+            response['additional_data'] = additional_data
+        return response
+
+    def _failure(self, error):
+        return {'success': False, 'error': error}
+
+    def _values(self, data):
+        values = {}
+        for key, value in data.items():
+            values[key] = value[0] if isinstance(value, list) and len(value) == 1 else value
+        return values
+
+    def _complete(self, entity_name, record):
+        if entity_name == 'participant':  # Participants hold the whole person data
+            person = self.store['person'].get(record['person_id']['value'])
+            return dict(record, person=self._complete('person', person) if person else None)
+        # Pipedrive returns every custom field, even when empty
+        missing_keys = [hashlib.sha1(name).hexdigest() for name in self.CUSTOM_FIELDS.get(entity_name, [])]
+        return dict(dict.fromkeys(missing_keys), **record) if missing_keys else record
+
+    def _find_by_term(self, entity_name, term):
+        return [{'id': record['id'], 'name': record.get('name')} for record in self.store[entity_name].values()
+                if term.lower() in (record.get('name') or '').lower()]
+
+    def _filter_matches(self, filter_, entity_name, record):
+        if entity_name not in self._field_ids:
+            self._field_ids[entity_name] = dict((field['id'], field['key'])
+                                                for field in self.fields(entity_name)['data'])
+        fields = self._field_ids[entity_name]
+        conditions = [condition for group in filter_['conditions']['conditions'] for condition in group['conditions']]
+        return all(unicode(record.get(fields.get(int(condition['field_id'])))) == unicode(condition['value'])
+                   for condition in conditions if condition['operator'] == '=')
+
+    def _list(self, entity_name, params):
+        records = [record for record in self.store[entity_name].values() if record.get('active_flag', True)]
+        if 'filter_id' in params:
+            filter_ = self.store['filter'].get(int(params['filter_id'][0]))
+            records = [record for record in records if filter_ and self._filter_matches(filter_, entity_name, record)]
+        for key in ('deal_id', 'person_id', 'org_id', 'user_id'):
+            if key in params:
+                records = [record for record in records if unicode(record.get(key)) == params[key][0]]
+        records.sort(key=lambda record: record['id'])
+        if 'sort' in params:
+            for sort in reversed(params['sort'][0].split(',')):
+                sort_key, _, direction = sort.strip().partition(' ')
+                records.sort(key=lambda record: record.get(sort_key), reverse=direction.upper() == 'DESC')
+
+        start = int((params.get('start') or [0])[0])
+        limit = int((params.get('limit') or [100])[0])
+        page = [self._complete(entity_name, record) for record in records[start:start + limit]]
+        more_items = start + limit < len(records)
+        pagination = {'start': start, 'limit': limit, 'more_items_in_collection': more_items}
+        if more_items:
+            pagination['next_start'] = start + limit
+        return self._success(page or None, {'pagination': pagination})
+
+
+class SlackStubServer(StubServer):
+    """
+    Stand-in for Slack incoming webhooks: every posted message is kept in the messages list.
+    """
+
+    def __init__(self, **kwargs):
+        self.messages = []
+        super(SlackStubServer, self).__init__(**kwargs)
+
+    def route(self, method, path, params, data, headers):
+        self.messages.append(data)
+        return 200, 'ok'
+
+    def rate_limited_response(self):
+        return 429, 'rate_limited'
+
+    def error_response(self):
+        return 500, 'internal_error'
+
+
+class StubBackends(object):
+    """
+    Start the Marketo, Pipedrive and Slack stub servers together.
+    Keyword arguments are passed to every server, e.g. latency or error_rate.
+    """
+
+    def __init__(self, **kwargs):
+        self.marketo = MarketoStubServer(**kwargs)
+        self.pipedrive = PipedriveStubServer(**kwargs)
+        self.slack = SlackStubServer(**kwargs)
+
+    @property
+    def servers(self):
+        return [self.marketo, self.pipedrive, self.slack]
+
+    def start(self):
+        for server in self.servers:
+            server.start()
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def marketo_client_config(self):
+        return self.marketo.marketo_client_config()
+
+    def pipedrive_client_config(self):
+        return self.pipedrive.pipedrive_client_config()
+
+    def app_config(self):
+        """
+        Return the application configuration values to use the stubs.
+        """
+        marketo_config = self.marketo_client_config()
+        return {
+            'IDENTITY_ENDPOINT': marketo_config['identity_endpoint'],
+            'CLIENT_ID': marketo_config['client_id'],
+            'CLIENT_SECRET': marketo_config['client_secret'],
+            'API_ENDPOINT': marketo_config['api_endpoint'],
+            'PD_API_TOKEN': self.pipedrive_client_config()['api_token'],
+            'PD_API_ENDPOINT': self.pipedrive_client_config()['api_endpoint'],
+            'SLACK_WEBHOOK_URL': self.slack.url + '/services/stub'
+        }
+
+    def reset_stats(self):
+        for server in self.servers:
+            server.reset_stats()
+
+    def calls(self):
+        """
+        Return the calls made to every server per endpoint template.
+        """
+        calls = {}
+        for name, server in (('marketo', self.marketo), ('pipedrive', self.pipedrive), ('slack', self.slack)):
+            for endpoint, stats in server.calls.items():
+                calls['%s %s' % (name, endpoint)] = dict(stats)
+        return calls
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
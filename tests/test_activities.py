@@ -0,0 +1,101 @@
+# coding=UTF-8
+# Load the appropriate libraries on the Python path
+import os
+import sys
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'])
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'] + '/lib/yaml/lib')
+sys.path.insert(1, os.path.abspath('lib'))
+
+from .context import sync
+from .stub_case import StubTestCase
+
+import mock
+import unittest
+
+
+class ActivityCatchUpTestCase(StubTestCase):
+    """
+    Check the Email sent activities catch-up job.
+    """
+    use_testbed = True
+
+    def run_job(self):
+        self.backends.reset_stats()
+        with sync.app.app_context():
+            return sync.tasks.create_activities_in_pipedrive_for_emails_sent()
+
+    def test_catch_up(self):
+        self.backends.marketo.generate_activities([10, 20, 30], 'Send Email', 2)  # Lead 10 is not linked
+        rv = self.run_job()
+        self.assertEqual(rv['status'], ['created'] * 6)  # Including the 2 activities of the fixtures
+        calls = self.backends.calls()
+        self.assertEqual(calls['marketo POST /rest/v1/leads.json']['count'], 1)  # Leads loaded in one call
+        self.assertEqual(calls['marketo GET /rest/asset/v1/email/{id}/content.json']['count'], 1)
+        self.assertEqual(calls['pipedrive POST /v1/activities']['count'], 6)
+
+        self.assertEqual(self.run_job()['status'], [])  # Nothing new since the watermark
+
+        self.backends.marketo.generate_activities([20], 'Send Email', 1)
+        self.assertEqual(self.run_job()['status'], ['created'])
+
+    def test_failed_activity_retried(self):
+        self.backends.marketo.generate_activities([20], 'Send Email', 2)
+        with sync.app.app_context():
+            sync.get_pipedrive_client().get_entity_fields('activity')  # Let the error hit the first activity save
+            self.backends.pipedrive.inject_errors(1)
+            rv = sync.tasks.create_activities_in_pipedrive_for_emails_sent()
+        self.assertEqual(sorted(rv['status']), ['created', 'created', 'created', 'error'])  # Saved concurrently
+        self.assertEqual(self.run_job()['status'], ['created'])  # Only the failed activity is synchronized again
+
+    @mock.patch.object(sync.tasks, 'EMAIL_SENT_MAX_ATTEMPTS', 2)
+    def test_failed_activity_given_up(self):
+        with sync.app.app_context():
+            sync.get_pipedrive_client().get_entity_fields('activity')
+            for statuses in (['created', 'error'], ['error']):
+                self.backends.pipedrive.inject_errors(1)
+                rv = sync.tasks.create_activities_in_pipedrive_for_emails_sent()
+                self.assertEqual(sorted(rv['status']), statuses)
+        watermark = sync.util.Watermark.get_by_id('create_activities_in_pipedrive_for_emails_sent')
+        self.assertEqual(watermark.failed_ids, [])  # Given up after its second attempt
+        self.assertEqual(self.run_job()['status'], [])
+
+    def test_lead_activities_skipped(self):
+        self.backends.marketo.generate_activities([20, 30], 'Send Email', 1)
+        with sync.app.app_context():
+            rv = sync.tasks.create_activity_in_pipedrive_for_email_sent(20)  # Enqueued by the email_sent webhook
+        self.assertEqual(rv['status'], ['created'] * 3)
+        self.assertEqual(self.run_job()['status'], ['created'])  # Only the activity of lead 30
+
+    @mock.patch.object(sync.tasks, 'EMAIL_SENT_PAGE_SIZE', 2)
+    def test_checkpoint_per_page(self):
+        # 2 pages with the activities of the fixtures, sent after them
+        self.backends.marketo.generate_activities([20], 'Send Email', 2, '2100-01-01T00:02:00Z')
+        get_activities_page = sync.marketo.MarketoClient._get_activities_page
+        pages = []
+
+        def interrupt_after_first_page(client, *args):
+            if pages:
+                raise RuntimeError('Deadline exceeded')
+            pages.append(get_activities_page(client, *args))
+            return pages[-1]
+
+        with mock.patch.object(sync.marketo.MarketoClient, '_get_activities_page', interrupt_after_first_page):
+            self.assertRaises(RuntimeError, self.run_job)
+        watermark = sync.util.Watermark.get_by_id('create_activities_in_pipedrive_for_emails_sent')
+        self.assertEqual(watermark.last_id, pages[0][-1]['id'])
+        self.assertEqual(self.run_job()['status'], ['created'] * 2)  # Only the second page is synchronized again
+
+    def test_failed_lead_activity_retried(self):
+        self.backends.marketo.generate_activities([20], 'Send Email', 2)
+        with sync.app.app_context():
+            sync.get_pipedrive_client().get_entity_fields('activity')  # Let the error hit the first activity save
+            self.backends.pipedrive.inject_errors(1)
+            self.assertRaises(sync.common.SavingError, sync.tasks.create_activity_in_pipedrive_for_email_sent, 20)
+            self.backends.reset_stats()
+            rv = sync.tasks.create_activity_in_pipedrive_for_email_sent(20)  # Task retried by its queue
+        self.assertEqual(rv['status'], ['created'])  # The saved activities are not created again
+        self.assertEqual(self.backends.calls()['pipedrive POST /v1/activities']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# coding=UTF-8
+# Load the appropriate libraries on the Python path
+import os
+import sys
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'])
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'] + '/lib/yaml/lib')
+sys.path.insert(1, os.path.abspath('lib'))
+
+from .context import sync
+from .stub_case import StubTestCase
+
+import mock
+import unittest
+
+
+class DealFilterTestCase(StubTestCase):
+    """
+    Check the deals are filtered by pipeline from the cached pipelines.
+    """
+    use_testbed = True
+
+    @mock.patch.object(sync.mappings, 'PIPELINE_FILTER_NAMES', ['Fake Pipeline'])
+    def test_pipelines_cached(self):
+        with sync.app.app_context():
+            rv = sync.tasks.create_or_update_opportunity_in_marketo(20)
+            self.assertIn(rv['opportunity']['status'], ('created', 'updated'))
+            sync.tasks.create_or_update_opportunity_in_marketo(30)
+        calls = self.backends.calls()
+        self.assertEqual(calls['pipedrive GET /v1/pipelines']['count'], 1)
+        self.assertEqual(calls['pipedrive GET /v1/stages']['count'], 1)
+        self.assertNotIn('pipedrive GET /v1/pipelines/{id}', calls)
+        self.assertNotIn('pipedrive GET /v1/stages/{id}', calls)
+
+    @mock.patch.object(sync.mappings, 'PIPELINE_FILTER_NAMES', ['Fake Pipeline'])
+    @mock.patch.object(sync.pipedrive.PipedriveClient, 'PAGE_SIZE', 2)
+    def test_participant_roles(self):
+        self.backends.pipedrive.add_participants(20, [20, 30, 10])  # Person 10 is not synchronized with a lead
+        with sync.app.app_context():
+            rv = sync.tasks.create_or_update_opportunity_in_marketo(20)
+        self.assertEqual(len(rv['roles']), 2)  # Contact person 20 and participant 30
+        self.assertTrue(all(role['status'] in ('created', 'updated') for role in rv['roles']))
+        calls = self.backends.calls()
+        self.assertEqual(calls['marketo POST /rest/v1/opportunities/roles.json']['count'], 1)
+        self.assertEqual(calls['pipedrive GET /v1/deals/{id}/participants']['count'], 2)  # Every page read
+        self.assertEqual(calls['pipedrive GET /v1/persons/{id}']['count'], 1)  # Only the contact person loaded
+
+    @mock.patch.object(sync.mappings, 'PIPELINE_FILTER_NAMES', ['Fake Pipeline'])
+    def test_role_not_saved(self):
+        with sync.app.app_context():
+            with mock.patch.object(sync.marketo.MarketoClient, 'put_entities'):  # No role result
+                self.assertRaises(sync.common.SavingError, sync.tasks.create_or_update_opportunity_in_marketo, 20)
+
+    def test_deal_skipped(self):
+        with sync.app.app_context():
+            rv = sync.tasks.create_or_update_opportunity_in_marketo(20)
+        self.assertEqual(rv['status'], 'skipped')
+        self.assertIn('pipeline=Fake Pipeline', rv['message'])
+        self.assertNotIn('marketo POST /rest/v1/opportunities.json', self.backends.calls())
+
+
+if __name__ == '__main__':
+    unittest.main()
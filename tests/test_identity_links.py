@@ -0,0 +1,132 @@
+# coding=UTF-8
+# Load the appropriate libraries on the Python path
+import os
+import sys
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'])
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'] + '/lib/yaml/lib')
+sys.path.insert(1, os.path.abspath('lib'))
+
+from .context import sync
+from .stub_case import StubTestCase
+
+import mock
+import threading
+import unittest
+
+from google.appengine.ext import ndb
+
+
+class IdentityLinkTestCase(StubTestCase):
+    """
+    Check the links between entities stored in the datastore spare the lookups.
+    """
+    use_testbed = True
+
+    def run_task(self, task_name, argument):
+        self.backends.reset_stats()
+        with sync.app.app_context():
+            return getattr(sync.tasks, task_name)(argument)
+
+    def test_organization_linked(self):
+        company_external_id = self.backends.marketo.generate('company', 1)[0]['externalCompanyId']
+        rv = self.run_task('create_or_update_organization_in_pipedrive', company_external_id)
+        self.assertEqual(rv['status'], 'created')
+        self.assertIn('pipedrive GET /v1/organizations/find', self.backends.calls())
+
+        self.assertEqual(self.run_task('create_or_update_organization_in_pipedrive', company_external_id)['id'],
+                         rv['id'])
+        calls = self.backends.calls()
+        self.assertEqual(calls['pipedrive GET /v1/organizations/{id}']['count'], 1)  # Linked organization loaded
+        self.assertNotIn('pipedrive GET /v1/organizations/find', calls)
+        self.assertNotIn('pipedrive GET /v1/filters', calls)
+
+    def test_lead_linked(self):
+        person_id = self.backends.pipedrive.generate('person', 1)[0]['id']
+        rv = self.run_task('create_or_update_lead_in_marketo', person_id)
+        self.assertEqual(sync.util.IdentityLink.get_linked_id('person', person_id), rv['id'])
+        self.assertEqual(sync.util.IdentityLink.get_linked_id('lead', rv['id']), person_id)
+
+    def test_skipped_entities_linked(self):
+        company_id = self.run_task('create_or_update_company_in_marketo', 20)['id']
+        ndb.delete_multi([ndb.Key(sync.util.IdentityLink, 'organization:20'),
+                          ndb.Key(sync.util.IdentityLink, 'company:%s' % company_id)])
+        rv = self.run_task('create_or_update_company_in_marketo', 20)  # Found by the marketoid of the organization
+        self.assertEqual(rv['status'], 'skipped')
+        self.assertEqual(sync.util.IdentityLink.get_linked_id('organization', 20), rv['id'])
+        self.assertEqual(sync.util.IdentityLink.get_linked_id('company', rv['id']), 20)
+
+    def test_organization_resolved_once_per_task(self):
+        company_external_id = self.backends.marketo.generate('company', 1)[0]['externalCompanyId']
+        self.backends.reset_stats()
+        with sync.app.app_context():
+            organization_id = sync.tasks.resolve_organization_in_pipedrive(company_external_id)
+            self.assertEqual(sync.tasks.resolve_organization_in_pipedrive(company_external_id), organization_id)
+        self.assertEqual(self.backends.calls()['marketo POST /rest/v1/companies.json']['count'], 1)
+
+    def test_company_changes_synchronized(self):
+        company = self.backends.marketo.generate('company', 1)[0]
+        lead_ids = [lead['id'] for lead in self.backends.marketo.generate(
+            'lead', 2, company=company['company'], externalCompanyId=company['externalCompanyId'])]
+
+        self.run_task('create_or_update_person_in_pipedrive', lead_ids[0])
+        company['billingCity'] = 'Changed City'
+        self.run_task('create_or_update_person_in_pipedrive', lead_ids[1])
+        self.assertIn('pipedrive PUT /v1/organizations/{id}', self.backends.calls())  # Change of the next task pushed
+
+    def test_concurrent_resolutions(self):
+        company_external_id = self.backends.marketo.generate('company', 1)[0]['externalCompanyId']
+        count_cache_access = sync.common.util.count_cache_access
+        create_or_update_organization = sync.tasks.create_or_update_organization_in_pipedrive
+        shared = []
+        all_shared = threading.Event()
+
+        def count_shared_call(name, hit):
+            count_cache_access(name, hit)
+            if hit:
+                shared.append(name)
+                if len(shared) == 3:
+                    all_shared.set()
+
+        def create_or_update_organization_once_shared(*args):
+            all_shared.wait(5)  # Keep the call running until the other tasks wait for it
+            return create_or_update_organization(*args)
+
+        def resolve():
+            with sync.app.app_context():
+                organization_ids.append(sync.tasks.resolve_organization_in_pipedrive(company_external_id))
+
+        organization_ids = []
+        threads = [threading.Thread(target=resolve) for _ in range(4)]
+        with mock.patch.object(sync.common.util, 'count_cache_access', count_shared_call), \
+                mock.patch.object(sync.tasks, 'create_or_update_organization_in_pipedrive',
+                                  create_or_update_organization_once_shared):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertTrue(all_shared.is_set())
+        self.assertEqual(len(set(organization_ids)), 1)
+        self.assertEqual(self.backends.calls()['pipedrive POST /v1/organizations']['count'], 1)
+
+    def test_shared_call_timeout(self):
+        calls = sync.common.SharedCalls('test', timeout=0.01)
+        running = threading.Event()
+        release = threading.Event()
+
+        def wait_for_release():
+            running.set()
+            release.wait()
+
+        thread = threading.Thread(target=calls.call, args=('key', wait_for_release))
+        thread.start()
+        running.wait()
+        try:
+            self.assertRaises(sync.common.Error, calls.call, 'key', lambda: 'shared')  # The task is retried
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(calls.call('key', lambda: 'called again'), 'called again')
+
+
+if __name__ == '__main__':
+    unittest.main()
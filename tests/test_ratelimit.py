@@ -0,0 +1,95 @@
+# coding=UTF-8
+# Load the appropriate libraries on the Python path
+import os
+import sys
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'])
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'] + '/lib/yaml/lib')
+sys.path.insert(1, os.path.abspath('lib'))
+
+from .context import sync
+import sync.common.ratelimit
+from .stub_case import StubTestCase
+
+import mock
+import threading
+import time
+import unittest
+
+
+class FakeClock(object):
+    """
+    Clock replacing time.time and time.sleep for the rate limiters and the stub servers: sleeping moves it forward
+    without waiting, so that the tests do not depend on the wall-clock time.
+    """
+
+    def __init__(self):
+        self.now = time.time()
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += seconds
+
+    def __enter__(self):
+        self._patches = [mock.patch('time.time', self.time), mock.patch('time.sleep', self.sleep)]
+        for patch in self._patches:
+            patch.start()
+        return self
+
+    def __exit__(self, *args):
+        for patch in self._patches:
+            patch.stop()
+
+
+class RateLimiterTestCase(StubTestCase):
+    """
+    Check the clients throttle their calls to the stub servers limits.
+    """
+
+    def test_token_bucket(self):
+        with FakeClock() as clock:
+            rate_limiter = sync.common.ratelimit.RateLimiter(10, 1)
+            start = clock.now
+            for _ in range(15):
+                rate_limiter.acquire()
+            self.assertAlmostEqual(clock.now - start, 0.5, 3)  # 10 calls at once, then 1 every 0.1s
+
+    def test_low_priority(self):
+        with FakeClock():
+            rate_limiter = sync.common.ratelimit.RateLimiter(10, 1)
+            low_priority = sync.common.ratelimit.LowPriorityRateLimiter(rate_limiter)
+            for _ in range(5):
+                self.assertEqual(low_priority.acquire(), 0)
+            self.assertAlmostEqual(low_priority.acquire(), 0.1, 3)  # The other tokens are kept for the other calls
+            for _ in range(5):
+                self.assertEqual(rate_limiter.acquire(), 0)
+
+    def test_pipedrive_headers(self):
+        self.backends.pipedrive.rate_limit = 10
+        rate_limiter = sync.common.ratelimit.RateLimiter(100, 1)  # Let the headers do the throttling
+        pd = sync.pipedrive.PipedriveClient(rate_limiter=rate_limiter, **self.backends.pipedrive_client_config())
+        with FakeClock() as clock:
+            start = clock.now
+            for _ in range(15):
+                self.assertEqual(sync.pipedrive.Person(pd, 10).id, 10)
+            self.assertGreaterEqual(clock.now - start, 1)  # Paused until the window reset reported by the headers
+        calls = self.backends.calls()
+        self.assertEqual(calls['pipedrive GET /v1/persons/{id}']['count'], 15)  # Never rate limited
+
+    def test_marketo_rate_limit_error(self):
+        self.backends.marketo.rate_limit = 5
+        rate_limiter = sync.marketo.MarketoRateLimiter(100, 1)
+        mkto = sync.marketo.MarketoClient(rate_limiter=rate_limiter, **self.backends.marketo_client_config())
+        with FakeClock() as clock:
+            start = clock.now
+            for _ in range(6):
+                sync.marketo.Lead(mkto, 10)
+            self.assertGreaterEqual(clock.now - start, 1)  # Paused for a window by the 606 error
+            self.assertEqual(sync.marketo.Lead(mkto, 10).id, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
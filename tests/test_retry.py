@@ -0,0 +1,68 @@
+# coding=UTF-8
+# Load the appropriate libraries on the Python path
+import os
+import sys
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'])
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'] + '/lib/yaml/lib')
+sys.path.insert(1, os.path.abspath('lib'))
+
+from .context import sync
+import sync.common.retry
+import sync.common.tracing
+from .stub_case import StubTestCase
+
+import requests
+import unittest
+
+
+class RetryPolicyTestCase(StubTestCase):
+    """
+    Check the clients retry the calls failing with a transient error.
+    """
+
+    def setUp(self):
+        super(RetryPolicyTestCase, self).setUp()
+        self.tracer = sync.common.tracing.CallTracer()
+        self.retry_policy = sync.common.retry.RetryPolicy('stub', max_retries=2, backoff=0.01)
+        self.mkto = sync.marketo.MarketoClient(tracer=self.tracer, retry_policy=self.retry_policy,
+                                               **self.backends.marketo_client_config())
+        self.pd = sync.pipedrive.PipedriveClient(tracer=self.tracer, retry_policy=self.retry_policy,
+                                                 **self.backends.pipedrive_client_config())
+        sync.common.retry.pop_retry_stats()
+
+    def test_retry_get(self):
+        self.backends.pipedrive.inject_errors(2)
+        self.assertEqual(sync.pipedrive.Person(self.pd, 10).id, 10)
+        self.backends.marketo.inject_errors(1)  # Marketo 604 error
+        self.assertEqual(sync.marketo.Lead(self.mkto, 10).id, 10)
+        self.assertEqual(self.tracer.summary()['retries'], 3)
+        self.assertEqual(sync.common.retry.pop_retry_stats(), {'stub': {'retries': 3}})
+
+    def test_max_retries(self):
+        sync.pipedrive.Person(self.pd, 10)
+        self.backends.pipedrive.inject_errors(3)
+        self.assertRaises(requests.HTTPError, sync.pipedrive.Person, self.pd, 10)
+        self.assertEqual(sync.common.retry.pop_retry_stats(), {'stub': {'retries': 2, 'failures': 1}})
+
+    def test_post_not_retried(self):
+        person = sync.pipedrive.Person(self.pd)
+        person.name = 'Stub Person'
+        self.backends.pipedrive.inject_errors(1)
+        self.assertRaises(requests.HTTPError, person.save)
+        self.assertEqual(self.tracer.summary()['retries'], 0)
+
+        self.retry_policy.retry_posts = True
+        self.backends.pipedrive.inject_errors(1)
+        person.save()
+        self.assertIsNotNone(person.id)
+
+    def test_retry_budget(self):
+        self.retry_policy.min_budget = 1
+        self.retry_policy.budget_ratio = 0
+        self.backends.pipedrive.inject_errors(3)
+        self.assertRaises(requests.HTTPError, sync.pipedrive.Person, self.pd, 10)
+        self.assertEqual(sync.common.retry.pop_retry_stats(), {'stub': {'retries': 1, 'exhausted': 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
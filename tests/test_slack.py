@@ -0,0 +1,69 @@
+# coding=UTF-8
+# Load the appropriate libraries on the Python path
+import os
+import sys
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'])
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'] + '/lib/yaml/lib')
+sys.path.insert(1, os.path.abspath('lib'))
+
+from .context import sync
+import sync.gae_handler
+from .stub_case import StubTestCase
+
+import mock
+import unittest
+
+
+class SlackTestCase(StubTestCase):
+    """
+    Check the Slack notifications are queued by the deal tasks and posted by their own tasks.
+    """
+    use_testbed = True
+
+    def run_slack_tasks(self):
+        tasks = self.taskqueue_stub.get_filtered_tasks(queue_names='notify')
+        self.taskqueue_stub.FlushQueue('notify')
+        status_codes = []
+        with sync.gae_handler.gae_app.test_client() as c:
+            for task in tasks:
+                rv = c.post(task.url, data=task.payload, content_type='application/x-www-form-urlencoded',
+                            headers={'X-AppEngine-TaskName': task.name})
+                status_codes.append(rv.status_code)
+        return status_codes
+
+    def test_status_posted(self):
+        self.backends.pipedrive.store['deal'][20].update(status='won', value=200000)
+        with sync.app.app_context():
+            rv = sync.tasks.notify_deal_in_slack_for_status(20)
+        self.assertEqual(rv['status'], 'queued')
+        self.assertEqual(self.backends.slack.messages, [])  # Not posted by the deal task
+
+        self.backends.slack.inject_errors(1)
+        self.assertEqual(sorted(self.run_slack_tasks()), [200, 500])
+        self.assertEqual(len(self.backends.slack.messages), 1)
+        with sync.app.app_context():  # Only the failed post is posted again
+            statuses = [sync.tasks.send_slack_message(id_)['status'] for id_ in rv['id']]
+        self.assertEqual(sorted(statuses), ['sent', 'skipped'])
+        self.assertEqual(sorted(message.get('channel') for message in self.backends.slack.messages), [None, '#general'])
+
+    def test_note_digest(self):
+        sync.app.config['SLACK_NOTE_DIGEST_DELAY'] = 60
+        with sync.app.app_context():
+            for _ in range(3):
+                self.backends.pipedrive.generate_notes(20, 1)
+                sync.tasks.notify_deal_in_slack_for_note(20)
+        self.assertEqual(self.run_slack_tasks(), [200])  # A single digest
+        self.assertEqual(len(self.backends.slack.messages), 1)
+        self.assertEqual(len(self.backends.slack.messages[0]['attachments']), 3)
+
+    def test_note_rendering(self):
+        self.assertEqual(sync.slack.render_note(u'Plain note'), u'Plain note')
+        self.assertEqual(sync.slack.render_note(u'<p>Rich <b>note</b></p>').strip(), u'Rich **note**')
+        with mock.patch('sync.slack._html_to_text', return_value=u'Cached note') as html_to_text:
+            for _ in range(2):
+                self.assertEqual(sync.slack.render_note(u'<p>Cached note</p>'), u'Cached note')
+        self.assertEqual(html_to_text.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+# coding=UTF-8
+# Load the appropriate libraries on the Python path
+import os
+import sys
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'])
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'] + '/lib/yaml/lib')
+sys.path.insert(1, os.path.abspath('lib'))
+
+from .context import sync
+import sync.common.batch
+from .stub_case import StubTestCase
+
+import requests
+import time
+import unittest
+
+
+class StubServerTestCase(StubTestCase):
+    """
+    Exercise the real clients HTTP path against the local stub servers.
+    """
+    backends_options = {'seed': 1}
+
+    def setUp(self):
+        super(StubServerTestCase, self).setUp()
+        self.mkto = sync.marketo.MarketoClient(**self.backends.marketo_client_config())
+        self.pd = sync.pipedrive.PipedriveClient(**self.backends.pipedrive_client_config())
+
+    def test_load_fixtures(self):
+        lead = sync.marketo.Lead(self.mkto, 20)
+        self.assertEqual(lead.email, 'lead@testlinkedflask.com')
+        company = sync.marketo.Company(self.mkto, 'pd-organization-20', 'externalCompanyId')
+        self.assertEqual(company.id, 20)
+        person = sync.pipedrive.Person(self.pd, 20)
+        self.assertEqual(person.organization.id, 20)
+        organization = sync.pipedrive.Organization(self.pd, '20', 'marketoid')
+        self.assertEqual(organization.id, 20)
+
+    def test_save_and_reload(self):
+        lead = sync.marketo.Lead(self.mkto)
+        lead.email = 'stub@testflask.com'
+        lead.save()
+        self.assertIsNotNone(lead.id)
+        self.assertEqual(sync.marketo.Lead(self.mkto, lead.id).email, 'stub@testflask.com')
+
+        person = sync.pipedrive.Person(self.pd)
+        person.name = 'Stub Person'
+        person.save()
+        self.assertEqual(sync.pipedrive.Person(self.pd, person.id).name, 'Stub Person')
+
+    def test_generate(self):
+        persons = self.backends.pipedrive.generate('person', 50)
+        self.assertEqual(len(persons), 50)
+        self.assertEqual(sync.pipedrive.Person(self.pd, persons[-1]['id']).email,
+                         persons[-1]['email'][0]['value'])
+        leads = self.backends.marketo.generate('lead', 10)
+        loaded_leads = self.mkto.get_entities('lead', [lead['id'] for lead in leads], 'id')
+        self.assertEqual(len(loaded_leads), 10)
+
+    def test_calls_accounting(self):
+        sync.pipedrive.Person(self.pd, 10)
+        sync.pipedrive.Person(self.pd, 20)
+        calls = self.backends.calls()
+        self.assertEqual(calls['pipedrive GET /v1/persons/{id}']['count'], 2)
+        self.assertEqual(calls['pipedrive GET /v1/personFields']['count'], 1)
+        self.assertGreater(calls['pipedrive GET /v1/persons/{id}']['bytes_out'], 0)
+
+    def test_rate_limit(self):
+        self.backends.pipedrive.rate_limit = 2
+        self.backends.pipedrive.rate_window = 60
+        r = requests.get(self.backends.pipedrive.url + '/v1/persons/10', params={'api_token': 'stub'})
+        self.assertEqual(r.headers['X-RateLimit-Remaining'], '1')
+        requests.get(self.backends.pipedrive.url + '/v1/persons/10', params={'api_token': 'stub'})
+        r = requests.get(self.backends.pipedrive.url + '/v1/persons/10', params={'api_token': 'stub'})
+        self.assertEqual(r.status_code, 429)
+
+    def test_error_injection(self):
+        self.backends.pipedrive.inject_errors(1)
+        self.assertRaises(requests.HTTPError, sync.pipedrive.Person, self.pd, 10)
+        self.assertEqual(sync.pipedrive.Person(self.pd, 10).id, 10)
+
+    def test_save_roles(self):
+        with sync.app.app_context():
+            roles = []
+            for deal_id, lead_id in ((10, 10), (20, 20), (20, 10)):
+                role = sync.marketo.Role(sync.get_marketo_client())
+                role.externalOpportunityId = sync.marketo.compute_external_id('deal', deal_id)
+                role.leadId = lead_id
+                role.role = 'Default Role'
+                roles.append(role)
+            self.backends.reset_stats()
+            rv = sync.tasks.save_roles_in_marketo(roles)
+        self.assertEqual(len(rv), 3)
+        self.assertTrue(all(role['status'] in ('created', 'updated') and role['id'] for role in rv))
+        self.assertEqual(self.backends.calls()['marketo POST /rest/v1/opportunities/roles.json']['count'], 1)
+
+    def test_concurrent_saver(self):
+        saver = sync.common.batch.ConcurrentSaver(max_in_flight=3)
+        for i in range(6):
+            activity = sync.pipedrive.Activity(self.pd)
+            activity.subject = 'Stub activity %d' % i
+            activity.person_id = 10
+            saver.add(activity)
+        self.backends.pipedrive.latency = 0.1
+        self.backends.pipedrive.inject_errors(1)
+        start = time.time()
+        outcomes = saver.flush()
+        self.assertLess(time.time() - start, 0.5)  # 2 rounds of 3 calls
+        self.assertEqual(len(outcomes), 6)
+        self.assertEqual(len([outcome for outcome in outcomes if outcome['status'] == 'error']), 1)
+        self.assertEqual(len([outcome for outcome in outcomes if outcome['status'] == 'created' and outcome['id']]), 5)
+
+    def test_activity_types_cache(self):
+        self.assertEqual(self.mkto.get_activity_type_ids(['Send Email']), [6])
+        other_mkto = sync.marketo.MarketoClient(**self.backends.marketo_client_config())
+        sync.marketo.Lead(other_mkto, 20).get_activities(['Send Email'])
+        self.assertEqual(self.backends.calls()['marketo GET /rest/v1/activities/types.json']['count'], 1)
+
+    def test_fields_projection(self):
+        sync.marketo.Lead(self.mkto, 20)
+        full_size = self.backends.calls()['marketo POST /rest/v1/leads.json']['bytes_in']
+        self.backends.reset_stats()
+        lead = sync.marketo.Lead(self.mkto, 20, fields=['company'])
+        self.assertEqual(lead.company, 'Test Flask Linked Company')
+        self.assertEqual(lead.email, 'lead@testlinkedflask.com')  # Fields to update are always loaded
+        self.assertIn('externalCompanyId', lead._get_fields_to_load())
+        self.assertNotIn('sicCode', lead._get_fields_to_load())
+        self.assertLess(self.backends.calls()['marketo POST /rest/v1/leads.json']['bytes_in'], full_size)
+
+    def test_pipedrive_fields_projection(self):
+        person = sync.pipedrive.Person(self.pd, 20, fields=['name'])
+        self.assertEqual(person.name, 'Test Linked Flask Person')
+        self.assertRaises(AttributeError, getattr, person, 'marketoid')  # Not loaded
+        self.assertNotIn('org_name', vars(person))
+        person.title = 'Stub Title'
+        person.save()
+        person = sync.pipedrive.Person(self.pd, 20)
+        self.assertEqual(person.title, 'Stub Title')
+        self.assertEqual(person.marketoid, '20')  # Not cleared
+
+    def test_streamed_lists(self):
+        self.backends.pipedrive.generate('organization', 20)
+        organizations = self.pd.get_entity_data('organization', None, stream=True)
+        self.assertFalse(isinstance(organizations, list))
+        self.assertEqual(list(organizations), self.pd.get_entity_data('organization', None))
+
+        type_ids = self.mkto.get_activity_type_ids(['Send Email'])
+        self.backends.marketo.generate_activities([10, 20], 'Send Email', 200)
+        activities = self.mkto.get_activities(type_ids, '2016-01-01T00:00:00', 150, stream=True)
+        self.assertEqual(list(activities), self.mkto.get_activities(type_ids, '2016-01-01T00:00:00', 150))
+
+    def test_paginated_lists(self):
+        self.backends.pipedrive.generate('organization', 25)
+        ids = sorted(self.backends.pipedrive.store['organization'])
+        self.backends.reset_stats()
+        for options in ({}, {'prefetch': True}, {'stream': True}):
+            organizations = self.pd.iter_entities('organization', page_size=10, **options)
+            self.assertEqual([organization['id'] for organization in organizations], ids)
+        pages = (len(ids) + 9) // 10
+        self.assertEqual(self.backends.calls()['pipedrive GET /v1/organizations']['count'], pages * 3)
+
+        note_ids = [note['id'] for note in self.backends.pipedrive.generate_notes(10, 5)]
+        notes = self.pd.iter_entities('note', {'deal_id': 10, 'sort': 'id DESC'}, page_size=2, prefetch=True)
+        self.assertEqual([note['id'] for note in notes], note_ids[::-1])
+        self.assertRaises(ValueError, next, self.pd.iter_entities('deal', prefetch=True, stream=True))
+
+    def test_latest_note(self):
+        notes = self.backends.pipedrive.generate_notes(20, 150)
+        self.backends.reset_stats()
+        note = sync.pipedrive.Note(self.pd, 20, 'deal_id')
+        self.assertEqual(note.id, notes[-1]['id'])
+        self.assertLess(self.backends.calls()['pipedrive GET /v1/notes']['bytes_out'], 1000)  # A single note sent
+
+    def test_streamed_token_expiry(self):
+        fields = list(self.mkto._fetch_data('lead', 'describe'))
+        self.backends.marketo.expire_tokens()
+        self.assertEqual(list(self.mkto._fetch_data('lead', 'describe', stream=True)), fields)  # Replayed
+        self.assertEqual(self.backends.calls()['marketo GET /identity/oauth/token']['count'], 2)
+
+    def test_token_expiry(self):
+        sync.marketo.Lead(self.mkto, 10)
+        self.backends.marketo.expire_tokens()
+        self.assertEqual(sync.marketo.Lead(self.mkto, 10).id, 10)
+        self.assertEqual(self.backends.calls()['marketo GET /identity/oauth/token']['count'], 2)
+
+    def test_token_expiry_replays_payload(self):
+        lead = sync.marketo.Lead(self.mkto)
+        lead.email = 'expired@testflask.com'
+        self.backends.marketo.expire_tokens()
+        lead.save()
+        self.assertEqual(sync.marketo.Lead(self.mkto, lead.id).email, 'expired@testflask.com')
+        self.assertEqual(self.backends.calls()['marketo POST /rest/v1/leads.json']['count'], 3)  # Save replayed once
+
+    def test_token_refreshed_before_expiry(self):
+        self.backends.marketo.token_ttl = 1
+        mkto = sync.marketo.MarketoClient(**self.backends.marketo_client_config())
+        time.sleep(1.1)
+        self.backends.reset_stats()
+        self.assertEqual(sync.marketo.Lead(mkto, 10).id, 10)
+        calls = self.backends.calls()
+        self.assertEqual(calls['marketo GET /identity/oauth/token']['count'], 1)
+        self.assertEqual(calls['marketo POST /rest/v1/leads.json']['count'], 1)  # No expired token error
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -61,6 +61,7 @@ RESOURCE_MAPPING = {
     '/v1/deals/10'                          : {'{}': 'resources/deal10.json'},
     '/v1/deals/20'                          : {'{}': 'resources/deal20.json'},
     '/v1/deals/30'                          : {'{}': 'resources/deal30.json'},
+    '/v1/pipelines'                         : {'{}': 'resources/pipelines.json'},
     '/v1/pipelines/12'                      : {'{}': 'resources/pipeline12.json'},
     '/v1/opportunities/describe.json'       : {'{}': 'resources/opportunityFields.json'},
     '/v1/opportunities/roles/describe.json' : {'{}': 'resources/opportunityRoleFields.json'},
@@ -69,6 +70,7 @@ RESOURCE_MAPPING = {
         "{'filterType': 'externalOpportunityId', 'filterValues': 'pd-deal-20'}": 'resources/opportunity20.json',
         "{'filterType': 'externalOpportunityId', 'filterValues': 'pd-deal-30'}": 'resources/opportunity30.json'
     },
+    '/v1/stages'                            : {'{}': 'resources/stages.json'},
     '/v1/stages/34'                         : {'{}': 'resources/stage34.json'},
     '/v1/activityFields'                    : {'{}': 'resources/activityFields.json'},
     '/v1/filters'                           : {'{}': 'resources/filters.json'},
@@ -85,6 +87,7 @@ RESOURCE_MAPPING = {
 
 def side_effect_get(*args, **kwargs):
     rv = mock.MagicMock(spec=requests.Response)
+    rv.status_code = 200  # Read by the retry policy
     if 'params' in kwargs:
         params = kwargs['params']
         if 'filterType' in params and 'filterValues' in params:
@@ -108,6 +111,7 @@ def side_effect_get(*args, **kwargs):
 
 def side_effect_post(*args, **kwargs):
     rv = mock.MagicMock(spec=requests.Response)
+    rv.status_code = 200  # Read by the retry policy
     payload = kwargs['data']
     if 'filterType' in payload and 'filterValues' in payload:
         value = "{'filterType': '%s', 'filterValues': '%s'}" % (payload['filterType'], payload['filterValues'])
@@ -124,6 +128,7 @@ def side_effect_post(*args, **kwargs):
 
 def side_effect_put(*args, **kwargs):
     rv = mock.MagicMock(spec=requests.Response)
+    rv.status_code = 200  # Read by the retry policy
     value = '{}'
     endpoint = [key for key in RESOURCE_MAPPING if re.match('^.*%s$' % key, args[0])][0]
     url = RESOURCE_MAPPING[endpoint][value]
@@ -169,6 +174,13 @@ def mock_save_role(role):
 mock_save_role.counter = 0
 
 
+def mock_put_roles(client, entity_name, roles):
+    for role in roles:
+        mock_save_role(role)
+        role.status = 'created'
+    return roles
+
+
 def mock_save_person(person):
     if not person.id:
         mock_save_person.counter += 1
@@ -205,16 +217,16 @@ def setup_get_filter_mock(mock_get_filter, filter_id):
 @mock.patch.object(sync.marketo.Lead, 'save', mock_save_lead)
 @mock.patch.object(sync.marketo.Company, 'save', mock_save_company)
 @mock.patch.object(sync.marketo.Opportunity, 'save', mock_save_opportunity)
-@mock.patch.object(sync.marketo.Role, 'save', mock_save_role)
+@mock.patch.object(sync.marketo.MarketoClient, 'put_entities', mock_put_roles)
 @mock.patch.object(sync.pipedrive.Person, 'save', mock_save_person)
 @mock.patch.object(sync.pipedrive.Organization, 'save', mock_save_organization)
 @mock.patch.object(sync.pipedrive.Activity, 'save', mock_save_activity)
-@mock.patch('sync.sync.marketo.MarketoClient._get_auth_token')
+@mock.patch('sync.marketo.MarketoClient._get_auth_token')
 class SyncTestCase(unittest.TestCase):
     AUTHENTICATION_PARAM = '?api_key=' + sync.app.config['FLASK_AUTHORIZED_KEYS']['test']
 
     @classmethod
-    @mock.patch('sync.sync.marketo.MarketoClient._get_auth_token')
+    @mock.patch('sync.marketo.MarketoClient._get_auth_token')
     def setUpClass(cls, mock_mkto_get_token):
         cls.context = sync.app.app_context()
         cls.context.push()
@@ -234,7 +246,7 @@ class SyncTestCase(unittest.TestCase):
 
         # root_path must be set the the location of queue.yaml.
         # Otherwise, only the 'default' queue will be available.
-        cls.testbed.init_taskqueue_stub(root_path='..')
+        cls.testbed.init_taskqueue_stub(root_path=sync.app.root_path + '/..')
         cls.taskqueue_stub = cls.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
 
         cls.mkto = sync.marketo.MarketoClient('', '', '', '')
@@ -319,7 +331,7 @@ class SyncTestCase(unittest.TestCase):
         self.assertEquals(synced_organization.number_of_employees, 10)
         self.assertEquals(synced_organization.marketoid, '10')
 
-    @mock.patch('sync.sync.pipedrive.PipedriveClient.get_organization_marketoid_filter')
+    @mock.patch('sync.pipedrive.PipedriveClient.get_organization_marketoid_filter')
     def test_update_person_and_linked_organization_in_pipedrive(self, mock_get_filter, mock_mkto_get_token, mock_put, mock_post, mock_get):
         setup_get_filter_mock(mock_get_filter, 2)
 
@@ -371,7 +383,7 @@ class SyncTestCase(unittest.TestCase):
         # Test values
         self.assertEquals(synced_organization.name, 'Test Flask Linked Company')
 
-    @mock.patch('sync.sync.pipedrive.PipedriveClient.get_organization_marketoid_filter')
+    @mock.patch('sync.pipedrive.PipedriveClient.get_organization_marketoid_filter')
     def test_update_person_in_pipedrive_no_change(self, mock_get_filter, mock_mkto_get_token, mock_put, mock_post, mock_get):
         setup_get_filter_mock(mock_get_filter, 3)
 
@@ -561,7 +573,7 @@ class SyncTestCase(unittest.TestCase):
         self.assertIsNone(synced_opportunity.fiscalYear)  # Not closed -> no close date
 
         # Role has been created
-        synced_role = saved_instances['role' + str(rv['role']['id'])]
+        synced_role = saved_instances['role' + str(rv['roles'][0]['id'])]
         self.assertIsNotNone(synced_role.id)
 
         # Test values
@@ -0,0 +1,98 @@
+# coding=UTF-8
+# Load the appropriate libraries on the Python path
+import os
+import sys
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'])
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'] + '/lib/yaml/lib')
+sys.path.insert(1, os.path.abspath('lib'))
+
+from .context import sync
+import sync.common.tracing
+import sync.gae_handler
+import sync.metrics
+from .stub_case import StubTestCase
+
+import json
+import mock
+import requests
+import unittest
+
+from google.appengine.ext import testbed
+
+
+class CallTracerTestCase(StubTestCase):
+    """
+    Check the calls traced by the clients.
+    """
+    use_testbed = True
+
+    def setUp(self):
+        super(CallTracerTestCase, self).setUp()
+        self.tracer = sync.common.tracing.CallTracer()
+        self.mkto = sync.marketo.MarketoClient(tracer=self.tracer, **self.backends.marketo_client_config())
+        self.pd = sync.pipedrive.PipedriveClient(tracer=self.tracer, **self.backends.pipedrive_client_config())
+
+    def test_summary(self):
+        sync.pipedrive.Person(self.pd, 10)
+        sync.pipedrive.Person(self.pd, 20)
+        sync.marketo.Lead(self.mkto, 10)
+        summary = self.tracer.summary()
+        self.assertEqual(summary['count'], sum(stats['count'] for stats in self.backends.calls().values()))
+        self.assertEqual(summary['endpoints']['GET /v1/persons/{id}']['count'], 2)
+        self.assertEqual(summary['endpoints']['GET /identity/oauth/token']['count'], 1)
+        self.assertEqual(summary['errors'], 0)
+        self.assertGreater(summary['bytes'], 0)
+
+    def test_errors_and_retries(self):
+        self.backends.pipedrive.inject_errors(1)
+        self.assertRaises(requests.HTTPError, sync.pipedrive.Person, self.pd, 10)
+        sync.marketo.Lead(self.mkto, 10)
+        self.backends.marketo.expire_tokens()
+        sync.marketo.Lead(self.mkto, 20)
+        summary = self.tracer.summary()
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['retries'], 1)
+        self.assertEqual(summary['endpoints']['POST /rest/v1/leads.json']['retries'], 1)
+
+    def test_task_response(self):
+        bed = testbed.Testbed()
+        bed.activate()
+        bed.init_datastore_v3_stub()
+        bed.init_memcache_stub()
+        sync.app.config['TRACE_CALLS'] = True
+        self.backends.reset_stats()
+        try:
+            with sync.gae_handler.gae_app.test_client() as c:
+                rv = c.post('/task/create_or_update_company_in_marketo', data={'id': 20},
+                            headers={'X-AppEngine-TaskName': 'task1'})
+        finally:
+            bed.deactivate()
+        data = json.loads(rv.data)
+        self.assertIn(data['status'], ('updated', 'skipped'))
+        self.assertEqual(data['calls']['count'], sum(stats['count'] for stats in self.backends.calls().values()))
+
+    def test_metrics(self):
+        self.backends.pipedrive.rate_limit = 1000
+        # Replace the Datadog integration which cannot be initialized here
+        gae_datadog = sys.modules['gae_datadog'] = mock.Mock()
+        try:
+            with sync.app.app_context():
+                sync.g.call_tracer = self.tracer
+                rv = sync.tasks.create_or_update_company_in_marketo(20)
+                sync.metrics.record_task('create_or_update_company_in_marketo', rv, 0.1, self.tracer)
+        finally:
+            del sys.modules['gae_datadog']
+        t_stats = gae_datadog.t_stats
+        t_stats.increment.assert_any_call('sync.task.runs', tags=['task:create_or_update_company_in_marketo',
+                                                                  'status:' + rv['status']])
+        t_stats.histogram.assert_any_call('sync.task.duration', 0.1, tags=['task:create_or_update_company_in_marketo'])
+        quota_calls = [c for c in t_stats.increment.call_args_list if c[0][0] == 'sync.marketo.quota.calls']
+        self.assertEqual(quota_calls[0][0][1], len([trace for trace in self.tracer.calls if trace.backend == 'marketo'
+                                                    and trace.endpoint.startswith('/rest/')]))
+        t_stats.gauge.assert_any_call('sync.pipedrive.ratelimit.remaining', mock.ANY)
+        cache_misses = [c for c in t_stats.increment.call_args_list if c[0][0] == 'sync.cache.misses']
+        self.assertTrue(cache_misses)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# coding=UTF-8
+# Load the appropriate libraries on the Python path
+import os
+import sys
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'])
+sys.path.insert(1, os.environ['GOOGLE_APP_ENGINE'] + '/lib/yaml/lib')
+sys.path.insert(1, os.path.abspath('lib'))
+
+from .context import sync
+import sync.common.ratelimit
+import sync.gae_handler
+from .stub_case import StubTestCase
+
+import json
+import mock
+import unittest
+
+
+class WebhookFilterTestCase(StubTestCase):
+    """
+    Check the webhooks that would not change anything are not enqueued.
+    """
+    use_testbed = True
+
+    def setUp(self):
+        super(WebhookFilterTestCase, self).setUp()
+        self.update_webhook_filters()
+
+    def update_webhook_filters(self):
+        with sync.app.app_context():
+            sync.tasks.update_webhook_filters()
+        sync.views._webhook_filters.clear()
+        self.backends.reset_stats()
+
+    def post_webhook(self, path, params):
+        with sync.app.test_client() as c:
+            rv = c.post(path + '?api_key=' + sync.app.config['FLASK_AUTHORIZED_KEYS']['test'],
+                        data=json.dumps(params), content_type='application/json')
+        return json.loads(rv.data)
+
+    def test_deal_filtered(self):
+        data = self.post_webhook('/pipedrive/deal', {'current': {'id': 20, 'pipeline_id': 12}})
+        self.assertEqual(data['status'], 'skipped')
+        self.assertEqual(self.taskqueue_stub.get_filtered_tasks(), [])
+
+        with mock.patch.object(sync.mappings, 'PIPELINE_FILTER_NAMES', ['Fake Pipeline']):
+            self.update_webhook_filters()
+        self.post_webhook('/pipedrive/deal', {'current': {'id': 20, 'pipeline_id': 12}})
+        self.post_webhook('/pipedrive/deal', {'current': {'id': 30}})  # Pipeline unknown, left to the task
+        self.assertEqual(len(self.taskqueue_stub.get_filtered_tasks()), 2)
+        self.assertEqual(self.backends.calls(), {})  # No API call from the frontend
+
+    def test_filters_not_computed(self):
+        sync.util.WebhookFilter.put_values(dict.fromkeys(['skipped_pipeline_ids', 'person_source_field_keys']))
+        sync.views._webhook_filters.clear()
+        self.post_webhook('/pipedrive/deal', {'current': {'id': 20, 'pipeline_id': 12}})
+        person = self.backends.pipedrive.store['person'][20]
+        self.post_webhook('/pipedrive/person', {'current': dict(person, update_time='2017-01-01 00:00:00'),
+                                                'previous': person})
+        self.assertEqual(len(self.taskqueue_stub.get_filtered_tasks()), 2)  # Left to the tasks
+
+    def test_person_filtered(self):
+        person = self.backends.pipedrive.store['person'][20]
+        data = self.post_webhook('/pipedrive/person', {'current': dict(person, update_time='2017-01-01 00:00:00'),
+                                                       'previous': person})
+        self.assertEqual(data['status'], 'skipped')
+        data = self.post_webhook('/pipedrive/person', {'current': dict(person, owner_id=1628545), 'previous': person})
+        self.assertNotIn('status', data)  # Owner is synchronized
+        self.post_webhook('/pipedrive/person', {'current': self.backends.pipedrive.store['person'][10],
+                                                'previous': None})  # Person added
+        self.assertEqual(len(self.taskqueue_stub.get_filtered_tasks()), 2)
+        self.assertEqual(self.backends.calls(), {})
+
+    def test_person_deleted(self):
+        person = self.backends.pipedrive.store['person'][20]
+        data = self.post_webhook('/pipedrive/person', {'current': dict(person, active_flag=False),
+                                                       'previous': dict(person, active_flag=True)})
+        self.assertNotIn('status', data)  # Deletion is synchronized
+        self.assertEqual(len(self.taskqueue_stub.get_filtered_tasks()), 1)
+
+    def test_organization_filtered(self):
+        organization = self.backends.pipedrive.store['organization'][20]
+        data = self.post_webhook('/pipedrive/organization', {'current': dict(organization, people_count=3),
+                                                             'previous': organization})
+        self.assertEqual(data['status'], 'skipped')
+        self.post_webhook('/pipedrive/organization', {'current': dict(organization, name='Renamed'),
+                                                      'previous': organization})
+        self.assertEqual(len(self.taskqueue_stub.get_filtered_tasks()), 1)
+
+    def test_task_queues(self):
+        self.post_webhook('/marketo/lead/10', {})
+        self.post_webhook('/marketo/lead/10/activity', {'type': 'email_sent'})
+        self.post_webhook('/pipedrive/organization/20/compute', {})
+        self.assertEqual([task.url for task in self.taskqueue_stub.get_filtered_tasks(queue_names='realtime')],
+                         ['/task/create_or_update_person_in_pipedrive'])
+        self.assertEqual([task.url for task in self.taskqueue_stub.get_filtered_tasks(queue_names='bulk')],
+                         ['/task/create_activity_in_pipedrive_for_email_sent',
+                          '/task/compute_organization_in_pipedrive'])
+
+        # Bulk tasks leave a share of the rate limits to the realtime ones
+        with mock.patch.dict(sync.app.config, PD_RATE_LIMIT=40, PD_RATE_WINDOW=2), \
+                sync.gae_handler.gae_app.test_request_context():
+            sync.gae_handler.g.low_priority = True
+            client = sync.create_pipedrive_client()
+            self.assertIsInstance(client._session.get_adapter(client._api_endpoint).rate_limiter,
+                                  sync.common.ratelimit.LowPriorityRateLimiter)
+
+
+if __name__ == '__main__':
+    unittest.main()